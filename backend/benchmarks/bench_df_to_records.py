@@ -0,0 +1,88 @@
+"""
+Microbenchmark: row-by-row `_df_to_records` (previous implementation) vs. the
+column-wise `serialize.df_to_records`. Also checks both produce identical JSON.
+
+Usage (from backend/):
+    python benchmarks/bench_df_to_records.py [--rows 50 1000 100000]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from serialize import df_to_records  # noqa: E402
+
+
+def _legacy_df_to_records(df: pd.DataFrame) -> list[dict]:
+    records = []
+    for row in df.to_dict(orient="records"):
+        clean = {}
+        for k, v in row.items():
+            if isinstance(v, pd.Timestamp):
+                clean[k] = None if pd.isna(v) else v.isoformat()
+            elif isinstance(v, float) and pd.isna(v):
+                clean[k] = None
+            elif not isinstance(v, (list, dict)) and pd.isna(v):
+                clean[k] = None
+            elif hasattr(v, "item"):
+                clean[k] = v.item()
+            else:
+                clean[k] = v
+        records.append(clean)
+    return records
+
+
+def _make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    floats = rng.normal(size=rows)
+    floats[rng.random(rows) < 0.1] = np.nan
+    dates = pd.Series(pd.date_range("2000-01-01", periods=rows, freq="D"))
+    dates[rng.random(rows) < 0.05] = pd.NaT
+    text = pd.Series(rng.choice(["臺北", "高雄", "台中", None], size=rows))
+    mixed = pd.Series([None if i % 7 == 0 else (i if i % 2 else f"v{i}") for i in range(rows)],
+                      dtype=object)
+    return pd.DataFrame({
+        "date": dates,
+        "stamp": pd.Series(pd.date_range("2000-01-01", periods=rows, freq="1500ms")),
+        "int": rng.integers(0, 1000, size=rows),
+        "float": floats,
+        "bool": rng.random(rows) < 0.5,
+        "text": text,
+        "mixed": mixed,
+        "nullable": pd.array([None if i % 5 == 0 else i for i in range(rows)], dtype="Int64"),
+        "category": pd.Categorical(rng.choice(["a", "b", "c"], size=rows)),
+    })
+
+
+def _timed(fn, df: pd.DataFrame, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(df)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[50, 1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'legacy ms':>10} {'columnar ms':>12} {'speedup':>8}  same JSON")
+    for rows in args.rows:
+        df = _make_frame(rows)
+        same = (json.dumps(_legacy_df_to_records(df), ensure_ascii=False)
+                == json.dumps(df_to_records(df), ensure_ascii=False))
+        legacy = _timed(_legacy_df_to_records, df, args.repeat)
+        columnar = _timed(df_to_records, df, args.repeat)
+        print(f"{rows:>8} {legacy * 1e3:>10.2f} {columnar * 1e3:>12.2f} {legacy / columnar:>7.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
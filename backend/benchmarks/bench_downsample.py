@@ -0,0 +1,95 @@
+"""
+Downsampling cost on 1M-point series: the NumPy LTTB / min-max in downsample.py
+against a straightforward pure-Python LTTB, plus the payload saved.
+
+Usage (from backend/):
+    python benchmarks/bench_downsample.py [--points 1000000] [--viewport 1280] [--repeat 5]
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+from downsample import (downsample_chart_config, downsample_dated, lttb_indices,  # noqa: E402
+                        minmax_indices, point_budget)
+
+
+def python_lttb(x: list[float], y: list[float], n_out: int) -> list[int]:
+    """Textbook LTTB, one point at a time (what a loop over the JSON would cost)."""
+    n = len(x)
+    every = (n - 2) / (n_out - 2)
+    selected, a = [0], 0
+    for i in range(n_out - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        cx = sum(x[avg_start:avg_end]) / span
+        cy = sum(y[avg_start:avg_end]) / span
+        best, best_j = -1.0, avg_start
+        for j in range(int(i * every) + 1, avg_start):
+            area = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a]))
+            if area > best:
+                best, best_j = area, j
+        selected.append(best_j)
+        a = best_j
+    selected.append(n - 1)
+    return selected
+
+
+def timed(fn, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--viewport", type=int, default=1280)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    n = args.points
+    budget = point_budget(args.viewport)
+    x = np.arange(n, dtype=np.float64) * 60_000 + 1.7e12  # one point per minute, epoch ms
+    y = np.cumsum(rng.normal(size=n)) + 10 * np.sin(np.arange(n) / 5000)
+    print(f"{n:,} points -> budget {budget} (viewport {args.viewport}px)")
+
+    t_lttb = timed(lambda: lttb_indices(x, y, budget), args.repeat)
+    t_minmax = timed(lambda: minmax_indices(y, budget), args.repeat)
+    xs, ys = x.tolist(), y.tolist()
+    t_py = timed(lambda: python_lttb(xs, ys, budget), 1)
+    same = np.array_equal(lttb_indices(x, y, budget), python_lttb(xs, ys, budget))
+    print(f"  numpy lttb      {t_lttb * 1000:8.1f} ms")
+    print(f"  numpy minmax    {t_minmax * 1000:8.1f} ms")
+    print(f"  python lttb     {t_py * 1000:8.1f} ms  (same selection: {same})")
+
+    # End to end on the shapes the endpoints handle
+    config = {"chart": {"type": "line"}, "xAxis": {"type": "datetime"},
+              "series": [{"name": "s", "data": np.column_stack([x, y]).tolist()}]}
+    t_cfg = timed(lambda: downsample_chart_config(config, budget), args.repeat)
+    reduced = downsample_chart_config(config, budget)
+    full_bytes = len(json.dumps(config))
+    small_bytes = len(json.dumps(reduced))
+    print(f"  chart config    {t_cfg * 1000:8.1f} ms  JSON {full_bytes / 1e6:.1f} MB -> "
+          f"{small_bytes / 1e3:.0f} KB")
+
+    dates = (np.datetime64("1900-01-01") + np.arange(min(n, 200_000))).astype(str)
+    points = [{"date": d, "value": v} for d, v in zip(dates.tolist(), ys)]
+    t_dated = timed(lambda: downsample_dated(points, budget), args.repeat)
+    print(f"  dated series    {t_dated * 1000:8.1f} ms  ({len(points):,} daily points)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: Excel ingestion, plain pd.read_excel vs ingest.read_excel.
+
+Two workbooks are generated: "tall" (many rows, few columns) and "wide" (few rows,
+many columns), each with a cover sheet in front of the data sheet, as exports often
+have. Like files saved by Excel they carry a <dimension> tag (openpyxl's write-only
+mode omits it, which makes read-only openpyxl scan the whole sheet to size it).
+
+For each workbook it times
+    legacy     pd.read_excel(path, sheet_name=...)  (openpyxl, full cell objects)
+    new        ingest.read_excel on the data sheet  (calamine when installed,
+               else openpyxl read-only values)
+    range      ingest.read_excel limited to a 1000-row x 4-column range
+    cached     load_session_df on a view that was already converted (Feather)
+
+Usage (from backend/):
+    python benchmarks/bench_excel.py [--tall-rows 100000] [--wide-rows 2000] [--wide-cols 300]
+"""
+import argparse
+import datetime
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import openpyxl
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ingest import EXCEL_ENGINE, column_letters, parse_cell_range, read_excel  # noqa: E402
+from session_data import df_cache, load_session_df  # noqa: E402
+
+REGIONS = ["北部", "中部", "南部", "東部", "離島"]
+
+
+def _make_workbook(path: Path, rows: int, cols: int) -> None:
+    tmp = path.with_suffix(".tmp.xlsx")
+    wb = openpyxl.Workbook(write_only=True)
+    cover = wb.create_sheet("封面")
+    cover.append(["月報"])
+    ws = wb.create_sheet("data")
+    ws.append(["日期", "地區"] + [f"指標{j}" for j in range(cols - 2)])
+    start = datetime.datetime(2000, 1, 1)
+    for i in range(rows):
+        ws.append([start + datetime.timedelta(hours=i), REGIONS[i % len(REGIONS)]]
+                  + [round((i * 37 + j * 11) % 1000 / 7, 3) for j in range(cols - 2)])
+    wb.save(tmp)
+
+    # Add the <dimension> tag Excel writes, so readers see the used range up front
+    ref = f"A1:{column_letters(cols)}{rows + 1}".encode()
+    with zipfile.ZipFile(tmp) as src, zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            if item.filename == "xl/worksheets/sheet2.xml":
+                data = data.replace(b"<sheetData>", b'<dimension ref="' + ref + b'"/><sheetData>', 1)
+            dst.writestr(item, data)
+    tmp.unlink()
+
+
+def _timed(fn) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tall-rows", type=int, default=100_000)
+    parser.add_argument("--wide-rows", type=int, default=2_000)
+    parser.add_argument("--wide-cols", type=int, default=300)
+    args = parser.parse_args()
+
+    print(f"ingest engine: {EXCEL_ENGINE}")
+    print(f"{'workbook':<8} {'shape':>12} {'size MB':>8} {'legacy s':>9} {'new s':>8} "
+          f"{'speedup':>8} {'range s':>8} {'cached s':>9}  same frame")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, rows, cols in (("tall", args.tall_rows, 6),
+                                 ("wide", args.wide_rows, args.wide_cols)):
+            path = Path(tmp) / f"{name}.xlsx"
+            _make_workbook(path, rows, cols)
+
+            legacy_s, legacy = _timed(lambda: pd.read_excel(path, sheet_name="data"))
+            new_s, new = _timed(lambda: read_excel(path, "data"))
+            range_s, _ = _timed(lambda: read_excel(path, "data", parse_cell_range("A1:D1001")))
+
+            # A converted view: first load parses and writes Feather, later loads read it
+            view = Path(tmp) / f"{name}-view"
+            view.mkdir()
+            load_session_df(view, path, lambda p: read_excel(p, "data"))
+            df_cache.pop(str(view))  # measure the Feather file, not the in-memory LRU
+            cached_s, _ = _timed(lambda: load_session_df(view, path, lambda p: read_excel(p, "data")))
+
+            same = legacy.shape == new.shape and legacy.equals(new)
+            print(f"{name:<8} {f'{rows}x{cols}':>12} {path.stat().st_size / 1e6:>8.1f} "
+                  f"{legacy_s:>9.2f} {new_s:>8.2f} {legacy_s / new_s:>7.1f}x "
+                  f"{range_s:>8.2f} {cached_s:>9.3f}  {same}")
+
+
+if __name__ == "__main__":
+    main()
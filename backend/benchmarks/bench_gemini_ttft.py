@@ -0,0 +1,167 @@
+"""
+Time-to-first-token of the v2 Gemini stream: a fresh httpx.AsyncClient per call
+(the previous _call_gemini_stream) vs the shared pooled client in http_clients.
+
+By default a TLS mock Gemini (benchmarks/mock_upstreams.py gemini, self-signed
+certificate made with the openssl CLI) is started on a free port, so every cold
+call pays a real TCP + TLS handshake. Loopback handshakes are cheap; --base-url
+points both variants at another host (e.g. the real API, with GEMINI_API_KEY set)
+to see the effect at real round-trip times.
+
+Reported per variant: time to response headers and to the first text chunk,
+sequential calls first, then --concurrency users at once.
+
+Usage (from backend/):
+    python benchmarks/bench_gemini_ttft.py [--calls 30] [--concurrency 10] [--latency-ms 300]
+    GEMINI_API_KEY=... python benchmarks/bench_gemini_ttft.py --base-url https://generativelanguage.googleapis.com
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _self_signed_cert(directory: Path) -> tuple[Path, Path]:
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run([
+        "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+        "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+        "-keyout", str(key), "-out", str(cert),
+    ], check=True, capture_output=True)
+    return cert, key
+
+
+def _start_mock(port: int, latency_ms: float, cert: Path, key: Path) -> subprocess.Popen:
+    proc = subprocess.Popen([
+        sys.executable, str(BACKEND / "benchmarks" / "mock_upstreams.py"), "gemini",
+        "--port", str(port), "--latency-ms", str(latency_ms), "--jitter-ms", "0",
+        "--ssl-certfile", str(cert), "--ssl-keyfile", str(key),
+    ])
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("mock Gemini API did not start")
+
+
+async def _timed_stream(client: httpx.AsyncClient, url: str, payload: dict) -> tuple[float, float]:
+    """(seconds to response headers, seconds to first text chunk or end of body)."""
+    start = time.perf_counter()
+    async with client.stream("POST", url, json=payload) as response:
+        headers_at = time.perf_counter() - start
+        async for line in response.aiter_lines():
+            if line.startswith("data: ") and '"text"' in line:
+                return headers_at, time.perf_counter() - start
+    return headers_at, time.perf_counter() - start
+
+
+async def _legacy(url: str, payload: dict) -> tuple[float, float]:
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        return await _timed_stream(client, url, payload)
+
+
+async def _pooled(url: str, payload: dict) -> tuple[float, float]:
+    from http_clients import http_clients
+    return await _timed_stream(http_clients.gemini, url, payload)
+
+
+async def _run(call, url: str, payload: dict, calls: int, concurrency: int) -> dict:
+    sequential = [await call(url, payload) for _ in range(calls)]
+    sem = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with sem:
+            return await call(url, payload)
+
+    concurrent = await asyncio.gather(*(limited() for _ in range(calls)))
+    return {"sequential": sequential, "concurrent": concurrent}
+
+
+def _pct(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def _report(label: str, samples: list[tuple[float, float]]) -> None:
+    headers = [h * 1000 for h, _ in samples]
+    first = [t * 1000 for _, t in samples]
+    print(f"  {label:<28} headers p50 {statistics.median(headers):7.1f} ms   "
+          f"first token p50 {statistics.median(first):7.1f} ms  p95 {_pct(first, 95):7.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--base-url", help="skip the mock and call this Gemini base URL")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    mock = None
+    try:
+        if args.base_url:
+            base = args.base_url.rstrip("/")
+        else:
+            cert, key = _self_signed_cert(Path(tmp.name))
+            os.environ["SSL_CERT_FILE"] = str(cert)  # trusted by both httpx variants
+            port = _free_port()
+            mock = _start_mock(port, args.latency_ms, cert, key)
+            base = f"https://127.0.0.1:{port}"
+        os.environ["GEMINI_API_BASE"] = base
+
+        from config import GEMINI_MODEL
+        from http_clients import HTTP2_AVAILABLE, http_clients
+
+        api_key = os.getenv("GEMINI_API_KEY", "bench")
+        url = f"{base}/v1beta/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse&key={api_key}"
+        payload = {"contents": [{"role": "user", "parts": [{"text": "畫一張折線圖"}]}],
+                   "generationConfig": {"responseMimeType": "text/plain"}}
+
+        async def run_all() -> dict:
+            results = {"new client per call": await _run(_legacy, url, payload,
+                                                         args.calls, args.concurrency)}
+            await http_clients.warm()
+            results["shared pooled client"] = await _run(_pooled, url, payload,
+                                                         args.calls, args.concurrency)
+            await http_clients.aclose()
+            return results
+
+        results = asyncio.run(run_all())
+        print(f"{base}  calls={args.calls} concurrency={args.concurrency} "
+              f"http2={'available' if HTTP2_AVAILABLE else 'not installed'}")
+        for mode in ("sequential", "concurrent"):
+            print(mode)
+            for label, runs in results.items():
+                _report(label, runs[mode])
+        print(json.dumps(http_clients.stats()["upstreams"]["gemini"]))
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Load test for /api/load-database-data against a local mock Biz API.
+
+Starts benchmarks/mock_upstreams.py (biz) on a free port, then drives the real
+FastAPI app in-process, comparing sequential fetching (BIZ_MAX_CONCURRENCY=1)
+with the configured concurrency (series cache bypassed for both), and finally a
+warm series cache.
+
+Usage (from backend/):
+    python benchmarks/bench_load_database.py [--series 15] [--requests 10] [--fail-rate 0.1]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_mock(port: int, args) -> subprocess.Popen:
+    proc = subprocess.Popen([
+        sys.executable, str(BACKEND / "benchmarks" / "mock_upstreams.py"), "biz",
+        "--port", str(port), "--latency-ms", str(args.latency_ms),
+        "--fail-rate", str(args.fail_rate),
+    ])
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("mock Biz API did not start")
+
+
+async def _drive(app, stat_ids: list[str], requests: int, concurrency: int) -> tuple[list[float], int]:
+    transport = httpx.ASGITransport(app=app)
+    latencies, loaded = [], 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=120) as client:
+        async def one() -> None:
+            nonlocal loaded
+            start = time.perf_counter()
+            resp = await client.post("/api/load-database-data", json={"stat_ids": stat_ids})
+            latencies.append(time.perf_counter() - start)
+            resp.raise_for_status()
+            ids = [ts["id"] for ts in resp.json()["time_series"]]
+            assert ids == [i for i in stat_ids if i in ids], "results out of request order"
+            loaded += len(ids)
+
+        sem = asyncio.Semaphore(concurrency)
+
+        async def bounded() -> None:
+            async with sem:
+                await one()
+
+        await asyncio.gather(*(bounded() for _ in range(requests)))
+    return latencies, loaded
+
+
+def _report(label: str, latencies: list[float], loaded: int, expected: int) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<22} p50 {statistics.median(latencies):6.2f} s   p95 {p95:6.2f} s   "
+          f"max {ordered[-1]:6.2f} s   series loaded {loaded}/{expected}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series", type=int, default=15)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=2, help="concurrent client requests")
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--fail-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    port = _free_port()
+    os.environ["BIZ_API_URL"] = f"http://127.0.0.1:{port}/series"
+    os.environ["BIZ_API_KEY"] = "bench"
+    mock = _start_mock(port, args)
+    try:
+        import main as backend
+
+        from series_cache import SeriesCache
+
+        stat_ids = [str(1000 + i) for i in range(args.series)]
+        expected = args.series * args.requests
+        configured = backend.BIZ_MAX_CONCURRENCY
+        cache_settings = (backend.SERIES_CACHE_TTL, backend.SERIES_CACHE_MAX_STALE, backend.BIZ_DELTA_PARAM)
+        tmp = tempfile.TemporaryDirectory()
+        backend.series_cache = SeriesCache(Path(tmp.name) / "series.sqlite3", backend.SERIES_CACHE_MAX_ROWS,
+                                           backend.SERIES_CACHE_MAX_BYTES)
+
+        async def run_all() -> None:
+            # One event loop for all runs: the backend's shared upstream clients are bound to it
+            # Every lookup is treated as expired and refetched in full: pure fan-out cost
+            backend.SERIES_CACHE_TTL = backend.SERIES_CACHE_MAX_STALE = -1
+            backend.BIZ_DELTA_PARAM = None
+            for label, limit in (("sequential (limit 1)", 1),
+                                 (f"concurrent (limit {configured})", configured)):
+                backend.BIZ_MAX_CONCURRENCY = limit
+                latencies, loaded = await _drive(backend.app, stat_ids, args.requests, args.concurrency)
+                _report(label, latencies, loaded, expected)
+
+            backend.SERIES_CACHE_TTL, backend.SERIES_CACHE_MAX_STALE, backend.BIZ_DELTA_PARAM = cache_settings
+            latencies, loaded = await _drive(backend.app, stat_ids, args.requests, args.concurrency)
+            _report("warm series cache", latencies, loaded, expected)
+            print(backend.series_cache.stats())
+
+        asyncio.run(run_all())
+        backend.series_cache.close()
+        tmp.cleanup()
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: sandbox latency, cold `python -c` spawn vs. pre-warmed worker pool.
+
+The job is a typical small generated script (import pandas, build a frame, print
+JSON), so the numbers are dominated by interpreter start-up and `import pandas`.
+
+Usage (from backend/):
+    python benchmarks/bench_sandbox.py [--runs 20] [--pool-size 2]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from sandbox import SandboxPool, run_cold  # noqa: E402
+
+JOB = """
+import json
+import pandas as pd
+df = pd.DataFrame({"x": range(100), "y": [i * 2 for i in range(100)]})
+result = {"series": [{"data": df[["x", "y"]].values.tolist()}]}
+print(json.dumps(result))
+"""
+
+
+def _measure(fn, runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        stdout, stderr = fn(JOB, 30)
+        samples.append(time.perf_counter() - start)
+        assert stdout.startswith("{"), stderr
+    return samples
+
+
+def _report(label: str, samples: list[float]) -> None:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<8} mean {statistics.mean(samples) * 1e3:8.1f} ms   "
+          f"p50 {statistics.median(samples) * 1e3:8.1f} ms   p95 {p95 * 1e3:8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    _report("cold", _measure(run_cold, args.runs))
+
+    pool = SandboxPool(args.pool_size, max_jobs=1000)
+    pool.start()
+    deadline = time.monotonic() + 60
+    while pool.stats()["idle"] < args.pool_size and time.monotonic() < deadline:
+        time.sleep(0.05)
+    try:
+        _report("pooled", _measure(pool.run, args.runs))
+    finally:
+        print(pool.stats())
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+/api/load-database-data response size and server time per Accept format.
+
+Fills a temporary series cache with --series daily histories of --points points,
+so the endpoint answers from the cache without any upstream, then requests the
+same ids in every supported format through the real app (downsampling off).
+"encode" is the serialization alone; the rest of a request (cache reads, model
+building) is the same for every format.
+
+Usage (from backend/):
+    python benchmarks/bench_series_formats.py [--series 15] [--points 20000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series", type=int, default=15)
+    parser.add_argument("--points", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Never contacted: every series is served fresh from the cache
+    os.environ.setdefault("BIZ_API_URL", "http://127.0.0.1:9/series")
+    os.environ.setdefault("BIZ_API_KEY", "bench")
+    import main as backend
+    import series_formats
+    from series_cache import SeriesCache
+
+    tmp = tempfile.TemporaryDirectory()
+    backend.series_cache = SeriesCache(Path(tmp.name) / "series.sqlite3", backend.SERIES_CACHE_MAX_ROWS,
+                                       backend.SERIES_CACHE_MAX_BYTES)
+    rng = np.random.default_rng(7)
+    dates = (np.datetime64("1960-01-01") + np.arange(args.points)).astype(str).tolist()
+    stat_ids = [str(5000 + i) for i in range(args.series)]
+    for stat_id in stat_ids:
+        values = np.round(np.cumsum(rng.normal(size=args.points)) + 100, 4).tolist()
+        backend.series_cache.put(stat_id, [{"date": d, "value": v} for d, v in zip(dates, values)])
+
+    formats = [series_formats.JSON, series_formats.COLUMNAR_JSON, series_formats.ARROW_STREAM]
+    if series_formats.msgpack is not None:
+        formats.append(series_formats.MSGPACK)
+
+    series = [backend.TimeSeriesData(id=stat_id, name_tc=stat_id, name_en=stat_id,
+                                     data=backend.series_cache.get(stat_id).points)
+              for stat_id in stat_ids]
+
+    def encode(media_type: str) -> bytes:
+        if media_type == series_formats.JSON:
+            return backend.DatabaseLoadResponse(time_series=series).model_dump_json().encode()
+        return series_formats.encode(media_type, series)
+
+    async def run() -> None:
+        transport = httpx.ASGITransport(app=backend.app)
+        body = {"stat_ids": stat_ids, "downsample": "none"}
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=120) as client:
+            print(f"{args.series} series x {args.points:,} points")
+            for media_type in formats:
+                times, size = [], 0
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    resp = await client.post("/api/load-database-data", json=body,
+                                             headers={"Accept": media_type})
+                    times.append(time.perf_counter() - start)
+                    resp.raise_for_status()
+                    size = len(resp.content)
+                encode_times = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    encode(media_type)
+                    encode_times.append(time.perf_counter() - start)
+                print(f"  {media_type:<44} request {statistics.median(times) * 1000:7.1f} ms  "
+                      f"encode {statistics.median(encode_times) * 1000:7.1f} ms  "
+                      f"{size / 1e6:7.2f} MB")
+
+    asyncio.run(run())
+    backend.series_cache.close()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark: throughput of the v2 endpoints with 1, 2 and 4 uvicorn workers.
+
+Runs loadtest.py once per worker count (same mocks, same options) with the chosen
+SESSION_BACKEND, and prints requests per second per scenario side by side. All
+workers share one session store root, so the generate scenario (one session
+created by whichever worker took the upload, then served by all of them) also
+checks that sessions are consistent across processes: any failure shows up in
+the ok/total column.
+
+Usage (from backend/):
+    python benchmarks/bench_workers.py [--workers 1,2,4] [--backend sqlite]
+        [--scenarios upload,generate] [--requests 200] [--concurrency 20] [--rows 20000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parents[1]
+LOADTEST = BACKEND / "benchmarks" / "loadtest.py"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--backend", choices=("files", "sqlite"), default="sqlite")
+    parser.add_argument("--scenarios", default="upload,generate")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=20_000, help="rows per uploaded CSV")
+    parser.add_argument("--gemini-latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    counts = [int(n) for n in args.workers.split(",")]
+    env = {**os.environ, "SESSION_BACKEND": args.backend}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in counts:
+            out = Path(tmp) / f"{n}.json"
+            subprocess.run([sys.executable, str(LOADTEST), "--workers", str(n),
+                            "--scenarios", args.scenarios, "--requests", str(args.requests),
+                            "--concurrency", str(args.concurrency), "--rows", str(args.rows),
+                            "--gemini-latency-ms", str(args.gemini_latency_ms),
+                            "--out", str(out)], cwd=BACKEND, env=env, check=True)
+            results[n] = json.loads(out.read_text())
+
+    print(f"\nSESSION_BACKEND={args.backend}, {os.cpu_count()} CPU(s), "
+          f"{args.requests} requests per scenario, concurrency {args.concurrency}")
+    print(f"{'scenario':<10} {'workers':>7} {'ok/total':>10} {'req/s':>8} {'vs 1':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8}")
+    for name in args.scenarios.split(","):
+        base = results[counts[0]][name]["throughput"]
+        for n in counts:
+            r = results[n][name]
+            print(f"{name:<10} {n:>7} {r['requests'] - r['failures']:>5}/{r['requests']:<4} "
+                  f"{r['throughput']:8.1f} {r['throughput'] / base:5.2f}x "
+                  f"{r['p50'] * 1000:8.1f} {r['p95'] * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+End-to-end load test of the backend against local upstream stand-ins (offline).
+
+Starts the three mocks from benchmarks/mock_upstreams.py (Gemini, Solr, Biz) and
+the real app under uvicorn on free ports, all with TMPDIR pointed at a scratch
+directory, then drives each scenario with --concurrency clients:
+
+    upload    POST /api/v2/upload       a --rows CSV, different content every request
+    generate  POST /api/v2/generate     full SSE stream until `done` (one shared session;
+                                        the mock varies its code so the sandbox always runs)
+    search    POST /api/search-database queries drawn from --distinct-queries
+    load      POST /api/load-database-data  --series ids drawn from a pool of 100
+
+and reports throughput and p50/p95/p99 latency per scenario (plus the server's own
+median stage timings for generate). --out saves the results as JSON; --baseline
+compares against such a file and exits 1 when a p95 or the throughput is worse by
+more than --tolerance, so it can gate a deploy.
+
+Usage (from backend/):
+    python benchmarks/loadtest.py [--requests 200] [--concurrency 20] [--workers 1]
+    python benchmarks/loadtest.py --scenarios search,load --out before.json
+    python benchmarks/loadtest.py --scenarios search,load --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND = Path(__file__).resolve().parents[1]
+MOCKS = BACKEND / "benchmarks" / "mock_upstreams.py"
+SCENARIOS = ("upload", "generate", "search", "load")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, proc: subprocess.Popen, name: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{name} exited with {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{name} did not start within {timeout:.0f}s")
+
+
+def _percentile(ordered: list[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return float("nan")
+    rank = max(1, min(len(ordered), round(p / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def _csv(rows: int, salt: int) -> bytes:
+    lines = ["date,region,value"]
+    for i in range(rows):
+        lines.append(f"2020-{i % 12 + 1:02d}-01,R{i % 5},{(i * 37 + salt) % 1000 / 10}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _sse_events(text: str) -> list[tuple[str, dict]]:
+    events, name = [], None
+    for line in text.splitlines():
+        if line.startswith("event: "):
+            name = line[7:]
+        elif line.startswith("data: ") and name:
+            events.append((name, json.loads(line[6:])))
+            name = None
+    return events
+
+
+class Scenario:
+    def __init__(self, name: str, client: httpx.AsyncClient, args):
+        self.name = name
+        self.client = client
+        self.args = args
+        self.counter = 0
+        self.session_id: str | None = None
+        self.stage_samples: dict[str, list[float]] = {}
+
+    async def setup(self) -> None:
+        if self.name == "generate":
+            resp = await self.client.post("/api/v2/upload",
+                                          files={"file": ("bench.csv", _csv(self.args.rows, -1))})
+            resp.raise_for_status()
+            self.session_id = resp.json()["session_id"]
+
+    async def request(self) -> bool:
+        """One request; True if it succeeded."""
+        self.counter += 1
+        n = self.counter
+        if self.name == "upload":
+            resp = await self.client.post("/api/v2/upload",
+                                          files={"file": (f"bench{n}.csv", _csv(self.args.rows, n))})
+            return resp.status_code == 200
+        if self.name == "generate":
+            resp = await self.client.post("/api/v2/generate", json={
+                "session_id": self.session_id, "prompt": f"折線圖 {n}", "chart_type": "line"})
+            events = _sse_events(resp.text)
+            for name, data in events:
+                if name == "timings":
+                    for stage, ms in data.get("stages_ms", {}).items():
+                        self.stage_samples.setdefault(stage, []).append(ms)
+            return resp.status_code == 200 and any(name == "done" for name, _ in events)
+        if self.name == "search":
+            query = f"gdp {random.randrange(self.args.distinct_queries)}"
+            resp = await self.client.post("/api/search-database", json={"query": query})
+            return resp.status_code == 200
+        stat_ids = [str(1000 + i) for i in random.sample(range(100), self.args.series)]
+        resp = await self.client.post("/api/load-database-data", json={"stat_ids": stat_ids})
+        return resp.status_code == 200 and len(resp.json()["time_series"]) == len(stat_ids)
+
+
+async def run_scenario(scenario: Scenario, requests: int, concurrency: int, warmup: int) -> dict:
+    await scenario.setup()
+    for _ in range(warmup):
+        await scenario.request()
+    scenario.stage_samples.clear()
+
+    latencies, failures = [], 0
+    remaining = requests
+
+    async def worker() -> None:
+        nonlocal remaining, failures
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                ok = await scenario.request()
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            failures += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    result = {
+        "requests": len(latencies),
+        "failures": failures,
+        "throughput": (len(latencies) - failures) / wall,
+        "p50": _percentile(ordered, 50),
+        "p95": _percentile(ordered, 95),
+        "p99": _percentile(ordered, 99),
+        "max": ordered[-1],
+    }
+    if scenario.stage_samples:
+        result["server_stages_ms"] = {stage: statistics.median(samples)
+                                      for stage, samples in scenario.stage_samples.items()}
+    return result
+
+
+def _print_results(results: dict) -> None:
+    print(f"{'scenario':<10} {'ok/total':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}")
+    for name, r in results.items():
+        ok_total = f"{r['requests'] - r['failures']}/{r['requests']}"
+        print(f"{name:<10} {ok_total:>10} {r['throughput']:8.1f} "
+              f"{r['p50'] * 1000:8.1f} {r['p95'] * 1000:8.1f} {r['p99'] * 1000:8.1f} "
+              f"{r['max'] * 1000:8.1f}")
+        if "server_stages_ms" in r:
+            stages = ", ".join(f"{k} {v:.1f}" for k, v in r["server_stages_ms"].items())
+            print(f"{'':<10} server median ms: {stages}")
+
+
+def _compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if r["p95"] > base["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95'] * 1000:.1f} -> {r['p95'] * 1000:.1f} ms")
+        if r["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput']:.1f} -> "
+                               f"{r['throughput']:.1f} req/s")
+        if r["failures"] > base["failures"]:
+            regressions.append(f"{name}: failures {base['failures']} -> {r['failures']}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--rows", type=int, default=2000, help="rows per uploaded CSV")
+    parser.add_argument("--series", type=int, default=5, help="stat_ids per load request")
+    parser.add_argument("--distinct-queries", type=int, default=50)
+    parser.add_argument("--gemini-latency-ms", type=float, default=300.0)
+    parser.add_argument("--gemini-chunk-interval-ms", type=float, default=10.0)
+    parser.add_argument("--solr-latency-ms", type=float, default=80.0)
+    parser.add_argument("--biz-latency-ms", type=float, default=150.0)
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier --out to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    scratch = tempfile.TemporaryDirectory()
+    env = {**os.environ, "TMPDIR": scratch.name, "PYTHONUNBUFFERED": "1"}
+    ports = {name: _free_port() for name in ("gemini", "solr", "biz", "app")}
+    mock_args = {
+        "gemini": ["--latency-ms", str(args.gemini_latency_ms),
+                   "--chunk-interval-ms", str(args.gemini_chunk_interval_ms), "--vary-code"],
+        "solr": ["--latency-ms", str(args.solr_latency_ms)],
+        "biz": ["--latency-ms", str(args.biz_latency_ms)],
+    }
+    procs: list[subprocess.Popen] = []
+    try:
+        for name, extra in mock_args.items():
+            proc = subprocess.Popen([sys.executable, str(MOCKS), name,
+                                     "--port", str(ports[name]), *extra], env=env)
+            procs.append(proc)
+            _wait_for_port(ports[name], proc, f"mock {name}")
+
+        app_env = {
+            **env,
+            "GEMINI_API_BASE": f"http://127.0.0.1:{ports['gemini']}",
+            "GEMINI_API_KEY": "loadtest",
+            "SOLR_API_URL": f"http://127.0.0.1:{ports['solr']}/solr/select",
+            "BIZ_API_URL": f"http://127.0.0.1:{ports['biz']}/series",
+            "BIZ_API_KEY": "loadtest",
+        }
+        app = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app",
+                                "--port", str(ports["app"]), "--workers", str(args.workers),
+                                "--log-level", "warning"], cwd=BACKEND, env=app_env)
+        procs.append(app)
+        _wait_for_port(ports["app"], app, "backend", timeout=60)
+
+        async def run_all() -> dict:
+            limits = httpx.Limits(max_connections=args.concurrency,
+                                  max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{ports['app']}",
+                                         timeout=300, limits=limits) as client:
+                results = {}
+                for name in scenarios:
+                    results[name] = await run_scenario(Scenario(name, client, args), args.requests,
+                                                       args.concurrency, args.warmup)
+                return results
+
+        print(f"{args.requests} requests per scenario, concurrency {args.concurrency}, "
+              f"{args.workers} worker(s)")
+        results = asyncio.run(run_all())
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        scratch.cleanup()
+
+    _print_results(results)
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        regressions = _compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
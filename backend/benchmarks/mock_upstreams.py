@@ -0,0 +1,216 @@
+"""
+Local stand-ins for the upstream services, for offline benchmarks and load tests.
+
+    biz     GET /series/{stat_id}?history=true[&start_date=YYYY-MM-DD]
+            -> {"series": [{"date", "val"}, ...]}
+    gemini  POST /v1beta/models/{model}:streamGenerateContent?alt=sse
+            POST /v1beta/models/{model}:generateContent
+            -> Gemini-shaped SSE chunks / JSON answering with a ```python block
+    solr    GET /solr/select?q=...
+            -> {"response": {"docs": [...]}} with `rows` public series per query
+
+Usage (from backend/):
+    python benchmarks/mock_upstreams.py biz --port 9101 --latency-ms 150 --fail-rate 0.1
+    BIZ_API_URL=http://127.0.0.1:9101/series BIZ_API_KEY=test uvicorn main:app
+
+    python benchmarks/mock_upstreams.py gemini --port 9102 --latency-ms 400
+    GEMINI_API_BASE=http://127.0.0.1:9102 GEMINI_API_KEY=test uvicorn main:app
+
+    python benchmarks/mock_upstreams.py solr --port 9103 --latency-ms 80
+    SOLR_API_URL=http://127.0.0.1:9103/solr/select uvicorn main:app
+
+The canned Gemini answer (--answer-file to replace it) may contain __REQUEST__,
+which is replaced by a per-request counter with --vary-code (so every call gets
+code the backend has not memoized) and by "0" otherwise. --quota-concurrency N
+answers a 429 with `Retry-After: --retry-after` to calls beyond N in flight, like
+an exhausted Gemini quota.
+
+--ssl-certfile/--ssl-keyfile serve over TLS, so connection reuse is measured
+with a real handshake (point SSL_CERT_FILE at the certificate on the client).
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import random
+
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MOCK_GEMINI_ANSWER = """下面的代碼把資料轉成折線圖。
+
+```python
+import json
+config = {
+    "chart": {"type": "line"},
+    "title": {"text": "Mock chart __REQUEST__"},
+    "xAxis": {"type": "datetime"},
+    "series": [{"name": "value", "data": [[1704067200000, 1.0], [1706745600000, 2.0]]}],
+}
+print(json.dumps(config))
+```
+"""
+
+
+def create_biz_app(latency_ms: float = 100.0, jitter_ms: float = 50.0, fail_rate: float = 0.0,
+                   points: int = 600) -> FastAPI:
+    """Biz API mock: monthly series of `points` values, optional latency and 503s."""
+    app = FastAPI(title="Mock Biz API")
+    app.state.requests = 0
+
+    @app.get("/series/{stat_id}")
+    async def series(stat_id: str, history: str = "true", start_date: str | None = None,
+                     x_api_key: str | None = Header(None)):
+        app.state.requests += 1
+        if not x_api_key:
+            raise HTTPException(status_code=401, detail="missing X-Api-Key")
+        await asyncio.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+        if random.random() < fail_rate:
+            raise HTTPException(status_code=503, detail="injected failure")
+
+        seed = sum(map(ord, stat_id))
+        start = datetime.date(2026, 1, 1)
+        data = []
+        for i in range(points):
+            month = start.month - 1 - (points - 1 - i)
+            date = datetime.date(start.year + month // 12, month % 12 + 1, 1)
+            data.append({"date": date.isoformat(),
+                         "val": round(100 + 10 * math.sin((i + seed) / 6) + i * 0.05, 4)})
+        if start_date:
+            data = [p for p in data if p["date"] >= start_date]
+        return {"series": data}
+
+    return app
+
+
+def create_gemini_app(latency_ms: float = 400.0, jitter_ms: float = 100.0,
+                      chunk_interval_ms: float = 20.0, chunk_chars: int = 40,
+                      answer: str = MOCK_GEMINI_ANSWER, vary_code: bool = False,
+                      quota_concurrency: int = 0, retry_after: float = 1.0) -> FastAPI:
+    """Gemini API mock: `latency_ms` until the first chunk (model think time), then
+    `answer` streamed in `chunk_chars` pieces every `chunk_interval_ms`. With
+    `quota_concurrency`, calls beyond that many in flight get a 429 with
+    `Retry-After: retry_after`."""
+    app = FastAPI(title="Mock Gemini API")
+    app.state.requests = 0
+    app.state.rate_limited = 0
+    app.state.in_flight = 0
+    template = answer
+
+    def _chunk(text: str) -> dict:
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+    async def _think() -> None:
+        await asyncio.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+
+    @app.post("/v1beta/models/{model_action}")
+    async def model_action(model_action: str, key: str | None = None):
+        app.state.requests += 1
+        if not key:
+            raise HTTPException(status_code=403, detail="missing key")
+        answer = template.replace("__REQUEST__", str(app.state.requests) if vary_code else "0")
+        _, _, action = model_action.partition(":")
+        if action not in ("generateContent", "streamGenerateContent"):
+            raise HTTPException(status_code=404, detail=f"unknown action {action!r}")
+        if quota_concurrency and app.state.in_flight >= quota_concurrency:
+            app.state.rate_limited += 1
+            return JSONResponse({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}},
+                                status_code=429, headers={"Retry-After": f"{retry_after:g}"})
+        app.state.in_flight += 1
+        if action == "generateContent":
+            try:
+                await _think()
+                return _chunk(answer)
+            finally:
+                app.state.in_flight -= 1
+
+        async def events():
+            try:
+                await _think()
+                for i in range(0, len(answer), chunk_chars):
+                    if i:
+                        await asyncio.sleep(chunk_interval_ms / 1000)
+                    yield f"data: {json.dumps(_chunk(answer[i:i + chunk_chars]), ensure_ascii=False)}\r\n\r\n"
+            finally:
+                app.state.in_flight -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def create_solr_app(latency_ms: float = 80.0, jitter_ms: float = 20.0, fail_rate: float = 0.0,
+                    rows: int = 20) -> FastAPI:
+    """Solr mock: `rows` deterministic documents per query (some not public)."""
+    app = FastAPI(title="Mock Solr")
+    app.state.requests = 0
+
+    @app.get("/solr/select")
+    async def select(q: str = ""):
+        app.state.requests += 1
+        await asyncio.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+        if random.random() < fail_rate:
+            raise HTTPException(status_code=503, detail="injected failure")
+        seed = sum(map(ord, q))
+        docs = []
+        for i in range(rows):
+            stat_id = 1000 + (seed * 31 + i) % 9000
+            docs.append({
+                "id": stat_id,
+                "name_tc": f"{q} 數據 {i}",
+                "name_en": f"{q} series {i}",
+                "country": "TW",
+                "min_date": "1990-01-01",
+                "max_date": "2026-01-01",
+                "frequency": "monthly",
+                "units": "index",
+                "currency": "TWD",
+                "score": round(10 - i * 0.3, 3),
+                "is_public": 0 if i % 7 == 6 else 1,
+            })
+        return {"response": {"numFound": len(docs), "docs": docs}}
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("service", choices=["biz", "gemini", "solr"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9101)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--points", type=int, default=600)
+    parser.add_argument("--chunk-interval-ms", type=float, default=20.0)
+    parser.add_argument("--chunk-chars", type=int, default=40)
+    parser.add_argument("--answer-file", help="canned Gemini answer (markdown with a python block)")
+    parser.add_argument("--vary-code", action="store_true")
+    parser.add_argument("--rows", type=int, default=20, help="solr documents per query")
+    parser.add_argument("--quota-concurrency", type=int, default=0,
+                        help="gemini: 429 beyond this many calls in flight (0 = no quota)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="gemini: Retry-After seconds")
+    parser.add_argument("--ssl-certfile")
+    parser.add_argument("--ssl-keyfile")
+    args = parser.parse_args()
+
+    if args.service == "biz":
+        app = create_biz_app(args.latency_ms, args.jitter_ms, args.fail_rate, args.points)
+    elif args.service == "solr":
+        app = create_solr_app(args.latency_ms, args.jitter_ms, args.fail_rate, args.rows)
+    else:
+        answer = MOCK_GEMINI_ANSWER
+        if args.answer_file:
+            with open(args.answer_file, encoding="utf-8") as f:
+                answer = f.read()
+        app = create_gemini_app(args.latency_ms, args.jitter_ms, args.chunk_interval_ms,
+                                args.chunk_chars, answer, args.vary_code,
+                                args.quota_concurrency, args.retry_after)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning",
+                ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_keyfile)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,101 @@
 # ── Backend configuration ─────────────────────────────────────────────────────
+import os
+import tempfile
+from pathlib import Path
 
 # Gemini model used across all endpoints
 GEMINI_MODEL = "gemini-3-flash-preview"
 
+# Shared upstream HTTP clients (http_clients.py)
+HTTP_POOL_LIMITS = {  # upstream -> (max_connections, max_keepalive_connections)
+    "gemini": (20, 10),
+    "solr": (10, 5),
+    "biz": (20, 10),
+}
+HTTP_TIMEOUTS = {"gemini": 120.0, "solr": 30.0, "biz": 30.0}  # seconds
+HTTP_KEEPALIVE_EXPIRY = 60.0  # seconds an idle pooled connection is kept open
+
+# Gemini response cache for /api/analyze-data and /api/generate-chart
+LLM_CACHE_MAX_BYTES = 32 * 1024 * 1024         # in-memory tier, by response text size
+LLM_CACHE_TTL = 24 * 60 * 60                   # seconds
+LLM_CACHE_DIR = Path(tempfile.gettempdir()) / "llm-cache"  # on-disk tier; None = memory only
+LLM_CACHE_DISK_MAX_BYTES = 256 * 1024 * 1024
+
+# Admission control for all Gemini calls, per process (llm_limiter.py)
+LLM_RATE_PER_SEC = 5.0       # token bucket refill: calls started per second
+LLM_BURST = 10               # bucket size
+LLM_MAX_CONCURRENCY = 8      # calls in flight (a stream holds its slot until it ends)
+LLM_MAX_QUEUE = 100          # waiting calls; more are refused with 503
+LLM_MAX_QUEUE_WAIT = 30.0    # seconds a call may wait for admission
+LLM_RATE_LIMIT_RETRIES = 3   # retries of a 429/503 from Gemini
+LLM_BACKOFF_BASE = 1.0       # seconds; full-jitter backoff when there is no Retry-After
+LLM_BACKOFF_MAX = 20.0
+
+# /api/search-database result cache
+SEARCH_CACHE_SIZE = 1024  # normalized queries kept (LRU)
+SEARCH_CACHE_TTL = 300    # seconds
+
+# /api/load-database-data fan-out
+BIZ_MAX_CONCURRENCY = 5   # concurrent Biz API requests per load
+BIZ_LOAD_DEADLINE = 20.0  # seconds for the whole batch; unfinished series are dropped
+
+# Biz API time-series cache (SQLite, stale-while-revalidate)
+SERIES_CACHE_PATH = Path(tempfile.gettempdir()) / "biz-series-cache.sqlite3"
+SERIES_CACHE_TTL = 15 * 60             # seconds a cached series is served without refreshing
+SERIES_CACHE_MAX_STALE = 24 * 60 * 60  # past this, refresh before answering instead of in background
+SERIES_CACHE_MAX_ROWS = 20_000                # series kept; least recently read go first past this
+SERIES_CACHE_MAX_BYTES = 256 * 1024 * 1024    # stored points (JSON), same eviction
+# Query parameter asking Biz for points from a date onwards (delta refresh), e.g. "start_date";
+# None = always full history. Off until Biz documents one: an upstream that ignores it still
+# merges correctly, and one that rejects it (4xx) is not retried and not asked again.
+BIZ_DELTA_PARAM = None
+
 # v2 code-execution sandbox
 MAX_RETRIES = 3       # max self-correction attempts after first failure
 SANDBOX_TIMEOUT = 30  # seconds per subprocess run
+SANDBOX_POOL_SIZE = 2         # pre-warmed workers (pandas imported); 0 = always cold-spawn
+SANDBOX_WORKER_MAX_JOBS = 50  # recycle a worker after this many jobs (and after any failure)
+SANDBOX_PRELOAD_DF = True     # bind the session data as `df` instead of having code read the CSV
+# Per-job rlimits (Linux), applied in the process that runs the generated code
+SANDBOX_MAX_MEMORY_BYTES = 1024 * 1024 * 1024  # address space on top of the warm worker's own
+SANDBOX_MAX_CPU_SECONDS = 20                   # CPU time; below SANDBOX_TIMEOUT, so busy loops stop first
+SANDBOX_MAX_OPEN_FILES = 64
+SANDBOX_MAX_OUTPUT_BYTES = 64 * 1024 * 1024    # stdout (and any file the code writes)
+SANDBOX_RESULT_CACHE_SIZE = 256     # memoized chart configs per (normalized code, data hash), LRU
+SANDBOX_RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # and their total size (as printed JSON)
+SANDBOX_RESULT_CACHE_TTL = 60 * 60  # seconds (also for results in the shared store)
+SANDBOX_RESULT_STORE_MAX_BYTES = 256 * 1024 * 1024  # chart results shared between workers, on disk
+GENERATE_MAX_CANDIDATES = 3         # per-request cap on parallel code candidates (opt-in)
+GENERATE_MAX_EXTRA_CANDIDATES = 8   # extra candidate streams in flight across all requests
+DATA_CONTEXT_TOKEN_BUDGET = 4000    # estimated tokens for the data part of the v2 prompt
+DATA_CONTEXT_CACHE_SIZE = 256       # built contexts per (data hash, source, budget), LRU
+
+# Chart series downsampling (downsample.py)
+DOWNSAMPLE_POINTS_PER_PIXEL = 2      # budget = viewport width x this, clamped to the range below
+DOWNSAMPLE_MIN_POINTS = 200
+DOWNSAMPLE_MAX_POINTS = 20_000
+DOWNSAMPLE_DEFAULT_POINTS = 5_000    # budget when the client does not send its viewport width
+
+# v2 uploads
+UPLOAD_MAX_BYTES = 200 * 1024 * 1024  # larger uploads are rejected with 413
+UPLOAD_FORM_OVERHEAD = 64 * 1024      # multipart framing allowed on top in Content-Length
+EXCEL_MAX_ROWS = 1_000_000            # data rows read from one sheet (after the header row)
+EXCEL_MAX_COLUMNS = 1000              # columns read from one sheet
+
+# v2 session storage (session_store.py), shared by every worker process using the same root
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "files")  # "files" (folder per session) or "sqlite"
+# Sessions, uploads and their converted data; point replicas at one shared volume
+SESSION_STORE_ROOT = Path(os.getenv("SESSION_STORE_ROOT") or tempfile.gettempdir())
+# "WAL" on a local disk; "DELETE" if the database sits on a network filesystem
+SESSION_SQLITE_JOURNAL_MODE = os.getenv("SESSION_SQLITE_JOURNAL_MODE", "WAL")
+
+# v2 session directory GC (session_gc.py)
+SESSION_MAX_AGE = 24 * 60 * 60              # delete sessions idle this long
+SESSION_MAX_BYTES = 512 * 1024 * 1024       # delete a single larger session once idle
+SESSION_QUOTA_BYTES = 4 * 1024 * 1024 * 1024  # total budget; LRU sessions go first past it
+SESSION_QUOTA_LOW_WATER = 0.8               # evict down to this fraction of the quota
+SESSION_MIN_IDLE = 15 * 60                  # never delete a session active more recently
+SESSION_GC_INTERVAL = 5 * 60                # seconds between sweeps
+
+# v2 session data cache
+DF_CACHE_MAX_BYTES = 512 * 1024 * 1024  # in-process LRU budget for parsed DataFrames
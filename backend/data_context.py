@@ -0,0 +1,161 @@
+"""
+Token-budgeted data context for the v2 code-generation prompt.
+
+The previous context was every column's profile plus the first 50 rows as indented
+JSON, which on wide sheets grows to tens of thousands of tokens. Here the column
+section and the row sample share a budget:
+
+  columns  full detail (samples, range, dates) while it fits; then fewer samples,
+           then no samples, then bare `name (dtype)` lists, finally a truncated list
+  rows     a pipe-separated table (header once, no JSON punctuation) of the head,
+           the tail, one row per category of a low-cardinality column and evenly
+           spaced rows in between, as many as the remaining budget allows; very
+           wide tables show only their first MAX_ROW_COLUMNS columns
+
+Token counts are estimated (~4 ASCII characters or 1 CJK character per token),
+which is close enough for budgeting without a tokenizer.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from profiler import ColumnProfile, DataProfile
+
+MAX_PREVIEW_ROWS = 50
+MIN_PREVIEW_ROWS = 5
+MAX_ROW_COLUMNS = 24
+MAX_CELL_CHARS = 40
+# Share of the budget the column section may use before its detail is reduced
+COLUMN_SHARE = 0.5
+# A text column with this many distinct values (or fewer) is used to stratify rows
+MAX_STRATA = 20
+
+
+def estimate_tokens(text: str) -> int:
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+# ── Columns ───────────────────────────────────────────────────────────────────
+
+def _column_line(col: ColumnProfile, samples: int | None) -> str:
+    line = f"  - {col.name!r}: dtype={col.dtype}, nulls={col.null_count}, unique={col.unique_count}"
+    if samples is None or samples > 0:
+        reprs = col.sample_reprs if samples is None else col.sample_reprs[:samples]
+        line += f", samples=[{', '.join(reprs)}]"
+    if col.is_numeric:
+        line += f", range=[{col.min_value:g}, {col.max_value:g}]"
+    if col.datetime_parseable:
+        line += f", datetime=[{col.datetime_min} ~ {col.datetime_max}]"
+    return line
+
+
+def _name_list(columns: list[ColumnProfile]) -> str:
+    return "  " + ", ".join(f"{c.name!r} ({c.dtype})" for c in columns)
+
+
+def _columns_section(profile: DataProfile, budget: int) -> str:
+    """Most detailed column listing that fits in `budget` tokens."""
+    columns = profile.columns
+    for samples in (None, 2, 0):
+        text = "\n".join(_column_line(c, samples) for c in columns)
+        if estimate_tokens(text) <= budget:
+            return text
+    text = _name_list(columns)
+    if estimate_tokens(text) <= budget:
+        return text
+    # Even the bare names do not fit: list as many as fit and count the rest
+    per_column = estimate_tokens(text) / max(len(columns), 1)
+    keep = max(int(budget / per_column) - 1, 1)
+    return (_name_list(columns[:keep])
+            + f"\n  …以及另外 {len(columns) - keep} 個欄位（可用 df.columns 查看全部）")
+
+
+# ── Rows ──────────────────────────────────────────────────────────────────────
+
+def _strata_column(df: pd.DataFrame, profile: DataProfile) -> str | None:
+    for col in profile.columns:
+        if (not col.is_numeric and not col.datetime_parseable
+                and 2 <= col.unique_count <= MAX_STRATA and col.name in df.columns):
+            return col.name
+    return None
+
+
+def select_rows(df: pd.DataFrame, profile: DataProfile, n: int) -> list[int]:
+    """Positions of up to n rows: head, tail, one per stratum, evenly spaced rest."""
+    total = len(df)
+    if total <= n:
+        return list(range(total))
+    head = max(n * 2 // 5, 1)
+    tail = max(n // 5, 1)
+    picked = set(range(head)) | set(range(total - tail, total))
+
+    strata = _strata_column(df, profile)
+    if strata is not None:
+        firsts = pd.Series(np.arange(total)).groupby(df[strata].to_numpy(), sort=False).first()
+        for pos in firsts.tolist():
+            if len(picked) >= n:
+                break
+            picked.add(int(pos))
+
+    remaining = n - len(picked)
+    if remaining > 0:
+        for pos in np.linspace(head, total - tail - 1, remaining + 2)[1:-1].astype(int).tolist():
+            picked.add(pos)
+    return sorted(picked)
+
+
+def _cell(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value is pd.NaT:
+        return ""
+    if isinstance(value, float):
+        text = f"{value:.10g}"
+    elif isinstance(value, pd.Timestamp):
+        text = value.isoformat().removesuffix("T00:00:00")
+    else:
+        text = str(value)
+    text = text.replace("|", "/").replace("\n", " ").replace("\r", " ")
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS - 1] + "…"
+
+
+def render_rows(df: pd.DataFrame, positions: list[int], columns: list) -> str:
+    lines = ["row|" + "|".join(_cell(c) for c in columns)]
+    block = df.iloc[positions][columns]
+    for pos, values in zip(positions, block.itertuples(index=False, name=None)):
+        lines.append(f"{pos}|" + "|".join(_cell(v) for v in values))
+    return "\n".join(lines)
+
+
+# ── Context ───────────────────────────────────────────────────────────────────
+
+def build_data_context(source_line: str, df: pd.DataFrame, profile: DataProfile,
+                       budget_tokens: int) -> str:
+    """Prompt data context of at most ~budget_tokens tokens (never fewer than
+    MIN_PREVIEW_ROWS rows)."""
+    header = f"{source_line}總行數: {profile.row_count}，欄位數: {len(profile.columns)}\n欄位資訊:\n"
+    columns_text = _columns_section(
+        profile, int(max(budget_tokens - estimate_tokens(header), 0) * COLUMN_SHARE))
+
+    row_columns = list(df.columns[:MAX_ROW_COLUMNS])
+    note = "row 為原始列號（0 起算）；包含開頭、結尾與中間的抽樣列"
+    if len(df.columns) > len(row_columns):
+        note += f"；僅顯示前 {len(row_columns)} / {len(df.columns)} 個欄位"
+    used = estimate_tokens(header + columns_text + note) + 16
+    row_budget = budget_tokens - used
+
+    # Size the sample from the cost of a trial rendering
+    n = min(MAX_PREVIEW_ROWS, len(df))
+    positions = select_rows(df, profile, n)
+    table = render_rows(df, positions, row_columns)
+    cost = estimate_tokens(table)
+    if cost > row_budget and len(positions) > MIN_PREVIEW_ROWS:
+        per_row = cost / (len(positions) + 1)
+        n = max(int(row_budget / per_row) - 1, MIN_PREVIEW_ROWS)
+        positions = select_rows(df, profile, n)
+        table = render_rows(df, positions, row_columns)
+
+    return (
+        f"{header}{columns_text}\n\n"
+        f"資料抽樣 {len(positions)} 列（{note}）:\n{table}"
+    )
@@ -0,0 +1,260 @@
+"""
+Server-side downsampling of large chart series (NumPy).
+
+Highcharts gets slow well before the browser runs out of memory, and a chart can
+never show more distinct points than it has pixels. Series longer than the point
+budget are reduced to it with one of:
+
+    lttb    Largest-Triangle-Three-Buckets: keeps the visual shape of lines
+    minmax  the min and max of each bucket: keeps every spike; good for columns
+            and very noisy data
+
+Both keep the first and last point and return a subset of the original points
+(objects are passed through untouched), so tooltips and per-point options
+survive. Null points are kept as gap markers (the first of each run of them), so
+a line still breaks where data is missing. The budget comes from the client's
+viewport width when it sends one.
+
+Downsampling is opt-in: requests get it when they name a mode or send their
+viewport width (see resolve_mode), and full data otherwise.
+
+Supported series data: [y, ...] (x from pointStart/pointInterval), [[x, y], ...]
+and [{"x": .., "y": ..}, ...] with numeric, ascending x. Anything else (category
+axes, ranges, scatter clouds, pies) is left as is.
+"""
+import itertools
+import math
+
+import numpy as np
+
+from config import (DOWNSAMPLE_DEFAULT_POINTS, DOWNSAMPLE_MAX_POINTS, DOWNSAMPLE_MIN_POINTS,
+                    DOWNSAMPLE_POINTS_PER_PIXEL)
+
+MODES = ("lttb", "minmax")
+# Series types whose points sit on a continuous, sorted x axis
+LINE_LIKE_TYPES = {"line", "spline", "area", "areaspline", "column", "bar"}
+
+
+def point_budget(viewport_width: int | None) -> int:
+    """Points per series worth sending to a chart `viewport_width` CSS pixels wide."""
+    if not viewport_width or viewport_width <= 0:
+        return DOWNSAMPLE_DEFAULT_POINTS
+    return int(min(max(viewport_width * DOWNSAMPLE_POINTS_PER_PIXEL, DOWNSAMPLE_MIN_POINTS),
+                   DOWNSAMPLE_MAX_POINTS))
+
+
+def resolve_mode(mode: str | None, viewport_width: int | None) -> str:
+    """The mode a request asked for; without one, "lttb" if it sent its viewport
+    width (it expects a budget) and "none" otherwise, as older clients get full data."""
+    if mode is not None:
+        return mode
+    return "lttb" if viewport_width else "none"
+
+
+# ── Index selection ───────────────────────────────────────────────────────────
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the LTTB selection of n_out points (x ascending, all finite)."""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])
+
+    # n_out - 2 buckets between the fixed first and last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Mean of every bucket, vectorized; the "next bucket" of the last one is the last point
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        # Twice the triangle area A-B-C for every candidate B in the bucket
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the min and max of n_out // 2 equal buckets (plus first/last point)."""
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    buckets = max(n_out // 2 - 1, 1)
+    width = math.ceil((n - 2) / buckets)
+    inner = y[1:n - 1]
+    # Pad with the last value so the array reshapes into whole buckets; padded
+    # positions map back to the last inner point and collapse in np.unique
+    padded = np.concatenate([inner, np.full(buckets * width - len(inner), inner[-1])])
+    grid = padded.reshape(buckets, width)
+    offsets = np.arange(buckets) * width
+    picks = np.concatenate([grid.argmin(axis=1) + offsets, grid.argmax(axis=1) + offsets])
+    picks = np.minimum(picks, len(inner) - 1) + 1
+    return np.unique(np.concatenate([[0], picks, [n - 1]]))
+
+
+def gap_indices(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """First index of every run of null (non-finite y) points that have a position."""
+    null = ~np.isfinite(y) & np.isfinite(x)
+    starts = null.copy()
+    starts[1:] &= ~null[:-1]
+    return np.flatnonzero(starts)
+
+
+def select_indices(x: np.ndarray, y: np.ndarray, n_out: int, mode: str = "lttb") -> np.ndarray:
+    """Indices to keep from the points (x, y): n_out chosen among the finite points,
+    plus one null per run of nulls so gaps in the line survive."""
+    finite = np.flatnonzero(np.isfinite(y) & np.isfinite(x))
+    if len(finite) > n_out:
+        fx, fy = x[finite], y[finite]
+        if mode == "minmax":
+            finite = finite[minmax_indices(fy, n_out)]
+        else:
+            finite = finite[lttb_indices(fx, fy, n_out)]
+    return np.union1d(finite, gap_indices(x, y))
+
+
+# ── Highcharts series data ────────────────────────────────────────────────────
+
+def _to_float(values: list) -> np.ndarray | None:
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+
+
+def _series_xy(data: list, point_start: float = 0, point_interval: float = 1
+               ) -> tuple[str, np.ndarray, np.ndarray] | None:
+    """(format, x, y) of a series' data, or None if the format is not supported."""
+    first = next((p for p in data if p is not None), None)
+    if isinstance(first, (int, float)) and not isinstance(first, bool):
+        y = _to_float(data)
+        if y is None or y.ndim != 1:
+            return None
+        return "values", point_start + point_interval * np.arange(len(y), dtype=np.float64), y
+    if isinstance(first, (list, tuple)):
+        try:
+            # ~3x faster than np.asarray on a list of lists; nulls fall back below
+            flat = np.fromiter(itertools.chain.from_iterable(data), dtype=np.float64)
+            pairs = flat.reshape(-1, 2) if flat.size == 2 * len(data) else None
+        except (TypeError, ValueError):
+            pairs = _to_float(data)
+        if pairs is None or pairs.ndim != 2 or pairs.shape[1] != 2:
+            return None
+        return "pairs", pairs[:, 0], pairs[:, 1]
+    if isinstance(first, dict):
+        if not all(isinstance(p, dict) for p in data):
+            return None
+        x = _to_float([p.get("x") for p in data])
+        y = _to_float([p.get("y") for p in data])
+        if x is None or y is None:
+            return None
+        return "objects", x, y
+    return None
+
+
+def downsample_points(data: list, n_out: int, mode: str = "lttb",
+                      point_start: float = 0, point_interval: float = 1,
+                      x_range: tuple[float | None, float | None] | None = None) -> list | None:
+    """Downsample Highcharts series data to at most ~n_out points.
+
+    Returns the new data list (y-only data comes back as [x, y] pairs so the
+    remaining points keep their positions), or None if the format is not
+    supported or x is not ascending. x_range limits the output to a zoomed window.
+    """
+    parsed = _series_xy(data, point_start, point_interval)
+    if parsed is None:
+        return None
+    kind, x, y = parsed
+    if len(x) > 1 and np.any(np.diff(x[np.isfinite(x)]) < 0):
+        return None
+
+    window = np.arange(len(x))
+    if x_range is not None:
+        lo, hi = x_range
+        mask = np.ones(len(x), dtype=bool)
+        if lo is not None:
+            mask &= x >= lo
+        if hi is not None:
+            mask &= x <= hi
+        window = np.flatnonzero(mask)
+    if len(window) <= n_out and x_range is None:
+        return data
+
+    keep = window[select_indices(x[window], y[window], n_out, mode)] if len(window) > n_out else window
+    if kind == "values":
+        return [[float(x[i]), data[i]] for i in keep.tolist()]
+    return [data[i] for i in keep.tolist()]
+
+
+def downsample_chart_config(config: dict, n_out: int, mode: str = "lttb") -> dict:
+    """Return config with every long line-like series downsampled (config is not modified)."""
+    series = config.get("series") if isinstance(config, dict) else None
+    if not isinstance(series, list):
+        return config
+    x_axis = config.get("xAxis")
+    axes = x_axis if isinstance(x_axis, list) else [x_axis]
+    if any(isinstance(axis, dict) and axis.get("categories") for axis in axes):
+        return config
+    chart = config.get("chart")
+    chart_type = (chart.get("type") if isinstance(chart, dict) else None) or "line"
+
+    new_series, changed = [], False
+    for s in series:
+        data = s.get("data") if isinstance(s, dict) else None
+        if (not isinstance(data, list) or len(data) <= n_out
+                or (s.get("type") or chart_type) not in LINE_LIKE_TYPES):
+            new_series.append(s)
+            continue
+        reduced = downsample_points(data, n_out, mode,
+                                    point_start=s.get("pointStart", 0) or 0,
+                                    point_interval=s.get("pointInterval", 1) or 1)
+        if reduced is None or reduced is data:
+            new_series.append(s)
+            continue
+        # y-only data came back as [x, y] pairs, which carry their own positions
+        s = {k: v for k, v in s.items() if k not in ("data", "pointStart", "pointInterval")}
+        new_series.append({**s, "data": reduced})
+        changed = True
+    return {**config, "series": new_series} if changed else config
+
+
+def downsample_dated(points: list[dict], n_out: int, mode: str = "lttb",
+                     x_range: tuple[float | None, float | None] | None = None) -> list[dict]:
+    """Downsample [{"date": "YYYY-MM-DD", "value": v}, ...] (sorted by date).
+
+    x_range bounds are epoch milliseconds, matching the chart's datetime axis.
+    """
+    if len(points) <= n_out and x_range is None:
+        return points
+    try:
+        dates = np.array([p.get("date") or "NaT" for p in points], dtype="datetime64[ms]")
+    except ValueError:
+        return points
+    x = dates.astype(np.int64).astype(np.float64)
+    x[np.isnat(dates)] = np.nan
+    y = _to_float([p.get("value") for p in points])
+    if y is None:
+        return points
+
+    window = np.arange(len(points))
+    if x_range is not None:
+        lo, hi = x_range
+        mask = np.isfinite(x)
+        if lo is not None:
+            mask &= x >= lo
+        if hi is not None:
+            mask &= x <= hi
+        window = np.flatnonzero(mask)
+    if len(window) > n_out:
+        window = window[select_indices(x[window], y[window], n_out, mode)]
+    return [points[i] for i in window.tolist()]
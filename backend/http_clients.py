@@ -0,0 +1,107 @@
+"""
+Long-lived HTTP clients for the upstream services, one per upstream.
+
+Every endpoint goes through these instead of opening its own httpx.AsyncClient,
+so TCP/TLS connections (and HTTP/2 sessions where the server supports them) are
+reused across requests, retries and users. Each upstream gets its own pool
+limits so a burst of Biz loads cannot starve Gemini calls of connections.
+
+    gemini  generativelanguage.googleapis.com (or GEMINI_API_BASE)
+    solr    SOLR_API_URL
+    biz     BIZ_API_URL
+
+HTTP/2 is used when the optional `h2` package is installed (httpx[http2]);
+otherwise the clients speak HTTP/1.1 with keep-alive.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+
+import httpx
+
+from config import HTTP_KEEPALIVE_EXPIRY, HTTP_POOL_LIMITS, HTTP_TIMEOUTS
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+DEFAULT_GEMINI_API_BASE = "https://generativelanguage.googleapis.com"
+WARM_TIMEOUT = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+def gemini_api_base() -> str:
+    return os.getenv("GEMINI_API_BASE", DEFAULT_GEMINI_API_BASE).rstrip("/")
+
+
+def _warm_urls() -> dict[str, str | None]:
+    return {
+        "gemini": gemini_api_base(),
+        "solr": os.getenv("SOLR_API_URL"),
+        "biz": os.getenv("BIZ_API_URL"),
+    }
+
+
+class HTTPClients:
+    def __init__(self):
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self.warmed: dict[str, bool] = {}
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        max_connections, max_keepalive = HTTP_POOL_LIMITS[name]
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(HTTP_TIMEOUTS[name]),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive,
+                                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._create(name)
+        return client
+
+    @property
+    def gemini(self) -> httpx.AsyncClient:
+        return self.get("gemini")
+
+    @property
+    def solr(self) -> httpx.AsyncClient:
+        return self.get("solr")
+
+    @property
+    def biz(self) -> httpx.AsyncClient:
+        return self.get("biz")
+
+    async def _warm_one(self, name: str, url: str) -> None:
+        try:
+            # Any response will do: the point is an open, pooled connection
+            await self.get(name).head(url, timeout=WARM_TIMEOUT)
+            self.warmed[name] = True
+        except httpx.HTTPError as e:
+            self.warmed[name] = False
+            logger.warning("Could not warm %s connection: %r", name, e)
+
+    async def warm(self) -> None:
+        """Open one connection to each configured upstream (TCP + TLS + ALPN)."""
+        await asyncio.gather(*(self._warm_one(name, url)
+                               for name, url in _warm_urls().items() if url))
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(c.aclose() for c in clients))
+
+    def stats(self) -> dict:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "upstreams": {
+                name: {"limits": HTTP_POOL_LIMITS[name],
+                       "open": name in self._clients,
+                       "warmed": self.warmed.get(name)}
+                for name in HTTP_POOL_LIMITS
+            },
+        }
+
+
+http_clients = HTTPClients()
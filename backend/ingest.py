@@ -0,0 +1,323 @@
+"""
+Upload ingestion helpers: encoding detection for CSV uploads, sheet reading for Excel.
+
+The encoding is decided from a bounded byte sample (BOM sniffing, strict UTF-8,
+then a byte-statistics vote between Big5/CP950 and GBK) so the CSV itself only
+has to be parsed once.
+
+Excel sheets are read with calamine (Rust, via python-calamine) when it
+is installed, otherwise by streaming openpyxl's read-only rows as plain values.
+Either way only the requested cell range is read, capped at EXCEL_MAX_ROWS x
+EXCEL_MAX_COLUMNS, so a sheet whose used range was inflated by formatting does not
+turn into millions of empty cells; empty trailing rows and columns are dropped.
+"""
+import codecs
+import datetime
+import re
+import zipfile
+from pathlib import Path
+from typing import NamedTuple
+from xml.etree import ElementTree
+
+import pandas as pd
+
+from config import EXCEL_MAX_COLUMNS, EXCEL_MAX_ROWS
+
+try:
+    import python_calamine
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
+SAMPLE_BYTES = 256 * 1024
+_TAIL_WINDOWS = 4
+
+# Legacy probing order; also the fallback order when the sample was not representative
+CSV_ENCODINGS = ("utf-8", "utf-8-sig", "cp950", "gbk")
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# A double-byte character in either Big5 or GBK: lead 0x81-0xFE, trail 0x40-0x7E / 0x80-0xFE
+_DBCS_PAIR = re.compile(rb"[\x81-\xfe][\x40-\x7e\x80-\xfe]")
+# Big5 trail bytes 0x40-0x7E never occur in GB2312 text
+_LOW_TRAILS = bytes(range(0x40, 0x7F))
+# Big5 frequent hanzi end at lead 0xC6; GB2312 level-1/2 hanzi run up to 0xF7
+_HIGH_LEADS = bytes(range(0xC7, 0xF8))
+
+
+class EncodingGuess(NamedTuple):
+    encoding: str
+    confidence: float  # 0..1
+
+
+def _decodes(sample: bytes, encoding: str, final: bool) -> bool:
+    """Strictly decode sample; a multibyte sequence cut at the sample edge is fine."""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=final)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def _vote_cjk(sample: bytes, final: bool) -> EncodingGuess | None:
+    big5_ok = _decodes(sample, "cp950", final)
+    gbk_ok = _decodes(sample, "gbk", final)
+    if big5_ok != gbk_ok:
+        return EncodingGuess("cp950" if big5_ok else "gbk", 0.9)
+    if not big5_ok:
+        return None
+
+    pairs = _DBCS_PAIR.findall(sample)
+    if not pairs:
+        return EncodingGuess("cp950", 0.5)
+    joined = b"".join(pairs)
+    leads, trails = joined[::2], joined[1::2]
+    # Share of pairs that only look natural in one of the two encodings
+    big5_evidence = (len(trails) - len(trails.translate(None, _LOW_TRAILS))) / len(pairs)
+    gbk_evidence = (len(leads) - len(leads.translate(None, _HIGH_LEADS))) / len(pairs)
+    total = big5_evidence + gbk_evidence
+    if total == 0:
+        return EncodingGuess("cp950", 0.5)
+    if big5_evidence >= gbk_evidence:
+        return EncodingGuess("cp950", round(0.5 + 0.5 * big5_evidence / total, 3))
+    return EncodingGuess("gbk", round(0.5 + 0.5 * gbk_evidence / total, 3))
+
+
+def _read_sample(path: Path, sample_size: int) -> tuple[bytes, bool]:
+    """Return (sample, is_whole_file).
+
+    Large files are sampled as the head (half the budget) plus evenly spaced windows
+    reaching the end of the file, so exports whose first rows are plain ASCII still
+    show their non-ASCII bytes. Windows are cut at newlines, which never occur inside
+    a UTF-8/Big5/GBK multibyte sequence.
+    """
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        if size <= sample_size:
+            return f.read(), True
+        head = f.read(sample_size // 2)
+        parts = [head[:head.rfind(b"\n") + 1] or head]
+        window = sample_size // (2 * _TAIL_WINDOWS)
+        span = size - len(head) - window
+        for i in range(1, _TAIL_WINDOWS + 1):
+            f.seek(len(head) + span * i // _TAIL_WINDOWS)
+            chunk = f.read(window)
+            start, end = chunk.find(b"\n") + 1, chunk.rfind(b"\n") + 1
+            if 0 < start < end:
+                parts.append(chunk[start:end])
+    return b"".join(parts), False
+
+
+def detect_encoding(path: Path, sample_size: int = SAMPLE_BYTES) -> EncodingGuess:
+    """Guess the text encoding of a CSV from a bounded byte sample.
+
+    CP950 is used for Traditional Chinese: it is the Windows superset of Big5 that
+    Excel exports, so it also reads plain Big5 files.
+    """
+    sample, final = _read_sample(path, sample_size)
+
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return EncodingGuess(encoding, 1.0)
+    if sample.isascii():
+        return EncodingGuess("utf-8", 1.0)
+    if _decodes(sample, "utf-8", final):
+        return EncodingGuess("utf-8", 0.99)
+
+    guess = _vote_cjk(sample, final)
+    if guess is None:
+        raise ValueError("Cannot decode CSV file")
+    return guess
+
+
+# ── Excel ─────────────────────────────────────────────────────────────────────
+
+_CELL_RANGE = re.compile(r"^\$?([A-Z]{1,3})\$?(\d+)(?::\$?([A-Z]{1,3})\$?(\d+))?$")
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+# The largest sheet Excel can hold (XFD1048576)
+EXCEL_SHEET_ROWS = 1_048_576
+EXCEL_SHEET_COLUMNS = 16_384
+
+
+class EmptyCellRange(ValueError):
+    """The requested cell range contains no cells of the sheet."""
+
+
+def column_index(letters: str) -> int:
+    """1-based column number of an A1 column ("A" -> 1, "AB" -> 28)."""
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - ord("A") + 1
+    return index
+
+
+def column_letters(index: int) -> str:
+    letters = ""
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+class CellRange(NamedTuple):
+    """Inclusive 1-based bounds of the cells to read; max_* None = to the end."""
+    min_row: int
+    min_col: int
+    max_row: int | None = None
+    max_col: int | None = None
+
+    def __str__(self) -> str:
+        start = f"{column_letters(self.min_col)}{self.min_row}"
+        if self.max_row is None:
+            return start
+        return f"{start}:{column_letters(self.max_col)}{self.max_row}"
+
+
+def parse_cell_range(text: str) -> CellRange:
+    """Parse "B2:H500" (a block) or "B2" (from B2 to the end of the sheet).
+    The first row of the range is the header row."""
+    match = _CELL_RANGE.match(text.strip().upper().replace(" ", ""))
+    if not match:
+        raise ValueError(f"Invalid cell range {text!r} (expected e.g. A1:F500)")
+    c1, r1, c2, r2 = match.groups()
+    rows = [int(r1)] if c2 is None else sorted((int(r1), int(r2)))
+    cols = [column_index(c1)] if c2 is None else sorted((column_index(c1), column_index(c2)))
+    if not (1 <= rows[0] and rows[-1] <= EXCEL_SHEET_ROWS
+            and 1 <= cols[0] and cols[-1] <= EXCEL_SHEET_COLUMNS):
+        raise ValueError(f"Invalid cell range {text!r} (outside A1:XFD1048576)")
+    if c2 is None:
+        return CellRange(rows[0], cols[0])
+    return CellRange(rows[0], cols[0], rows[1], cols[1])
+
+
+def excel_sheet_names(path: Path) -> list[str]:
+    """Sheet names in workbook order, without loading any sheet."""
+    if EXCEL_ENGINE == "calamine":
+        with python_calamine.CalamineWorkbook.from_path(str(path)) as book:
+            return list(book.sheet_names)
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            root = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+        return [sheet.get("name") for sheet in root.iter(f"{_SHEET_NS}sheet")]
+    with pd.ExcelFile(path) as book:  # legacy .xls (needs xlrd)
+        return list(book.sheet_names)
+
+
+def _header(values: tuple) -> list[str]:
+    """Column names from the header row, as pandas would name them (but always str)."""
+    names, seen = [], {}
+    for i, value in enumerate(values):
+        name = f"Unnamed: {i}" if value is None or value == "" else str(value)
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        names.append(name if count == 0 else f"{name}.{count}")
+    return names
+
+
+def _trim(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop empty rows at the end and unnamed empty columns on the right."""
+    non_empty = df.notna()
+    rows = non_empty.any(axis=1).to_numpy()
+    last_row = len(rows) - rows[::-1].argmax() if rows.any() else 0
+    keep_cols = len(df.columns)
+    cols = non_empty.any(axis=0)
+    while keep_cols and not cols.iloc[keep_cols - 1] and str(df.columns[keep_cols - 1]).startswith("Unnamed: "):
+        keep_cols -= 1
+    if last_row == len(df) and keep_cols == len(df.columns):
+        return df
+    return df.iloc[:last_row, :keep_cols].reset_index(drop=True)
+
+
+def _read_openpyxl(path: Path, sheet: str | None, first_row: int, last_row: int,
+                   first_col: int, last_col: int) -> pd.DataFrame:
+    import openpyxl
+
+    book = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = book[sheet] if sheet is not None else book.worksheets[0]
+        # Rows are padded to max_col, so only pass one within the sheet's stated
+        # dimension; without a dimension, rows come at their own width and are sliced
+        pad_to = min(last_col, ws.max_column) if ws.max_column else None
+        rows = ws.iter_rows(min_row=first_row, max_row=last_row, min_col=first_col,
+                            max_col=pad_to, values_only=True)
+        width = last_col - first_col + 1
+        header = next(rows, None)
+        header = header[:width] if header is not None else None
+        data = [row[:width] for row in rows]
+    finally:
+        book.close()
+    return _frame(header, data)
+
+
+def _frame(header: tuple | None, data: list) -> pd.DataFrame:
+    """DataFrame from a header row and data rows of plain values (rows may be ragged)."""
+    if header is None:
+        return pd.DataFrame()
+    df = pd.DataFrame(data)
+    width = max(len(header), df.shape[1])
+    names = _header(tuple(header) + (None,) * (width - len(header)))
+    if df.shape[1] < width:
+        df = df.reindex(columns=range(width))
+    df.columns = names
+    return df
+
+
+def _calamine_value(value):
+    """A calamine cell as pandas' calamine engine would give it."""
+    if value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, datetime.date):  # datetime included
+        return pd.Timestamp(value)
+    if isinstance(value, datetime.timedelta):
+        return pd.Timedelta(value)
+    return value
+
+
+def _read_calamine(path: Path, sheet: str | None, first_row: int, last_row: int,
+                   first_col: int, last_col: int) -> pd.DataFrame:
+    with python_calamine.CalamineWorkbook.from_path(str(path)) as book:
+        ws = book.get_sheet_by_name(sheet) if sheet is not None else book.get_sheet_by_index(0)
+        # Anchored at A1 and as wide as the sheet's used range; slicing keeps the
+        # requested columns, so a range past the used columns just comes out narrower
+        grid = ws.to_python(skip_empty_area=False, nrows=last_row)
+    rows = [[_calamine_value(v) for v in row[first_col - 1:last_col]]
+            for row in grid[first_row - 1:last_row]]
+    return _frame(tuple(rows[0]) if rows else None, rows[1:])
+
+
+def read_excel(path: Path, sheet: str | None = None, cell_range: CellRange | None = None,
+               max_rows: int = EXCEL_MAX_ROWS, max_cols: int = EXCEL_MAX_COLUMNS) -> pd.DataFrame:
+    """Read one sheet (default: the first) as a DataFrame; the first row of
+    cell_range (default: the whole sheet) is the header.
+
+    Raises EmptyCellRange when cell_range is given but holds no cells of the sheet.
+    """
+    bounds = cell_range or CellRange(1, 1)
+    last_row = bounds.min_row + max_rows  # header + max_rows data rows
+    if bounds.max_row is not None:
+        last_row = min(last_row, bounds.max_row)
+    last_col = bounds.min_col + max_cols - 1
+    if bounds.max_col is not None:
+        last_col = min(last_col, bounds.max_col)
+
+    if EXCEL_ENGINE == "calamine":
+        df = _read_calamine(path, sheet, bounds.min_row, last_row, bounds.min_col, last_col)
+    elif zipfile.is_zipfile(path):
+        df = _read_openpyxl(path, sheet, bounds.min_row, last_row, bounds.min_col, last_col)
+    else:
+        # Legacy .xls via xlrd. No usecols: pandas rejects columns past the sheet's
+        # width, so the column window is cut out of the frame instead
+        df = pd.read_excel(path, sheet_name=sheet if sheet is not None else 0,
+                           skiprows=bounds.min_row - 1, nrows=last_row - bounds.min_row)
+        df = df.iloc[:, bounds.min_col - 1:last_col]
+        df.columns = _header(tuple(df.columns))
+    df = _trim(df)
+    if cell_range is not None and df.columns.empty:
+        raise EmptyCellRange(f"Cell range {cell_range} holds no data")
+    return df
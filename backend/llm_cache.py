@@ -0,0 +1,175 @@
+"""
+Content-addressed cache of Gemini responses.
+
+The key is a SHA-256 over the model name and the canonical JSON of the request
+payload (contents + generationConfig), so byte-identical prompts with the same
+generation settings hit and anything else misses. Only the response text is
+stored.
+
+Two tiers:
+    memory  LRU bounded by the total size of the cached texts
+    disk    optional, one JSON file per key under LLM_CACHE_DIR, pruned oldest
+            first when over its byte budget; survives restarts and is shared by
+            workers on the same host
+Entries older than the TTL are treated as misses in both tiers.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(model: str, payload: dict) -> str:
+    canonical = json.dumps({"model": model, "payload": payload},
+                           ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, max_bytes: int, ttl: float,
+                 disk_dir: Path | None = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._items: OrderedDict[str, tuple[float, str, int]] = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir is not None:
+            try:
+                disk_dir.mkdir(parents=True, exist_ok=True)
+                self._disk_bytes = sum(p.stat().st_size for p in disk_dir.glob("*.json"))
+            except OSError as e:
+                logger.warning("LLM disk cache disabled: %s", e)
+                self.disk_dir = None
+
+    # ── Lookup ────────────────────────────────────────────────────────────────
+
+    def get(self, key: str) -> str | None:
+        """Return the cached response text, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                if now - item[0] < self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                self._discard(key)
+
+        entry = self._read_disk(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            with self._lock:
+                self.disk_hits += 1
+                self._remember(key, entry[0], entry[1])
+            return entry[1]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, text: str) -> None:
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, text)
+        self._write_disk(key, created, text)
+
+    # ── Memory tier ───────────────────────────────────────────────────────────
+
+    def _remember(self, key: str, created: float, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        self._discard(key)
+        if size > self.max_bytes:
+            return
+        self._items[key] = (created, text, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._discard(next(iter(self._items)))
+            self.evictions += 1
+
+    def _discard(self, key: str) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    # ── Disk tier ─────────────────────────────────────────────────────────────
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.json"
+
+    def _read_disk(self, key: str) -> tuple[float, str] | None:
+        if self.disk_dir is None:
+            return None
+        try:
+            entry = json.loads(self._disk_path(key).read_text(encoding="utf-8"))
+            return float(entry["created"]), entry["text"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_disk(self, key: str, created: float, text: str) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            data = json.dumps({"created": created, "text": text}, ensure_ascii=False)
+            tmp.write_text(data, encoding="utf-8")
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("LLM disk cache write failed: %s", e)
+            tmp.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._disk_bytes += len(data.encode("utf-8")) - replaced
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """Delete expired files, then the oldest ones, until under 3/4 of the budget."""
+        now = time.time()
+        files = []
+        for p in self.disk_dir.glob("*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 3 // 4
+        for mtime, size, p in files:
+            if total <= target and now - mtime < self.ttl:
+                continue
+            p.unlink(missing_ok=True)
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_bytes": self._disk_bytes if self.disk_dir is not None else None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,196 @@
+"""
+Process-wide admission control for Gemini calls.
+
+Every upstream LLM call (v1 analyze/generate, v2 streams) takes a slot from the
+shared `llm_limiter` first:
+
+  - a token bucket (LLM_RATE_PER_SEC, bursts of LLM_BURST) bounds the call rate
+  - a concurrency cap (LLM_MAX_CONCURRENCY) bounds calls in flight; a slot is held
+    for the whole call, including a streamed response
+  - waiting calls are admitted by priority (INTERACTIVE before BACKGROUND), FIFO
+    within a priority; a full queue or a wait over LLM_MAX_QUEUE_WAIT raises LLMBusy
+  - a 429/503 from Gemini pauses all admissions until its Retry-After has passed,
+    and the caller retries after that delay plus jitter (or, without the header,
+    after a full-jitter exponential backoff)
+
+Queue depth, calls in flight and queue wait are exported at /metrics.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+
+from config import (LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_BURST, LLM_MAX_CONCURRENCY,
+                    LLM_MAX_QUEUE, LLM_MAX_QUEUE_WAIT, LLM_RATE_PER_SEC)
+from metrics import llm_in_flight, llm_queue_depth, llm_queue_wait, llm_rejected
+
+INTERACTIVE = 0  # a user is waiting on this call
+BACKGROUND = 1   # suggestions, speculative extra candidates
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Upstream statuses that mean "slow down" rather than "this request is wrong"
+RETRYABLE_STATUSES = {429, 503}
+
+
+class LLMBusy(Exception):
+    """The call was not admitted (queue full or waited too long)."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMLimiter:
+    def __init__(self, rate: float, burst: int, max_concurrency: int,
+                 max_queue: int, max_wait: float):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self.in_flight = 0
+        self.paused_until = 0.0  # monotonic time; set by rate_limited()
+        self._queue: list[tuple[int, int, asyncio.Future]] = []
+        self._waiting = {priority: 0 for priority in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self.admitted = 0
+        self.rejected = 0
+        self.rate_limited_responses = 0
+
+    # ── Admission ────────────────────────────────────────────────────────────
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wake_at(self, delay: float) -> None:
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admit waiting calls in priority order while a slot and a token are free."""
+        now = time.monotonic()
+        self._refill(now)
+        while self._queue and self.in_flight < self.max_concurrency:
+            if now < self.paused_until:
+                self._wake_at(self.paused_until - now)
+                break
+            if self.tokens < 1:
+                self._wake_at((1 - self.tokens) / self.rate)
+                break
+            priority, _, waiter = heapq.heappop(self._queue)
+            if waiter.done():  # gave up waiting
+                continue
+            self._waiting[priority] -= 1
+            self.tokens -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            waiter.set_result(None)
+        self._export()
+
+    def _export(self) -> None:
+        for priority, name in PRIORITY_NAMES.items():
+            llm_queue_depth.labels(name).set(self._waiting[priority])
+        llm_in_flight.set(self.in_flight)
+
+    async def acquire(self, priority: int = INTERACTIVE) -> None:
+        if sum(self._waiting.values()) >= self.max_queue:
+            self.rejected += 1
+            llm_rejected.labels("queue_full").inc()
+            raise LLMBusy("AI 服務忙碌中，請稍後再試", retry_after=self._suggested_retry())
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        self._waiting[priority] += 1
+        started = time.monotonic()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # admitted just as the caller gave up
+            else:
+                waiter.cancel()
+                self._waiting[priority] -= 1
+                self._export()
+            if isinstance(e, TimeoutError):
+                self.rejected += 1
+                llm_rejected.labels("wait_timeout").inc()
+                raise LLMBusy("AI 服務排隊逾時，請稍後再試",
+                              retry_after=self._suggested_retry()) from None
+            raise
+        llm_queue_wait.labels(PRIORITY_NAMES.get(priority, str(priority))).observe(time.monotonic() - started)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    # ── Upstream back-pressure ───────────────────────────────────────────────
+
+    def rate_limited(self, retry_after_header: str | None, attempt: int) -> float:
+        """Record a 429/503 and return how long the caller should wait before retrying.
+
+        With Retry-After, admissions pause until it has passed and the caller waits
+        that long plus up to 20% jitter (so released callers do not all retry at
+        once). Without it, the bucket is emptied and the delay is a full-jitter
+        exponential backoff.
+        """
+        self.rate_limited_responses += 1
+        retry_after = parse_retry_after(retry_after_header)
+        now = time.monotonic()
+        if retry_after is not None:
+            self.paused_until = max(self.paused_until, now + retry_after)
+            return retry_after * (1 + random.uniform(0, 0.2))
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+    def _suggested_retry(self) -> float:
+        return max(self.paused_until - time.monotonic(), 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": {name: self._waiting[p] for p, name in PRIORITY_NAMES.items()},
+            "tokens": round(self.tokens, 2),
+            "paused_for": round(max(self.paused_until - time.monotonic(), 0.0), 2),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "rate_limited_responses": self.rate_limited_responses,
+        }
+
+
+llm_limiter = LLMLimiter(LLM_RATE_PER_SEC, LLM_BURST, LLM_MAX_CONCURRENCY,
+                         LLM_MAX_QUEUE, LLM_MAX_QUEUE_WAIT)
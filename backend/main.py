@@ -1,21 +1,18 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 import httpx
 import os
 from dotenv import load_dotenv
 import json
 import asyncio
+import math
+from typing import Literal
 
 # 載入環境變數
 load_dotenv()
 
-# 創建全局 HTTP 客戶端，避免連接池洩漏
-http_client = httpx.AsyncClient(
-    timeout=httpx.Timeout(30.0),  # 30秒超時，適應大數據量載入
-    limits=httpx.Limits(max_connections=10, max_keepalive_connections=5)
-)
-
 app = FastAPI(title="Chart Wizard API", version="2.0.0")
 
 # 原始開發環境 CORS 設定 (保持不變)
@@ -69,7 +66,20 @@ def get_effective_cors_origins():
     # 移除重複項
     return list(set(origins))
 
-# 設置 CORS 中間件
+# 上傳大小限制：先依 Content-Length 拒絕過大的上傳，不必等整個 body 收完
+# （實際位元組數在串流寫入時另行檢查，見 session_data.store_upload）
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    if request.method == "POST" and request.url.path == "/api/v2/upload":
+        length = request.headers.get("content-length", "")
+        if length.isdigit() and int(length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Upload exceeds {UPLOAD_MAX_BYTES // (1024 * 1024)} MB"},
+            )
+    return await call_next(request)
+
+# 設置 CORS 中間件（最後加入＝最外層，413 回應也帶 CORS 標頭）
 app.add_middleware(
     CORSMiddleware,
     allow_origins=get_effective_cors_origins(),
@@ -80,10 +90,12 @@ app.add_middleware(
 
 class PromptRequest(BaseModel):
     prompt: str
+    bypass_cache: bool = False  # 重新生成：略過快取直接詢問 LLM（結果仍會更新快取）
 
 class DataAnalysisRequest(BaseModel):
     headers: list
     data_sample: list
+    bypass_cache: bool = False
     
 class ChartResponse(BaseModel):
     result: str
@@ -115,6 +127,8 @@ class DatabaseSearchResponse(BaseModel):
 
 class DatabaseLoadRequest(BaseModel):
     stat_ids: list[str]
+    viewport_width: int | None = None  # 圖表寬度（CSS px），決定每條序列的點數上限
+    downsample: Literal["lttb", "minmax", "none"] | None = None  # 未指定：有 viewport_width 才降採樣
 
 class TimeSeriesData(BaseModel):
     id: str
@@ -125,14 +139,133 @@ class TimeSeriesData(BaseModel):
 class DatabaseLoadResponse(BaseModel):
     time_series: list[TimeSeriesData]
 
-from v2_routes import router as v2_router
-from config import GEMINI_MODEL
+# 縮放後重新降採樣：來源為 Biz 序列（stat_id）或 v2 圖表結果（result_id + series_index）
+class DownsampleRequest(BaseModel):
+    stat_id: str | None = None
+    result_id: str | None = None
+    series_index: int = 0
+    x_min: float | None = None  # epoch 毫秒（datetime 軸）或 x 值
+    x_max: float | None = None
+    viewport_width: int | None = None
+    mode: Literal["lttb", "minmax"] = "lttb"
+
+class DownsampleResponse(BaseModel):
+    data: list
+    total_points: int
+
+from v2_routes import (router as v2_router, data_contexts, load_chart_result, sandbox_results,
+                       session_janitor, session_store)
+from config import (BIZ_DELTA_PARAM, BIZ_LOAD_DEADLINE, BIZ_MAX_CONCURRENCY, GEMINI_MODEL,
+                    LLM_CACHE_DIR, LLM_CACHE_DISK_MAX_BYTES, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL,
+                    LLM_RATE_LIMIT_RETRIES, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SERIES_CACHE_MAX_BYTES,
+                    SERIES_CACHE_MAX_ROWS, SERIES_CACHE_MAX_STALE, SERIES_CACHE_PATH, SERIES_CACHE_TTL, UPLOAD_FORM_OVERHEAD, UPLOAD_MAX_BYTES)
+from sandbox import sandbox_pool
+from downsample import downsample_dated, downsample_points, point_budget, resolve_mode
+from http_clients import gemini_api_base, http_clients
+from llm_cache import LLMCache, cache_key
+from llm_limiter import BACKGROUND, INTERACTIVE, RETRYABLE_STATUSES, LLMBusy, llm_limiter
+import metrics
+from metrics import StageTimer, cache_lookups, error_kind, upstream_errors, upstream_retries
+import series_formats
+from series_cache import CachedSeries, SeriesCache, merge_points
+from session_data import df_cache
+from ttl_cache import SingleFlight, TTLCache
 app.include_router(v2_router, prefix="/api/v2")
 
+# Biz API 時間序列的持久化快取（SQLite）
+series_cache = SeriesCache(SERIES_CACHE_PATH, SERIES_CACHE_MAX_ROWS, SERIES_CACHE_MAX_BYTES)
+
+# 資料庫搜尋結果快取（正規化後的查詢字串為 key）
+search_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+search_flight = SingleFlight()
+
+# Gemini 回應快取（model + payload 的雜湊為 key）
+llm_cache = LLMCache(LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL, LLM_CACHE_DIR, LLM_CACHE_DISK_MAX_BYTES)
+
 @app.get("/")
 async def root():
     return {"message": "Chart Wizard API is running"}
 
+@app.get("/api/cache-stats")
+async def cache_stats():
+    """
+    各快取與沙盒 worker pool 的命中統計（除 series 與 sessions 的 store/results 外，皆為處理此請求的 worker 行程自己的數字）
+    """
+    return {
+        "pid": os.getpid(),
+        "search": {**search_cache.stats(), "coalesced": search_flight.coalesced},
+        "http": http_clients.stats(),
+        "llm_limiter": llm_limiter.stats(),
+        "llm": llm_cache.stats(),
+        "series": await asyncio.to_thread(series_cache.stats),
+        "session_dataframes": df_cache.stats(),
+        "sandbox_pool": sandbox_pool.stats(),
+        "sandbox_results": sandbox_results.stats(),
+        "data_contexts": data_contexts.stats(),
+        "sessions": await asyncio.to_thread(session_janitor.stats),
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    各階段延遲直方圖與上游重試／錯誤／快取命中計數（Prometheus 文字格式）
+    """
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+async def _call_gemini(api_key: str, payload: dict, priority: int = INTERACTIVE) -> str:
+    """
+    呼叫 Gemini generateContent，返回第一個候選的文字
+    （經 llm_limiter 排隊；429/503 依 Retry-After 退避後重試）
+    """
+    # Gemini API 設置
+    api_url = f"{gemini_api_base()}/v1beta/models/{GEMINI_MODEL}:generateContent?key={api_key}"
+
+    attempt = 0
+    while True:
+        try:
+            async with llm_limiter.slot(priority):
+                response = await http_clients.gemini.post(
+                    api_url,
+                    json=payload,
+                    headers={"Content-Type": "application/json"},
+                    timeout=120.0
+                )
+        except LLMBusy as e:
+            raise HTTPException(status_code=503, detail=str(e),
+                                headers={"Retry-After": str(math.ceil(e.retry_after))})
+        except httpx.RequestError as e:
+            upstream_errors.labels("gemini", error_kind(e)).inc()
+            raise
+
+        if response.status_code in RETRYABLE_STATUSES and attempt < LLM_RATE_LIMIT_RETRIES:
+            upstream_errors.labels("gemini", error_kind(response.status_code)).inc()
+            upstream_retries.labels("gemini").inc()
+            await asyncio.sleep(llm_limiter.rate_limited(response.headers.get("Retry-After"), attempt))
+            attempt += 1
+            continue
+        break
+
+    if not response.is_success:
+        upstream_errors.labels("gemini", error_kind(response.status_code)).inc()
+        error_detail = response.json() if response.content else "Unknown error"
+        retry_after = response.headers.get("Retry-After")
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"API request failed: {error_detail}",
+            headers={"Retry-After": retry_after} if retry_after else None
+        )
+    
+    result = response.json()
+    
+    # 解析回應
+    if (result.get("candidates") and 
+        result["candidates"][0].get("content") and 
+        result["candidates"][0]["content"].get("parts") and 
+        result["candidates"][0]["content"]["parts"][0].get("text")):
+        
+        return result["candidates"][0]["content"]["parts"][0]["text"]
+    raise HTTPException(status_code=500, detail="Invalid or empty response from API")
+
 @app.post("/api/analyze-data", response_model=ChartSuggestionResponse)
 async def analyze_data(request: DataAnalysisRequest):
     """
@@ -193,75 +326,68 @@ async def analyze_data(request: DataAnalysisRequest):
         只返回JSON，不要包含任何額外文字。
     """
     
-    # Gemini API 設置
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={api_key}"
-
     payload = {
         "contents": [{"role": "user", "parts": [{"text": analysis_prompt}]}],
         "generationConfig": {"responseMimeType": "application/json"}
     }
     
+    timer = StageTimer("analyze_data")
     try:
-        response = await http_client.post(
-            api_url,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=120.0
-        )
-        
-        if not response.is_success:
-            error_detail = response.json() if response.content else "Unknown error"
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"API request failed: {error_detail}"
-            )
-        
-        result = response.json()
-        
-        # 解析回應
-        if (result.get("candidates") and 
-            result["candidates"][0].get("content") and 
-            result["candidates"][0]["content"].get("parts") and 
-            result["candidates"][0]["content"]["parts"][0].get("text")):
-            
-            # 解析 JSON 回應
-            llm_response = result["candidates"][0]["content"]["parts"][0]["text"]
-            try:
-                parsed_response = json.loads(llm_response)
-                
-                # 驗證回應格式
-                if not all(key in parsed_response for key in ["description", "recommended_chart_type", "confidence"]):
-                    raise ValueError("回應格式不完整")
-                
-                # 驗證圖表類型
-                valid_types = ["line", "column", "area", "pie", "scatter", "stacked_column", "spline", "donut", "bubble", "waterfall", "combo"]
-                if parsed_response["recommended_chart_type"] not in valid_types:
-                    # 如果類型無效，使用預設值
-                    parsed_response["recommended_chart_type"] = "column"
-                    parsed_response["confidence"] = 0.5
-                
-                return ChartSuggestionResponse(
-                    description=parsed_response["description"],
-                    recommended_chart_type=parsed_response["recommended_chart_type"],
-                    confidence=float(parsed_response["confidence"])
-                )
-                
-            except (json.JSONDecodeError, ValueError, KeyError) as e:
-                # 如果解析失敗，返回預設值
-                return ChartSuggestionResponse(
-                    description="請根據您的數據特性描述想要的圖表類型和樣式",
-                    recommended_chart_type="column",
-                    confidence=0.5
-                )
+        key = cache_key(GEMINI_MODEL, payload)
+        cached = None
+        if not request.bypass_cache:
+            with timer.stage("cache_lookup"):
+                cached = await asyncio.to_thread(llm_cache.get, key)
+            cache_lookups.labels("gemini", "miss" if cached is None else "hit").inc()
+        if cached is not None:
+            llm_response = cached
         else:
-            raise HTTPException(status_code=500, detail="Invalid or empty response from API")
+            with timer.stage("llm"):
+                # 建議描述屬背景請求，讓位給使用者正在等待的圖表生成
+                llm_response = await _call_gemini(api_key, payload, priority=BACKGROUND)
+
+        # 解析 JSON 回應
+        try:
+            parsed_response = json.loads(llm_response)
+            
+            # 驗證回應格式
+            if not all(key in parsed_response for key in ["description", "recommended_chart_type", "confidence"]):
+                raise ValueError("回應格式不完整")
             
+            suggestion = ChartSuggestionResponse(
+                description=parsed_response["description"],
+                recommended_chart_type=parsed_response["recommended_chart_type"],
+                confidence=float(parsed_response["confidence"])
+            )
+        except (json.JSONDecodeError, ValueError, KeyError, TypeError) as e:
+            # 如果解析失敗，返回預設值（不寫入快取，下次重新詢問）
+            return ChartSuggestionResponse(
+                description="請根據您的數據特性描述想要的圖表類型和樣式",
+                recommended_chart_type="column",
+                confidence=0.5
+            )
+
+        if cached is None:
+            await asyncio.to_thread(llm_cache.put, key, llm_response)
+
+        # 驗證圖表類型
+        valid_types = ["line", "column", "area", "pie", "scatter", "stacked_column", "spline", "donut", "bubble", "waterfall", "combo"]
+        if suggestion.recommended_chart_type not in valid_types:
+            # 如果類型無效，使用預設值
+            suggestion.recommended_chart_type = "column"
+            suggestion.confidence = 0.5
+        return suggestion
+            
+    except HTTPException:
+        raise
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Request timeout")
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"Request error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    finally:
+        timer.finish()
 
 @app.post("/api/generate-chart", response_model=ChartResponse)
 async def generate_chart(request: PromptRequest):
@@ -272,110 +398,267 @@ async def generate_chart(request: PromptRequest):
     if not api_key:
         raise HTTPException(status_code=500, detail="Gemini API key is not configured")
     
-    # Gemini API 設置
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={api_key}"
-
     payload = {
         "contents": [{"role": "user", "parts": [{"text": request.prompt}]}],
         "generationConfig": {"responseMimeType": "text/plain"}
     }
     
+    timer = StageTimer("generate_chart")
     try:
-        response = await http_client.post(
-            api_url,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=120.0
-        )
-        
-        if not response.is_success:
-            error_detail = response.json() if response.content else "Unknown error"
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"API request failed: {error_detail}"
-            )
-        
-        result = response.json()
-        
-        # 解析回應
-        if (result.get("candidates") and 
-            result["candidates"][0].get("content") and 
-            result["candidates"][0]["content"].get("parts") and 
-            result["candidates"][0]["content"]["parts"][0].get("text")):
-            
-            return ChartResponse(result=result["candidates"][0]["content"]["parts"][0]["text"])
-        else:
-            raise HTTPException(status_code=500, detail="Invalid or empty response from API")
+        key = cache_key(GEMINI_MODEL, payload)
+        if not request.bypass_cache:
+            with timer.stage("cache_lookup"):
+                cached = await asyncio.to_thread(llm_cache.get, key)
+            cache_lookups.labels("gemini", "miss" if cached is None else "hit").inc()
+            if cached is not None:
+                return ChartResponse(result=cached)
+
+        with timer.stage("llm"):
+            text = await _call_gemini(api_key, payload)
+        await asyncio.to_thread(llm_cache.put, key, text)
+        return ChartResponse(result=text)
             
+    except HTTPException:
+        raise
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Request timeout")
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"Request error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    finally:
+        timer.finish()
+
+def _normalize_query(query: str) -> str:
+    """
+    搜尋快取與 single-flight 的 key：去頭尾空白、合併連續空白
+    （保留大小寫：Lucene 的 AND/OR/NOT 運算子與 string 欄位皆區分大小寫）
+    """
+    return " ".join(query.split())
+
+async def _query_solr(solr_url: str, query: str) -> DatabaseSearchResponse:
+    """
+    向 Solr 查詢並整理結果（逾時重試一次）
+    """
+    for attempt in range(2):  # 最多重試1次
+        try:
+            # 查詢字串交給 httpx 編碼，避免空白、&、# 等字元破壞 URL
+            response = await http_clients.solr.get(solr_url, params={'q': query})
+        except httpx.TimeoutException as e:
+            upstream_errors.labels("solr", error_kind(e)).inc()
+            if attempt == 1:  # 最後一次重試
+                raise
+            upstream_retries.labels("solr").inc()
+            continue  # 重試一次
+        except httpx.RequestError as e:
+            upstream_errors.labels("solr", error_kind(e)).inc()
+            raise
+
+        if not response.is_success:
+            upstream_errors.labels("solr", error_kind(response.status_code)).inc()
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Solr API request failed: {response.status_code}"
+            )
+
+        data = response.json()
+
+        # 提取並格式化搜尋結果
+        items = []
+        for doc in data.get('response', {}).get('docs', []):
+            # 返回所有公開的數據（包括免費和付費）
+            if doc.get('is_public') == 1:
+                items.append(DatabaseItem(
+                    id=str(doc.get('id', '')),
+                    name_tc=doc.get('name_tc', ''),
+                    name_en=doc.get('name_en', ''),
+                    country=doc.get('country', ''),
+                    min_date=doc.get('min_date', ''),
+                    max_date=doc.get('max_date', ''),
+                    frequency=doc.get('frequency', ''),
+                    units=doc.get('units', ''),
+                    currency=doc.get('currency', ''),
+                    score=float(doc.get('score', 0))
+                ))
+
+        return DatabaseSearchResponse(items=items)
 
 @app.post("/api/search-database", response_model=DatabaseSearchResponse)
 async def search_database(request: DatabaseSearchRequest):
     """
-    搜尋資料庫數據
+    搜尋資料庫數據（TTL+LRU 快取；相同查詢同時進行時只打一次 Solr）
     """
     solr_url = os.getenv("SOLR_API_URL")
     if not solr_url:
         raise HTTPException(status_code=500, detail="Solr API URL not configured")
     
-    query = request.query
-    full_url = f"{solr_url}?q={query}"
-    
+    # 正規化後的字串只作為快取 key，送往 Solr 的是使用者原本的查詢（僅去頭尾空白）
+    query = request.query.strip()
+    key = _normalize_query(query)
+    cached = search_cache.get(key)
+    cache_lookups.labels("solr", "miss" if cached is None else "hit").inc()
+    if cached is not None:
+        return cached
+
+    timer = StageTimer("search_database")
     try:
-        # 使用全局 HTTP 客戶端，帶重試機制
-        for attempt in range(2):  # 最多重試1次
-            try:
-                response = await http_client.get(full_url)
-                
-                if not response.is_success:
-                    raise HTTPException(
-                        status_code=response.status_code,
-                        detail=f"Solr API request failed: {response.status_code}"
-                    )
-                
-                data = response.json()
-                
-                # 提取並格式化搜尋結果
-                items = []
-                for doc in data.get('response', {}).get('docs', []):
-                    # 返回所有公開的數據（包括免費和付費）
-                    if doc.get('is_public') == 1:
-                        items.append(DatabaseItem(
-                            id=str(doc.get('id', '')),
-                            name_tc=doc.get('name_tc', ''),
-                            name_en=doc.get('name_en', ''),
-                            country=doc.get('country', ''),
-                            min_date=doc.get('min_date', ''),
-                            max_date=doc.get('max_date', ''),
-                            frequency=doc.get('frequency', ''),
-                            units=doc.get('units', ''),
-                            currency=doc.get('currency', ''),
-                            score=float(doc.get('score', 0))
-                        ))
-                
-                return DatabaseSearchResponse(items=items)
-                
-            except httpx.TimeoutException:
-                if attempt == 1:  # 最後一次重試
-                    raise HTTPException(status_code=504, detail="Request timeout after retry")
-                continue  # 重試一次
-            
+        with timer.stage("solr"):
+            result = await search_flight.do(key, lambda: _query_solr(solr_url, query))
+    except HTTPException:
+        raise
     except httpx.TimeoutException:
-        raise HTTPException(status_code=504, detail="Request timeout")
+        raise HTTPException(status_code=504, detail="Request timeout after retry")
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"Request error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    finally:
+        timer.finish()
+
+    search_cache.set(key, result)
+    return result
+
+# Biz 拒絕 delta 參數（4xx）後，本行程不再送出
+_delta_rejected = False
+
+async def _request_points(stat_id: str, biz_url: str, headers: dict, params: dict,
+                          semaphore: asyncio.Semaphore, delta: bool = False) -> list[dict] | None:
+    """
+    向 Biz API 取得單一 stat_id 的資料點（最多 3 次嘗試，4xx 不重試）；失敗回傳 None，不影響其他序列
+    """
+    global _delta_rejected
+    full_url = f"{biz_url}/{stat_id}"
+
+    try:
+        for attempt in range(3):  # 最多重試2次（總共3次嘗試）
+            try:
+                if attempt > 0:
+                    upstream_retries.labels("biz").inc()
+                    # 重試前等待，避免立即重試（等待時不佔用併發名額）
+                    await asyncio.sleep(1.0 * attempt)  # 1秒、2秒延遲
+
+                async with semaphore:
+                    response = await http_clients.biz.get(full_url, headers=headers, params=params)
+
+                if not response.is_success:
+                    upstream_errors.labels("biz", error_kind(response.status_code)).inc()
+                    print(f"Failed to load data for stat_id {stat_id}: {response.status_code}")
+                    if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                        # 請求本身有誤，重試也不會成功
+                        if delta:
+                            _delta_rejected = True
+                            print(f"Biz rejected {BIZ_DELTA_PARAM!r}, using full history from now on")
+                        break
+                    continue  # 重試
+
+                data = response.json()
+
+                # 轉換為時間序列格式
+                time_series_data = []
+                for point in data.get('series', []):
+                    time_series_data.append({
+                        'date': point.get('date', ''),
+                        'value': point.get('val', 0)
+                    })
+
+                # 排序數據（按日期升序）
+                time_series_data.sort(key=lambda x: x['date'])
+                return time_series_data
+
+            except httpx.TimeoutException as e:
+                upstream_errors.labels("biz", error_kind(e)).inc()
+                if attempt == 2:  # 最後一次重試
+                    print(f"Timeout loading data for stat_id {stat_id} after {attempt + 1} attempts")
+                    break
+                print(f"Timeout on attempt {attempt + 1} for stat_id {stat_id}, retrying...")
+                continue  # 重試
+
+    except httpx.RequestError as e:
+        upstream_errors.labels("biz", error_kind(e)).inc()
+        print(f"Request error loading data for stat_id {stat_id}: {str(e)}")
+    except Exception as e:
+        print(f"Unexpected error loading data for stat_id {stat_id}: {str(e)}")
+    return None
+
+async def _refresh_series(stat_id: str, cached: CachedSeries | None, biz_url: str,
+                          headers: dict, semaphore: asyncio.Semaphore) -> CachedSeries | None:
+    """
+    重新抓取並寫入快取：有快取時只要求 max_date 之後的資料點（delta），失敗再退回完整歷史
+    """
+    if cached is not None and cached.max_date and BIZ_DELTA_PARAM and not _delta_rejected:
+        params = {'history': 'true', BIZ_DELTA_PARAM: cached.max_date}
+        delta = await _request_points(stat_id, biz_url, headers, params, semaphore, delta=True)
+        if delta is not None:
+            series_cache.delta_refreshes += 1
+            merged = merge_points(cached.points, delta, cached.max_date)
+            return await asyncio.to_thread(series_cache.put, stat_id, merged)
+
+    points = await _request_points(stat_id, biz_url, headers, {'history': 'true'}, semaphore)
+    if points is None:
+        return None
+    series_cache.full_refreshes += 1
+    return await asyncio.to_thread(series_cache.put, stat_id, points)
+
+# 背景更新（stale-while-revalidate）：同一 stat_id 同時只會有一個更新任務
+_revalidating: set[str] = set()
+_background_tasks: set[asyncio.Task] = set()
+_revalidate_semaphore = asyncio.Semaphore(BIZ_MAX_CONCURRENCY)
+
+async def _revalidate(cached: CachedSeries, biz_url: str, headers: dict):
+    try:
+        await _refresh_series(cached.stat_id, cached, biz_url, headers, _revalidate_semaphore)
+    finally:
+        _revalidating.discard(cached.stat_id)
+
+def _schedule_revalidate(cached: CachedSeries, biz_url: str, headers: dict):
+    if cached.stat_id in _revalidating:
+        return
+    _revalidating.add(cached.stat_id)
+    task = asyncio.create_task(_revalidate(cached, biz_url, headers))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def _to_time_series(stat_id: str, points: list[dict]) -> TimeSeriesData:
+    return TimeSeriesData(
+        id=stat_id,
+        name_tc=f"數據系列 {stat_id}",  # 暫時使用，後續可以從搜尋結果中獲取
+        name_en=f"Data Series {stat_id}",
+        data=points
+    )
+
+async def _load_series(stat_id: str, biz_url: str, headers: dict,
+                       semaphore: asyncio.Semaphore) -> TimeSeriesData | None:
+    """
+    載入單一序列：新鮮快取直接回傳；過期但在 SERIES_CACHE_MAX_STALE 內先回傳舊資料並背景更新；
+    其餘情況同步抓取
+    """
+    cached = await asyncio.to_thread(series_cache.get, stat_id)
+    if cached is not None and cached.age < SERIES_CACHE_TTL:
+        series_cache.hits += 1
+        cache_lookups.labels("biz", "hit").inc()
+        return _to_time_series(stat_id, cached.points)
+    if cached is not None and cached.age < SERIES_CACHE_MAX_STALE:
+        series_cache.stale_hits += 1
+        cache_lookups.labels("biz", "stale").inc()
+        _schedule_revalidate(cached, biz_url, headers)
+        return _to_time_series(stat_id, cached.points)
+
+    series_cache.misses += 1
+    cache_lookups.labels("biz", "miss").inc()
+    entry = await _refresh_series(stat_id, cached, biz_url, headers, semaphore)
+    if entry is None and cached is not None:
+        print(f"Refresh failed for stat_id {stat_id}, serving cached data from {cached.age:.0f}s ago")
+        entry = cached
+    return _to_time_series(stat_id, entry.points) if entry is not None else None
 
 @app.post("/api/load-database-data", response_model=DatabaseLoadResponse)
-async def load_database_data(request: DatabaseLoadRequest):
+async def load_database_data(request: DatabaseLoadRequest, response: Response,
+                             accept: str | None = Header(None)):
     """
-    載入選定的資料庫數據
+    載入選定的資料庫數據（併發載入，受 BIZ_MAX_CONCURRENCY 與 BIZ_LOAD_DEADLINE 限制；
+    經由 SQLite 序列快取）
+
+    回應格式依 Accept 標頭協商（預設為原本的 JSON），見 series_formats.py
     """
     biz_url = os.getenv("BIZ_API_URL")
     biz_api_key = os.getenv("BIZ_API_KEY")
@@ -387,74 +670,104 @@ async def load_database_data(request: DatabaseLoadRequest):
         raise HTTPException(status_code=400, detail="最多只能載入15筆資料")
     
     headers = {'X-Api-Key': biz_api_key}
-    params = {'history': 'true'}
-    
+    semaphore = asyncio.Semaphore(BIZ_MAX_CONCURRENCY)
+    timer = StageTimer("load_database_data")
+
+    tasks = [
+        asyncio.create_task(_load_series(stat_id, biz_url, headers, semaphore))
+        for stat_id in request.stat_ids
+    ]
+    with timer.stage("fetch"):
+        done, pending = await asyncio.wait(tasks, timeout=BIZ_LOAD_DEADLINE)
+    for task in pending:
+        task.cancel()
+    if pending:
+        print(f"Load deadline ({BIZ_LOAD_DEADLINE}s) reached, dropped {len(pending)} series")
+
+    # 依請求順序回傳，略過失敗或逾時的序列（單一序列的例外，例如快取讀寫錯誤，只丟棄該序列）
     results = []
-    
-    for stat_id in request.stat_ids:
-        full_url = f"{biz_url}/{stat_id}"
-        
-        try:
-            # 使用全局 HTTP 客戶端，帶重試機制
-            for attempt in range(3):  # 最多重試2次（總共3次嘗試）
-                try:
-                    if attempt > 0:
-                        # 重試前等待，避免立即重試
-                        await asyncio.sleep(1.0 * attempt)  # 1秒、2秒延遲
-                    
-                    response = await http_client.get(full_url, headers=headers, params=params)
-                    
-                    if not response.is_success:
-                        print(f"Failed to load data for stat_id {stat_id}: {response.status_code}")
-                        if attempt == 2:  # 最後一次嘗試
-                            break
-                        continue  # 重試
-                    
-                    data = response.json()
-                    
-                    # 轉換為時間序列格式
-                    time_series_data = []
-                    for point in data.get('series', []):
-                        time_series_data.append({
-                            'date': point.get('date', ''),
-                            'value': point.get('val', 0)
-                        })
-                    
-                    # 排序數據（按日期升序）
-                    time_series_data.sort(key=lambda x: x['date'])
-                    
-                    results.append(TimeSeriesData(
-                        id=stat_id,
-                        name_tc=f"數據系列 {stat_id}",  # 暫時使用，後續可以從搜尋結果中獲取
-                        name_en=f"Data Series {stat_id}",
-                        data=time_series_data
-                    ))
-                    break  # 成功後跳出重試循環
-                    
-                except httpx.TimeoutException:
-                    if attempt == 2:  # 最後一次重試
-                        print(f"Timeout loading data for stat_id {stat_id} after {attempt + 1} attempts")
-                        break
-                    print(f"Timeout on attempt {attempt + 1} for stat_id {stat_id}, retrying...")
-                    continue  # 重試
-                
-        except httpx.TimeoutException:
-            print(f"Timeout loading data for stat_id {stat_id}")
-            continue
-        except httpx.RequestError as e:
-            print(f"Request error loading data for stat_id {stat_id}: {str(e)}")
+    for stat_id, task in zip(request.stat_ids, tasks):
+        if task not in done:
             continue
+        try:
+            series = task.result()
         except Exception as e:
-            print(f"Unexpected error loading data for stat_id {stat_id}: {str(e)}")
+            print(f"Dropped stat_id {stat_id}: {type(e).__name__}: {e}")
             continue
-    
+        if series is not None:
+            results.append(series)
+    mode = resolve_mode(request.downsample, request.viewport_width)
+    if mode != "none":
+        budget = point_budget(request.viewport_width)
+        with timer.stage("downsample"):
+            results = [
+                series.model_copy(update={"data": downsample_dated(series.data, budget, mode)})
+                for series in results
+            ]
+
+    media_type = series_formats.negotiate(accept)
+    if media_type != series_formats.JSON:
+        with timer.stage("encode"):
+            body = await asyncio.to_thread(series_formats.encode, media_type, results)
+        timer.finish()
+        return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+    response.headers["Vary"] = "Accept"
+    timer.finish()
     return DatabaseLoadResponse(time_series=results)
 
+@app.post("/api/downsample", response_model=DownsampleResponse)
+async def downsample_series(request: DownsampleRequest):
+    """
+    依縮放範圍重新降採樣單一序列（從伺服器端的完整資料，而非瀏覽器上已降採樣的點）
+    """
+    x_range = (request.x_min, request.x_max)
+    budget = point_budget(request.viewport_width)
+
+    if request.stat_id is not None:
+        cached = await asyncio.to_thread(series_cache.get, request.stat_id)
+        if cached is None:
+            raise HTTPException(status_code=404, detail="Series not loaded; call /api/load-database-data first")
+        data = await asyncio.to_thread(downsample_dated, cached.points, budget, request.mode, x_range)
+        return DownsampleResponse(data=data, total_points=len(cached.points))
+
+    if request.result_id is not None:
+        config = await asyncio.to_thread(load_chart_result, request.result_id)
+        series = config.get("series") if isinstance(config, dict) else None
+        if not isinstance(series, list):
+            raise HTTPException(status_code=404, detail="Chart result expired; please regenerate")
+        if not 0 <= request.series_index < len(series) or not isinstance(series[request.series_index], dict):
+            raise HTTPException(status_code=400, detail="series_index out of range")
+        s = series[request.series_index]
+        full = s.get("data") or []
+        data = await asyncio.to_thread(
+            downsample_points, full, budget, request.mode,
+            s.get("pointStart", 0) or 0, s.get("pointInterval", 1) or 1, x_range)
+        if data is None:
+            raise HTTPException(status_code=422, detail="This series cannot be downsampled")
+        return DownsampleResponse(data=data, total_points=len(full))
+
+    raise HTTPException(status_code=400, detail="stat_id or result_id is required")
+
+# 應用程序啟動時預熱沙盒 worker 與上游連線、啟動 session 清理（背景進行，不阻塞啟動）
+@app.on_event("startup")
+async def startup_event():
+    """應用程序啟動時預熱 v2 沙盒 worker pool 與 Gemini/Solr/Biz 連線，並啟動 session janitor"""
+    sandbox_pool.start()
+    session_janitor.start()
+    task = asyncio.create_task(http_clients.warm())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
 # 應用程序關閉時清理資源
 @app.on_event("shutdown")
 async def shutdown_event():
-    """應用程序關閉時清理HTTP客戶端"""
-    await http_client.aclose()
+    """應用程序關閉時清理HTTP客戶端、session janitor、沙盒 worker、序列快取與 session 儲存"""
+    await session_janitor.stop()
+    await http_clients.aclose()
+    sandbox_pool.close()
+    series_cache.close()
+    session_store.close()
+    metrics.mark_process_dead()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,138 @@
+"""
+Latency histograms and counters (prometheus_client), exposed at /metrics.
+
+    chartwizard_stage_seconds{endpoint, stage}       per-stage latency (see StageTimer)
+    chartwizard_upstream_retries_total{upstream}     retried Gemini / Solr / Biz calls
+    chartwizard_upstream_errors_total{upstream, kind}  kind: timeout, network, rate_limited, http_4xx/5xx
+    chartwizard_cache_lookups_total{upstream, result}  result: hit, stale, miss
+    chartwizard_generate_retries_total{reason}       v2 self-correction rounds
+    chartwizard_generate_candidates_total{outcome}   v2 code candidates: won, failed, cancelled
+    chartwizard_llm_queue_depth{priority}            Gemini calls waiting for admission (llm_limiter)
+    chartwizard_llm_in_flight                        Gemini calls admitted and not finished
+    chartwizard_llm_queue_wait_seconds{priority}     time from asking for a slot to admission
+    chartwizard_llm_rejected_total{reason}           reason: queue_full, wait_timeout
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+(shared by the workers, emptied before each start): every worker then writes its
+values there and /metrics, whichever worker serves it, reports the sum over all
+of them. Without it, each worker reports only its own values.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import httpx
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, disable_created_metrics, generate_latest,
+                               multiprocess)
+
+disable_created_metrics()  # no *_created series: same output as before the switch
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Seconds; spans a cache hit (~1 ms) to a slow multi-retry generation (~2 min)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+stage_seconds = Histogram(
+    "chartwizard_stage_seconds", "Time spent in each stage of a request.",
+    ("endpoint", "stage"), buckets=DEFAULT_BUCKETS)
+upstream_retries = Counter(
+    "chartwizard_upstream_retries", "Upstream calls retried after a failure.",
+    ("upstream",))
+upstream_errors = Counter(
+    "chartwizard_upstream_errors", "Failed upstream calls by kind.",
+    ("upstream", "kind"))
+cache_lookups = Counter(
+    "chartwizard_cache_lookups", "Cache lookups in front of upstream calls.",
+    ("upstream", "result"))
+generate_retries = Counter(
+    "chartwizard_generate_retries",
+    "v2 generate self-correction rounds by the reason the previous attempt failed.",
+    ("reason",))
+candidate_outcomes = Counter(
+    "chartwizard_generate_candidates",
+    "v2 generate code candidates by outcome (won, failed, cancelled).",
+    ("outcome",))
+# Gauges of live state: summed over the running workers in multiprocess mode
+llm_queue_depth = Gauge(
+    "chartwizard_llm_queue_depth", "Gemini calls waiting for admission.", ("priority",),
+    multiprocess_mode="livesum")
+llm_in_flight = Gauge(
+    "chartwizard_llm_in_flight", "Gemini calls admitted and not yet finished.",
+    multiprocess_mode="livesum")
+llm_queue_wait = Histogram(
+    "chartwizard_llm_queue_wait_seconds", "Time a Gemini call waited for admission.",
+    ("priority",), buckets=DEFAULT_BUCKETS)
+llm_rejected = Counter(
+    "chartwizard_llm_rejected", "Gemini calls refused admission by reason.",
+    ("reason",))
+
+
+def render() -> bytes:
+    """The /metrics body: this process's metrics, or every worker's in multiprocess mode."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead() -> None:
+    """Drop this worker's live gauges from the shared directory (call on shutdown)."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def error_kind(error: Exception | int) -> str:
+    """Label for upstream_errors: an HTTP status code or an httpx exception."""
+    if isinstance(error, int):
+        if error == 429:
+            return "rate_limited"
+        return "http_5xx" if error >= 500 else "http_4xx"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.RequestError):
+        return "network"
+    return "other"
+
+
+class StageTimer:
+    """Per-request stage durations, mirrored into chartwizard_stage_seconds.
+
+        timer = StageTimer("generate")
+        with timer.stage("validate"):
+            ...
+        timer.record("ttft", seconds)   # for stages that do not fit a with-block
+        timer.finish()                  # records "total" since construction
+        timer.as_ms()                   # {"validate": 1.2, ..., "total": 850.0}
+
+    A stage recorded more than once (e.g. once per retry) is summed in as_ms(),
+    while the histogram gets one observation each time.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        stage_seconds.labels(self.endpoint, stage).observe(seconds)
+
+    @contextmanager
+    def stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def finish(self) -> float:
+        total = time.perf_counter() - self.started
+        if "total" not in self.stages:
+            self.record("total", total)
+        return total
+
+    def as_ms(self) -> dict[str, float]:
+        return {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
@@ -0,0 +1,96 @@
+"""
+One-pass column profiling shared by /upload (UploadResponse.columns) and the LLM
+data context.
+
+Each column is scanned once: dropna() gives the null count, unique() on the
+non-null values gives the distinct count and samples, and numeric/datetime ranges
+are taken from those uniques instead of the full column. The profile is stored
+with the session so /generate does not profile the data again.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+SAMPLE_COUNT = 5
+# Distinct string values test-parsed to decide whether a text column holds dates
+DATETIME_PROBE = 200
+DATETIME_MIN_RATIO = 0.95
+
+
+class ColumnProfile(BaseModel):
+    name: str
+    dtype: str
+    null_count: int
+    unique_count: int
+    sample_values: list          # JSON-safe first few distinct values
+    sample_reprs: list[str]      # repr() of the same values, for the LLM context
+    is_numeric: bool = False
+    min_value: float | None = None
+    max_value: float | None = None
+    datetime_parseable: bool = False
+    datetime_min: str | None = None
+    datetime_max: str | None = None
+
+
+class DataProfile(BaseModel):
+    row_count: int
+    columns: list[ColumnProfile]
+
+
+def _json_safe(v):
+    return v if isinstance(v, (int, float, bool)) else str(v)
+
+
+def _parse_dates(values) -> pd.Series:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return pd.Series(pd.to_datetime(pd.Series(values, dtype=object),
+                                        errors="coerce", format="mixed"))
+
+
+def _profile_column(name, s: pd.Series) -> ColumnProfile:
+    non_null = s.dropna()
+    uniques = non_null.unique()
+    sample = uniques[:SAMPLE_COUNT].tolist()
+    profile = ColumnProfile(
+        name=str(name),
+        dtype=str(s.dtype),
+        null_count=len(s) - len(non_null),
+        unique_count=len(uniques),
+        sample_values=[_json_safe(v) for v in sample],
+        sample_reprs=[repr(v) for v in sample],
+    )
+    if len(uniques) == 0:
+        return profile
+
+    kind = s.dtype.kind
+    if kind in "iuf":
+        values = np.asarray(uniques, dtype="float64")
+        profile.is_numeric = True
+        profile.min_value = float(values.min())
+        profile.max_value = float(values.max())
+    elif kind == "M":
+        profile.datetime_parseable = True
+        profile.datetime_min = pd.Timestamp(uniques.min()).isoformat()
+        profile.datetime_max = pd.Timestamp(uniques.max()).isoformat()
+    elif kind in "OUT" and all(isinstance(v, str) for v in uniques[:DATETIME_PROBE]):
+        # Text that looks like dates: probe a bounded set of distinct values, then
+        # take the range over all distinct values only if the probe passes
+        probe = _parse_dates(uniques[:DATETIME_PROBE])
+        if probe.notna().mean() >= DATETIME_MIN_RATIO:
+            parsed = probe if len(uniques) <= DATETIME_PROBE else _parse_dates(uniques)
+            parsed = parsed.dropna()
+            if len(parsed) and len(parsed) >= DATETIME_MIN_RATIO * len(uniques):
+                profile.datetime_parseable = True
+                profile.datetime_min = parsed.min().isoformat()
+                profile.datetime_max = parsed.max().isoformat()
+    return profile
+
+
+def build_profile(df: pd.DataFrame) -> DataProfile:
+    return DataProfile(
+        row_count=len(df),
+        columns=[_profile_column(col, df.iloc[:, i]) for i, col in enumerate(df.columns)],
+    )
@@ -0,0 +1,389 @@
+"""
+v2 code-execution sandbox.
+
+`run_sandbox` executes generated code either on a pre-warmed worker from the pool
+(pandas already imported, each job in its own forked child; see sandbox_worker.py)
+or, when no idle worker is available, in a cold `python -c` subprocess as before.
+Workers are recycled after SANDBOX_WORKER_MAX_JOBS jobs or after any failed job.
+
+Both paths run each job under rlimits (address space, CPU time, open files, output
+size; SANDBOX_MAX_* in config.py). A job that hits one raises SandboxLimitExceeded
+rather than returning its partial output.
+
+A SandboxHandle passed to run_sandbox lets another thread stop the job: the cold
+subprocess is killed, or the pooled worker is told to kill its forked child (the
+worker itself stays in the pool). The run then raises SandboxCancelled.
+"""
+import contextlib
+import json
+import logging
+import os
+import queue
+import selectors
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from config import (SANDBOX_MAX_CPU_SECONDS, SANDBOX_MAX_MEMORY_BYTES, SANDBOX_MAX_OPEN_FILES,
+                    SANDBOX_MAX_OUTPUT_BYTES, SANDBOX_POOL_SIZE, SANDBOX_WORKER_MAX_JOBS)
+
+WORKER_SCRIPT = Path(__file__).with_name("sandbox_worker.py")
+WORKER_START_TIMEOUT = 60  # seconds to import pandas on a cold pod
+# Extra time the pool waits for a worker's reply beyond the job's own timeout
+WORKER_REPLY_GRACE = 5
+
+logger = logging.getLogger(__name__)
+
+
+# Per-job rlimits, in the worker's job format (see sandbox_worker._apply_limits); also
+# what _limit_hit classifies a finished job against
+JOB_LIMITS = {
+    "memory": SANDBOX_MAX_MEMORY_BYTES,
+    "cpu": SANDBOX_MAX_CPU_SECONDS,
+    "files": SANDBOX_MAX_OPEN_FILES,
+    "output": SANDBOX_MAX_OUTPUT_BYTES,
+}
+
+
+class SandboxLimitExceeded(RuntimeError):
+    """The job was stopped by one of its resource limits."""
+
+    def __init__(self, limit: str, value: int):
+        super().__init__(f"sandbox {limit} limit exceeded ({value})")
+        self.limit = limit  # "memory", "cpu", "output" or "open_files"
+        self.value = value  # the configured limit (bytes, seconds or files)
+
+
+class SandboxCancelled(RuntimeError):
+    """The job was stopped through its SandboxHandle."""
+
+
+class SandboxHandle:
+    """Kill switch for one run_sandbox call, usable from any thread, before or during the run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kill: Callable[[], None] | None = None
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            kill, self._kill = self._kill, None
+        if kill is not None:
+            kill()
+
+    def _attach(self, kill: Callable[[], None]) -> None:
+        """Register how to stop the running job; runs it at once if already cancelled."""
+        with self._lock:
+            if not self.cancelled:
+                self._kill = kill
+                return
+        kill()
+
+    def _detach(self) -> None:
+        with self._lock:
+            self._kill = None
+
+
+def _limit_hit(limits: dict, returncode: int, stderr: str, stdout_bytes: int,
+               cpu_seconds: float | None = None) -> SandboxLimitExceeded | None:
+    """Which of its limits (the JOB_LIMITS it was run with), if any, a finished
+    (not timed-out) job ran into.
+
+    CPU: killed by SIGXCPU, or by SIGKILL after using the whole CPU budget (the hard
+    limit); any other SIGKILL (OOM killer, an operator) is not a CPU limit. Output:
+    stdout reached the file-size cap, whatever the exit status (a failed final flush
+    can still exit 0). Memory / open files: the interpreter's own error at the end
+    of the traceback.
+    """
+    if limits.get("cpu") and (returncode == -signal.SIGXCPU or (
+            returncode == -signal.SIGKILL and cpu_seconds is not None
+            and cpu_seconds >= limits["cpu"])):
+        return SandboxLimitExceeded("cpu", limits["cpu"])
+    if limits.get("output") and stdout_bytes >= limits["output"]:
+        return SandboxLimitExceeded("output", limits["output"])
+    if returncode != 0:
+        tail = stderr[-2000:]
+        if limits.get("memory") and ("MemoryError" in tail or "Unable to allocate" in tail):
+            return SandboxLimitExceeded("memory", limits["memory"])
+        if limits.get("files") and "Too many open files" in tail:
+            return SandboxLimitExceeded("open_files", limits["files"])
+    return None
+
+
+def _sandbox_env() -> dict:
+    return {**os.environ, "PYTHONPATH": ""}
+
+
+def _wait_cold(proc: subprocess.Popen, timeout: float) -> float:
+    """Reap proc (killing it past timeout: TimeoutExpired) and return its CPU seconds."""
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    while True:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return usage.ru_utime + usage.ru_stime
+        if time.monotonic() >= deadline:
+            proc.kill()
+            _, status, _ = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+
+def run_cold(code: str, timeout: int = 30, data_path: str | None = None,
+             handle: SandboxHandle | None = None) -> tuple[str, str]:
+    """Execute Python code in a fresh subprocess. Returns (stdout, stderr).
+
+    The code runs through the worker script's --once mode, which applies the job
+    limits; with data_path it also binds `df` from that Feather file first. Output
+    goes to temporary files so the output-size limit applies as in the pool.
+    """
+    if handle is not None and handle.cancelled:
+        raise SandboxCancelled("sandbox job cancelled")
+    limits = JOB_LIMITS
+    cmd = [sys.executable, str(WORKER_SCRIPT), "--once"] + ([data_path] if data_path else [])
+    env = {**_sandbox_env(), "PYTHONIOENCODING": "utf-8", "SANDBOX_LIMITS": json.dumps(limits)}
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        with subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=out, stderr=err, env=env) as proc:
+            if handle is not None:
+                handle._attach(proc.kill)
+            try:
+                # The worker reads all of stdin before running anything
+                try:
+                    proc.stdin.write(code.encode())
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    # it died first (or was cancelled); the exit status says why
+                    with contextlib.suppress(BrokenPipeError):
+                        proc.stdin.close()
+                cpu_seconds = _wait_cold(proc, timeout)
+            finally:
+                if handle is not None:
+                    handle._detach()
+        if handle is not None and handle.cancelled:
+            raise SandboxCancelled("sandbox job cancelled")
+        out.seek(0)
+        err.seek(0)
+        stdout_raw = out.read()
+        stderr = err.read().decode("utf-8", errors="replace")
+    limit = _limit_hit(limits, proc.returncode, stderr, len(stdout_raw), cpu_seconds)
+    if limit is not None:
+        raise limit
+    return stdout_raw.decode("utf-8", errors="replace"), stderr
+
+
+class WorkerError(RuntimeError):
+    """The worker process died or stopped answering; the job was not run to completion."""
+
+
+class _Worker:
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, str(WORKER_SCRIPT)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env={**_sandbox_env(), "PYTHONIOENCODING": "utf-8"},
+        )
+        self.jobs = 0
+        # Replies are read from the raw pipe: a job sends two lines, which may arrive in
+        # one read, and select() cannot see lines already sitting in a buffered reader
+        self._buffer = b""
+
+    def _read_reply(self, timeout: float) -> dict:
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        while b"\n" not in self._buffer:
+            with selectors.DefaultSelector() as sel:
+                sel.register(fd, selectors.EVENT_READ)
+                if not sel.select(max(deadline - time.monotonic(), 0)):
+                    raise WorkerError("sandbox worker did not reply in time")
+            chunk = os.read(fd, 1 << 16)
+            if not chunk:
+                raise WorkerError(f"sandbox worker exited ({self.proc.poll()})")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def wait_ready(self) -> None:
+        self._read_reply(WORKER_START_TIMEOUT)
+
+    def run(self, code: str, timeout: int, data_path: str | None, limits: dict,
+            handle: SandboxHandle | None = None) -> dict:
+        self.jobs += 1
+        job = {"code": code, "timeout": timeout, "data_path": data_path, "limits": limits}
+        try:
+            self.proc.stdin.write(json.dumps(job).encode() + b"\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerError(f"sandbox worker unavailable: {e}") from e
+        started = time.monotonic()
+        # {"started": true} once the job's child is forked; from then on SIGUSR1 makes
+        # the worker kill that child (it ignores the signal when no job is running)
+        self._read_reply(timeout + WORKER_REPLY_GRACE)
+        if handle is not None:
+            handle._attach(self.kill_job)
+        try:
+            return self._read_reply(timeout + WORKER_REPLY_GRACE - (time.monotonic() - started))
+        finally:
+            if handle is not None:
+                handle._detach()
+
+    def kill_job(self) -> None:
+        try:
+            self.proc.send_signal(signal.SIGUSR1)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        for stream in (self.proc.stdin, self.proc.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+class SandboxPool:
+    """Fixed number of warm workers; callers that find none idle fall back to run_cold."""
+
+    def __init__(self, size: int, max_jobs: int):
+        self.size = size
+        self.max_jobs = max_jobs
+        self._idle: queue.SimpleQueue[_Worker] = queue.SimpleQueue()
+        self._closed = False
+        self.pooled_runs = 0
+        self.cold_runs = 0
+        self.recycled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0 and hasattr(os, "fork") and not self._closed
+
+    def start(self) -> None:
+        """Spawn all workers in the background; requests use cold runs until they are warm."""
+        if not self.enabled:
+            return
+        for _ in range(self.size):
+            self._spawn_async()
+
+    def _spawn_async(self) -> None:
+        threading.Thread(target=self._spawn, daemon=True).start()
+
+    def _spawn(self) -> None:
+        worker = _Worker()
+        try:
+            worker.wait_ready()
+        except (WorkerError, ValueError) as e:
+            logger.warning("Sandbox worker failed to start: %s", e)
+            worker.close()
+            return
+        if self._closed:
+            worker.close()
+        else:
+            self._idle.put(worker)
+
+    def _retire(self, worker: _Worker) -> None:
+        worker.close()
+        self.recycled += 1
+        if not self._closed:
+            self._spawn_async()
+
+    def run(self, code: str, timeout: int, data_path: str | None = None,
+            timings: dict | None = None, handle: SandboxHandle | None = None) -> tuple[str, str]:
+        """Same contract as run_cold: (stdout, stderr), TimeoutExpired on timeout,
+        SandboxLimitExceeded when a resource limit stopped the job, SandboxCancelled
+        when it was stopped through handle.
+
+        timings, if given, receives "path" ("pooled" or "cold") and, for pooled runs,
+        "exec" (seconds from fork to exit in the worker).
+        """
+        if timings is None:
+            timings = {}
+        if handle is not None and handle.cancelled:
+            raise SandboxCancelled("sandbox job cancelled")
+        try:
+            worker = self._idle.get_nowait() if self.enabled else None
+        except queue.Empty:
+            worker = None
+        if worker is None:
+            self.cold_runs += 1
+            timings["path"] = "cold"
+            return run_cold(code, timeout, data_path, handle)
+
+        self.pooled_runs += 1
+        limits = JOB_LIMITS
+        try:
+            result = worker.run(code, timeout, data_path, limits, handle)
+        except WorkerError as e:
+            # Infrastructure failure, not the job's: replace the worker, run it cold
+            logger.warning("Sandbox worker failed, falling back to a cold run: %s", e)
+            self._retire(worker)
+            self.cold_runs += 1
+            timings["path"] = "cold"
+            return run_cold(code, timeout, data_path, handle)
+        timings["path"] = "pooled"
+        if "exec_seconds" in result:
+            timings["exec"] = result["exec_seconds"]
+
+        cancelled = handle is not None and handle.cancelled
+        # A job killed on request says nothing about the worker, which stays in the pool
+        if (result["timed_out"] or (result["returncode"] != 0 and not cancelled)
+                or worker.jobs >= self.max_jobs):
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+
+        if cancelled:
+            raise SandboxCancelled("sandbox job cancelled")
+        if result["timed_out"]:
+            raise subprocess.TimeoutExpired(cmd="sandbox", timeout=timeout)
+        limit = _limit_hit(limits, result["returncode"], result["stderr"],
+                           result.get("stdout_bytes", 0), result.get("cpu_seconds"))
+        if limit is not None:
+            raise limit
+        return result["stdout"], result["stderr"]
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "pooled_runs": self.pooled_runs,
+            "cold_runs": self.cold_runs,
+            "recycled": self.recycled,
+        }
+
+
+sandbox_pool = SandboxPool(SANDBOX_POOL_SIZE, SANDBOX_WORKER_MAX_JOBS)
+
+
+def run_sandbox(code: str, timeout: int = 30, data_path: str | None = None,
+                timings: dict | None = None, handle: SandboxHandle | None = None) -> tuple[str, str]:
+    """Execute Python code on a warm worker (or cold subprocess). Returns (stdout, stderr).
+
+    Raises subprocess.TimeoutExpired past `timeout` and SandboxLimitExceeded when
+    the code hits a resource limit (memory, CPU time, open files, output size).
+
+    data_path: session Feather file to expose to the code as a preloaded `df`.
+    timings: optional dict filled in by SandboxPool.run.
+    handle: optional SandboxHandle to stop the job from another thread (SandboxCancelled).
+    """
+    return sandbox_pool.run(code, timeout, data_path, timings, handle)
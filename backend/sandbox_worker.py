@@ -0,0 +1,237 @@
+"""
+Sandbox worker: runs generated code with an optional preloaded `df`.
+
+Pool mode (default, started by sandbox.SandboxPool) imports pandas/json/datetime
+once, then serves jobs over stdin/stdout as JSON lines:
+    -> {"code": "...", "timeout": 30, "data_path": "/tmp/.../data.feather" | null,
+        "limits": {"memory": bytes, "cpu": seconds, "files": n, "output": bytes}}
+    <- {"started": true}   (once the job's child is forked)
+    <- {"stdout": "...", "stderr": "...", "returncode": 0, "timed_out": false,
+        "exec_seconds": 0.12, "stdout_bytes": 1234, "cpu_seconds": 0.1}
+Every job runs in a fresh fork()ed child, so generated code never shares state with
+other jobs; the worker itself only holds the warm imports and memory-mapped
+session tables. The child sets the job's rlimits before running its code (see
+_apply_limits); what a limit hit looks like is classified by sandbox.py. SIGUSR1
+kills the running job's child (the reply then follows as usual); between jobs it
+is ignored.
+
+`--once [data_path]` runs a single job whose code is read from stdin in this
+process (the cold-spawn path), with limits from the SANDBOX_LIMITS environment
+variable (same JSON as above). Not meant to be run by hand.
+"""
+import os
+import sys
+
+# Running as a script puts backend/ on sys.path; generated code must not see it
+sys.path.pop(0)
+
+import datetime  # noqa: E402,F401  (pre-warmed for generated code)
+import json  # noqa: E402
+import math  # noqa: E402,F401
+import re  # noqa: E402,F401
+import signal  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+import traceback  # noqa: E402
+from collections import OrderedDict  # noqa: E402
+
+import numpy  # noqa: E402,F401
+import pandas  # noqa: E402,F401
+import pyarrow  # noqa: E402
+import pyarrow.feather  # noqa: E402
+
+try:
+    import resource  # noqa: E402
+except ImportError:  # not available on Windows; jobs then run without rlimits
+    resource = None
+
+# Session Feather files are immutable, so their memory-mapped tables can be reused
+# by every job on the same session; children convert them with to_pandas().
+_TABLE_CACHE_SIZE = 4
+_tables: OrderedDict = OrderedDict()
+_running_child: int | None = None  # pid of the job being run, for SIGUSR1
+
+
+def _table(data_path: str) -> pyarrow.Table:
+    table = _tables.get(data_path)
+    if table is None:
+        table = pyarrow.feather.read_table(data_path, memory_map=True)
+        _tables[data_path] = table
+        while len(_tables) > _TABLE_CACHE_SIZE:
+            _tables.popitem(last=False)
+    _tables.move_to_end(data_path)
+    return table
+
+
+def _exec(code: str, data_path: str | None) -> int:
+    """Behave like `python -c code` (with `df` bound when data_path is set); return the exit status."""
+    try:
+        scope = {"__name__": "__main__"}
+        if data_path:
+            scope["df"] = _table(data_path).to_pandas()
+        exec(compile(code, "<string>", "exec"), scope)
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Drop this frame so the traceback reads like `python -c` output
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return 1
+    return 0
+
+
+def _setrlimit(kind: int, soft: int, hard: int | None = None) -> None:
+    _, current_hard = resource.getrlimit(kind)
+    hard = soft if hard is None else hard
+    if current_hard != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current_hard), min(hard, current_hard)
+    resource.setrlimit(kind, (soft, hard))
+
+
+def _apply_limits(limits: dict | None) -> None:
+    """Set the job's rlimits on the current process, just before its code runs.
+
+    memory and cpu are budgets on top of what the process already uses (the
+    interpreter, warm imports and mapped session tables; import time on a cold
+    run), so they bound the job's own work wherever it runs.
+    """
+    if not limits or resource is None:
+        return
+    if limits.get("memory"):
+        try:
+            with open("/proc/self/statm") as f:
+                mapped = int(f.read().split()[0]) * resource.getpagesize()
+        except OSError:
+            mapped = None  # no procfs: leave the address space alone
+        if mapped is not None:
+            _setrlimit(resource.RLIMIT_AS, mapped + int(limits["memory"]))
+    if limits.get("cpu"):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime) + int(limits["cpu"])
+        # SIGXCPU at the soft limit; SIGKILL a second later if it is survived
+        _setrlimit(resource.RLIMIT_CPU, soft, soft + 1)
+    if limits.get("files"):
+        _setrlimit(resource.RLIMIT_NOFILE, int(limits["files"]))
+    if limits.get("output"):
+        # stdout is a regular file here, so this caps it (writes past it fail with EFBIG)
+        _setrlimit(resource.RLIMIT_FSIZE, int(limits["output"]))
+
+
+def _child(job: dict, out_fd: int, err_fd: int) -> None:
+    """Runs in the forked child: redirect stdio, run the job, then _exit."""
+    status = 1
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        _apply_limits(job.get("limits"))
+        status = _exec(job["code"], job.get("data_path"))
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(status)
+
+
+def _kill_running(signum, frame) -> None:
+    if _running_child is not None:
+        try:
+            os.kill(_running_child, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def _wait(pid: int, timeout: float) -> tuple[int, bool, float]:
+    """Return (returncode, timed_out, CPU seconds used), killing the child at the deadline."""
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    timed_out = False
+    while True:
+        done, status, usage = os.wait4(pid, os.WNOHANG)
+        if done:
+            break
+        if time.monotonic() >= deadline:
+            os.kill(pid, signal.SIGKILL)
+            _, status, usage = os.wait4(pid, 0)
+            timed_out = True
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, 0.01)
+    return os.waitstatus_to_exitcode(status), timed_out, usage.ru_utime + usage.ru_stime
+
+
+def _run_job(job: dict, proto) -> dict:
+    global _running_child
+    if job.get("data_path"):
+        try:
+            _table(job["data_path"])  # map it here so the forked child inherits the mapping
+        except Exception:
+            pass  # the child hits the same error and reports it as a traceback
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            _child(job, out.fileno(), err.fileno())
+        # Killable from here on: the parent may send SIGUSR1 as soon as it sees "started"
+        _running_child = pid
+        try:
+            proto.write(json.dumps({"started": True}) + "\n")
+            proto.flush()
+            returncode, timed_out, cpu_seconds = _wait(pid, float(job.get("timeout", 30)))
+        finally:
+            _running_child = None
+        exec_seconds = time.perf_counter() - started
+        out.seek(0)
+        err.seek(0)
+        stdout = out.read()
+        return {
+            "stdout": stdout.decode("utf-8", errors="replace"),
+            "stderr": err.read().decode("utf-8", errors="replace"),
+            "returncode": returncode,
+            "timed_out": timed_out,
+            "exec_seconds": exec_seconds,
+            "stdout_bytes": len(stdout),
+            "cpu_seconds": cpu_seconds,
+        }
+
+
+def serve() -> None:
+    # The protocol owns the real stdout; anything else printed here goes to stderr
+    proto = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+
+    signal.signal(signal.SIGUSR1, _kill_running)
+    proto.write(json.dumps({"ready": True}) + "\n")
+    proto.flush()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        result = _run_job(json.loads(line), proto)
+        proto.write(json.dumps(result, ensure_ascii=False) + "\n")
+        proto.flush()
+
+
+def run_once(data_path: str | None) -> None:
+    code = sys.stdin.read()
+    limits = os.environ.pop("SANDBOX_LIMITS", None)
+    _apply_limits(json.loads(limits) if limits else None)
+    status = _exec(code, data_path)
+    sys.stdout.flush()
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--once":
+        run_once(sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        serve()
@@ -0,0 +1,69 @@
+"""
+DataFrame -> JSON-serialisable records, converted one column at a time.
+
+Produces exactly what the old row-by-row `_df_to_records` produced (NaN/NaT/NA ->
+None, Timestamp -> isoformat(), numpy scalars -> Python scalars), but the NA mask and
+the type conversions run per column instead of per cell.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _clean_object(v):
+    if isinstance(v, pd.Timestamp):
+        return v.isoformat()
+    if hasattr(v, "item") and not isinstance(v, (list, dict)):   # numpy scalar
+        return v.item()
+    return v
+
+
+def _iso_strings(s: pd.Series, mask: np.ndarray) -> list | None:
+    """Vectorised Timestamp.isoformat() for naive datetime64 columns.
+
+    isoformat() prints whole seconds bare and anything else with 6 fractional digits;
+    numpy renders both forms and we pick per element. Returns None for columns it
+    cannot reproduce exactly (tz-aware, nanosecond precision).
+    """
+    if not isinstance(s.dtype, np.dtype) or mask.all():
+        return None
+    raw = s.to_numpy()
+    seconds = raw.astype("datetime64[s]")
+    micros = raw.astype("datetime64[us]")
+    if not (raw[~mask] == micros[~mask]).all():
+        return None
+    return np.where(raw == seconds,
+                    np.datetime_as_string(seconds, unit="s"),
+                    np.datetime_as_string(micros, unit="us")).tolist()
+
+
+def _column_values(s: pd.Series) -> list:
+    dtype = s.dtype
+
+    # Integers and booleans cannot hold NaN; tolist() already yields Python scalars
+    if isinstance(dtype, np.dtype) and dtype.kind in "iub":
+        return s.tolist()
+
+    mask = s.isna().to_numpy()
+
+    if dtype.kind == "M":
+        values = _iso_strings(s, mask)
+        if values is None:
+            values = [None if m else ts.isoformat() for ts, m in zip(s.tolist(), mask)]
+    else:
+        values = s.tolist()
+        if dtype == object or isinstance(dtype, pd.CategoricalDtype):
+            return [None if m else _clean_object(v) for v, m in zip(values, mask)]
+
+    if mask.any():
+        for i in np.flatnonzero(mask):
+            values[i] = None
+    return values
+
+
+def df_to_records(df: pd.DataFrame) -> list[dict]:
+    """Convert DataFrame to JSON-serialisable list of dicts."""
+    if len(df.columns) == 0:
+        return []
+    columns = list(df.columns)
+    values = [_column_values(df.iloc[:, i]) for i in range(len(columns))]
+    return [dict(zip(columns, row)) for row in zip(*values)]
@@ -0,0 +1,137 @@
+"""
+Persistent cache of Biz API time series, keyed by stat_id (SQLite).
+
+Each row holds the last fetched points ([{"date", "value"}, ...] sorted by date),
+their max date and when they were fetched. /api/load-database-data serves fresh
+rows directly, serves stale rows while refreshing them in the background
+(stale-while-revalidate), and refreshes by asking only for points from the cached
+max date onwards.
+
+The table is bounded: past max_rows series or max_bytes of stored points, the
+least recently read series are deleted (down to low_water of the limits).
+"""
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass
+class CachedSeries:
+    stat_id: str
+    points: list[dict]
+    max_date: str
+    fetched_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+def merge_points(cached: list[dict], delta: list[dict], since: str) -> list[dict]:
+    """Keep cached points before `since` and take everything from `since` onwards from
+    the delta (the last cached point may have been revised). Delta points before
+    `since` are ignored, so an upstream that returns full history merges the same."""
+    merged = [p for p in cached if p["date"] < since]
+    merged.extend(p for p in delta if p["date"] >= since)
+    merged.sort(key=lambda p: p["date"])
+    return merged
+
+
+class SeriesCache:
+    def __init__(self, path: Path, max_rows: int, max_bytes: int, low_water: float = 0.8):
+        self.path = path
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS series ("
+            " stat_id TEXT PRIMARY KEY,"
+            " points TEXT NOT NULL,"
+            " max_date TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(series)")}
+        if "accessed_at" not in columns:  # table from before eviction
+            self._conn.execute("ALTER TABLE series ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS series_accessed_at ON series (accessed_at)")
+        self._conn.commit()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.delta_refreshes = 0
+        self.full_refreshes = 0
+        self.evictions = 0
+
+    def get(self, stat_id: str) -> CachedSeries | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT points, max_date, fetched_at FROM series WHERE stat_id = ?", (stat_id,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE series SET accessed_at = ? WHERE stat_id = ?",
+                                   (time.time(), stat_id))
+                self._conn.commit()
+        if row is None:
+            return None
+        return CachedSeries(stat_id, json.loads(row[0]), row[1], row[2])
+
+    def put(self, stat_id: str, points: list[dict]) -> CachedSeries:
+        max_date = max((p["date"] for p in points if p["date"]), default="")
+        entry = CachedSeries(stat_id, points, max_date, time.time())
+        payload = json.dumps(points, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO series (stat_id, points, max_date, fetched_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (stat_id, payload, max_date, entry.fetched_at, entry.fetched_at),
+            )
+            self._evict()
+            self._conn.commit()
+        return entry
+
+    def _evict(self) -> None:
+        """Delete least recently read series while over max_rows / max_bytes (lock held)."""
+        rows, nbytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(points)), 0) FROM series").fetchone()
+        if rows <= self.max_rows and nbytes <= self.max_bytes:
+            return
+        target_rows = self.max_rows * self.low_water
+        target_bytes = self.max_bytes * self.low_water
+        victims = []
+        for stat_id, size in self._conn.execute(
+                "SELECT stat_id, LENGTH(points) FROM series ORDER BY accessed_at"):
+            if rows <= target_rows and nbytes <= target_bytes:
+                break
+            victims.append((stat_id,))
+            rows -= 1
+            nbytes -= size
+        self._conn.executemany("DELETE FROM series WHERE stat_id = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, nbytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(points)), 0) FROM series").fetchone()
+        return {
+            "entries": entries,
+            "bytes": nbytes,
+            "max_rows": self.max_rows,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "delta_refreshes": self.delta_refreshes,
+            "full_refreshes": self.full_refreshes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
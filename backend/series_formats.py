@@ -0,0 +1,134 @@
+"""
+Response encodings for /api/load-database-data, chosen from the Accept header.
+
+    application/json (default)          {"time_series": [{"id", ..., "data": [{"date", "value"}]}]}
+    application/vnd.chartwizard.columnar+json
+                                        {"time_series": [{"id", "name_tc", "name_en",
+                                          "timestamps": [epoch ms, ...], "values": [float|null, ...]}]}
+    application/vnd.apache.arrow.stream Arrow IPC stream, one row per point:
+                                        id (dictionary string), timestamp (timestamp[ms]),
+                                        value (float64); series names in the schema
+                                        metadata key "series" (JSON)
+    application/msgpack                 the columnar layout as MessagePack (only when the
+                                        optional `msgpack` package is installed)
+
+The columnar forms skip the per-point dicts: timestamps are parsed once with NumPy
+and both arrays are serialized in one pass. Points whose date cannot be parsed are
+dropped from them.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pydantic_core
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.chartwizard.columnar+json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+
+_ALIASES = {"application/x-msgpack": MSGPACK}
+
+
+def _available() -> list[str]:
+    formats = [JSON, COLUMNAR_JSON, ARROW_STREAM]
+    if msgpack is not None:
+        formats.append(MSGPACK)
+    return formats
+
+
+def negotiate(accept: str | None) -> str:
+    """Pick the response format for an Accept header; anything unknown gets JSON."""
+    if not accept:
+        return JSON
+    available = _available()
+    offers = []
+    for position, part in enumerate(accept.split(",")):
+        media, *params = [p.strip() for p in part.split(";")]
+        media = _ALIASES.get(media.lower(), media.lower())
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media in available and q > 0:
+            offers.append((-q, position, media))
+    return min(offers)[2] if offers else JSON
+
+
+def _columns(points: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    """(epoch-ms int64 timestamps, float64 values) of [{"date", "value"}] points."""
+    dates = [p.get("date") or "NaT" for p in points]
+    try:
+        stamps = np.array(dates, dtype="datetime64[ms]")
+    except ValueError:
+        stamps = pd.to_datetime(pd.Series(dates, dtype=object), errors="coerce",
+                                format="mixed").to_numpy(dtype="datetime64[ms]")
+    raw = [p.get("value") for p in points]
+    try:
+        values = np.array(raw, dtype=np.float64)  # None -> nan
+    except (TypeError, ValueError):
+        values = pd.to_numeric(pd.Series(raw, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+    keep = ~np.isnat(stamps)
+    return stamps[keep].astype(np.int64), values[keep]
+
+
+def _float_list(values: np.ndarray) -> list:
+    out = values.tolist()
+    if np.isnan(values).any():
+        out = [None if v != v else v for v in out]
+    return out
+
+
+def to_columnar(series: list) -> list[dict]:
+    """TimeSeriesData models -> columnar dicts (JSON/MessagePack ready)."""
+    out = []
+    for s in series:
+        stamps, values = _columns(s.data)
+        out.append({"id": s.id, "name_tc": s.name_tc, "name_en": s.name_en,
+                    "timestamps": stamps.tolist(), "values": _float_list(values)})
+    return out
+
+
+def to_arrow_ipc(series: list) -> bytes:
+    ids, stamps, values = [], [], []
+    for s in series:
+        ts, vs = _columns(s.data)
+        ids.append(np.full(len(ts), s.id, dtype=object))
+        stamps.append(ts)
+        values.append(vs)
+    meta = [{"id": s.id, "name_tc": s.name_tc, "name_en": s.name_en} for s in series]
+    table = pa.table(
+        {
+            "id": pa.array(np.concatenate(ids) if ids else [], type=pa.string()).dictionary_encode(),
+            "timestamp": pa.array(np.concatenate(stamps) if stamps else [], type=pa.int64())
+                           .cast(pa.timestamp("ms")),
+            "value": pa.array(np.concatenate(values) if values else [], type=pa.float64(),
+                              from_pandas=True),
+        },
+        metadata={"series": json.dumps(meta, ensure_ascii=False)},
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode(media_type: str, series: list) -> bytes:
+    """Body bytes for a non-default format (see negotiate)."""
+    if media_type == ARROW_STREAM:
+        return to_arrow_ipc(series)
+    body = {"time_series": to_columnar(series)}
+    if media_type == MSGPACK:
+        return msgpack.packb(body, use_bin_type=True)
+    # pydantic's Rust serializer: ~5x faster than json.dumps on long float arrays
+    return pydantic_core.to_json(body)
@@ -0,0 +1,393 @@
+"""
+Session data layer for v2.
+
+The upload is parsed once in /upload and written next to the original file as an
+uncompressed Arrow/Feather file. Later /generate calls are served from an
+in-process LRU of DataFrames (bounded by a memory budget), then from the Feather
+file, and only fall back to re-parsing the raw upload if neither exists.
+
+The column profile computed at upload is stored the same way (profile.json plus a
+small in-memory LRU) so the data context does not re-profile the frame.
+
+Uploads are stored by content: store_upload() streams the upload into
+BLOB_DIR/<sha256><suffix>/data<suffix>, hashing as it copies, and sessions only
+reference that blob (the `blob` file in the session folder). Identical uploads
+share one stored copy, and since the functions here are keyed by the data
+folder, also one Feather file, one cached DataFrame and one profile. Sessions
+from before the blob store keep their upload in the session folder, identified
+by data.sha256.
+
+An Excel upload can be viewed as another sheet or a cell range of it. Each such
+view gets its own data folder inside the upload's (sheets/<key>/) holding its own
+Feather file and profile, so every view is converted once and then works like any
+other data folder here. The session records its current view in sheet.json.
+
+Several worker processes (or replicas sharing the directory) may use the same data
+folder at once: files are replaced atomically, and converting an upload to Feather
+is done by one process at a time under file_lock(), the others then read its result.
+"""
+import hashlib
+import json
+import logging
+import os
+import uuid
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; locks become no-ops (single process only)
+    fcntl = None
+
+import pandas as pd
+import pyarrow as pa
+
+from config import DF_CACHE_MAX_BYTES
+from profiler import DataProfile, build_profile
+
+COLUMNAR_FILENAME = "data.feather"
+PROFILE_FILENAME = "profile.json"
+HASH_FILENAME = "data.sha256"
+BLOB_REF_FILENAME = "blob"
+SHEET_REF_FILENAME = "sheet.json"
+SHEETS_DIRNAME = "sheets"
+CONVERT_LOCK_FILENAME = ".convert.lock"
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+PROFILE_CACHE_SIZE = 256
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_nbytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class DataFrameCache:
+    """Thread-safe LRU of DataFrames bounded by their in-memory size.
+
+    Cached frames are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, tuple[pd.DataFrame, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        size = _frame_nbytes(df)
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                # A single frame over budget would just flush everything else
+                return
+            self._items[key] = (df, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._items))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def pop_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._items if k.startswith(prefix)]:
+                self._discard(key)
+
+    def _discard(self, key: str) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+df_cache = DataFrameCache(DF_CACHE_MAX_BYTES)
+
+
+@contextmanager
+def file_lock(path: Path, blocking: bool = True):
+    """Exclusive flock() on `path` (created if missing), shared by every process using
+    the same file. Yields True once held; with blocking=False, yields False instead
+    of waiting when another process holds it."""
+    if fcntl is None:
+        yield True
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(path: Path, text: str, encoding: str = "utf-8") -> None:
+    """Replace path's content so concurrent readers see the old or the new file, never half."""
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp.write_text(text, encoding=encoding)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def columnar_path(ws: Path) -> Path:
+    return ws / COLUMNAR_FILENAME
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """df with what Arrow cannot store made storable: non-string column names become
+    strings, and object columns mixing types (numbers and text in one Excel column)
+    become text, keeping their nulls. Other columns are left alone."""
+    if not all(isinstance(name, str) for name in df.columns):
+        df = df.set_axis([str(name) for name in df.columns], axis=1)
+    mixed = []
+    for i, (_, col) in enumerate(df.items()):
+        if col.dtype != object:
+            continue
+        try:
+            pa.array(col, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            mixed.append(i)
+    if mixed:
+        df = df.copy()
+        for i in mixed:
+            col = df.iloc[:, i]
+            df.isetitem(i, col.astype(str).where(col.notna()))
+    return df
+
+
+def _write_columnar(df: pd.DataFrame, dest: Path) -> bool:
+    """Write df as uncompressed Feather (memory-mappable). Best-effort: returns False
+    when the frame still cannot be written (callers then keep using the raw upload);
+    load_session_df passes frames through _arrow_safe first."""
+    # Unique temp name: two sessions may parse the same blob at the same time
+    tmp = dest.with_suffix(f".feather.{uuid.uuid4().hex}.tmp")
+    try:
+        df.to_feather(tmp, compression="uncompressed")
+        os.replace(tmp, dest)
+        return True
+    except Exception as e:
+        logger.warning("Columnar cache skipped for %s: %s", dest.parent.name, e)
+        tmp.unlink(missing_ok=True)
+        return False
+
+
+def _read_columnar(ws: Path) -> pd.DataFrame | None:
+    feather = columnar_path(ws)
+    if not feather.exists():
+        return None
+    try:
+        return pd.read_feather(feather)
+    except Exception as e:
+        logger.warning("Columnar cache unreadable for %s, re-parsing: %s", ws.name, e)
+        feather.unlink(missing_ok=True)
+        return None
+
+
+def load_session_df(ws: Path, source: Path,
+                    parse: Callable[[Path], pd.DataFrame]) -> pd.DataFrame:
+    """Return the session DataFrame: memory LRU -> Feather file -> parse(source)."""
+    key = str(ws)
+    df = df_cache.get(key)
+    if df is not None:
+        return df
+
+    df = _read_columnar(ws)
+    if df is None:
+        # One process parses; others wait here and then read the Feather file it wrote
+        with file_lock(ws / CONVERT_LOCK_FILENAME):
+            df = _read_columnar(ws)
+            if df is None:
+                # Normalized before caching too, so the first request sees the same
+                # frame as every later one read back from Feather
+                df = _arrow_safe(parse(source))
+                _write_columnar(df, columnar_path(ws))
+
+    df_cache.put(key, df)
+    return df
+
+
+_profiles: OrderedDict[str, DataProfile] = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def _remember_profile(key: str, profile: DataProfile) -> None:
+    with _profiles_lock:
+        _profiles[key] = profile
+        _profiles.move_to_end(key)
+        while len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+
+
+def save_session_profile(ws: Path, df: pd.DataFrame) -> DataProfile:
+    """Profile a freshly parsed upload and persist the result with the session."""
+    profile = build_profile(df)
+    _write_atomic(ws / PROFILE_FILENAME, profile.model_dump_json())
+    _remember_profile(str(ws), profile)
+    return profile
+
+
+def load_session_profile(ws: Path, df: pd.DataFrame) -> DataProfile:
+    """Return the stored profile: memory -> profile.json -> profile df again."""
+    key = str(ws)
+    with _profiles_lock:
+        profile = _profiles.get(key)
+        if profile is not None:
+            _profiles.move_to_end(key)
+            return profile
+
+    path = ws / PROFILE_FILENAME
+    if path.exists():
+        try:
+            profile = DataProfile.model_validate_json(path.read_text(encoding="utf-8"))
+        except ValueError as e:
+            logger.warning("Stored profile unreadable for %s, re-profiling: %s", ws.name, e)
+    if profile is None:
+        return save_session_profile(ws, df)
+
+    _remember_profile(key, profile)
+    return profile
+
+
+def forget_session(ws: Path) -> None:
+    """Drop a deleted session (or blob, with its sheet views) from the in-memory caches."""
+    key = str(ws)
+    views = str(ws / SHEETS_DIRNAME) + os.sep
+    df_cache.pop(key)
+    df_cache.pop_prefix(views)
+    with _profiles_lock:
+        for k in [k for k in _profiles if k == key or k.startswith(views)]:
+            del _profiles[k]
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_session_hash(ws: Path, digest: str) -> None:
+    _write_atomic(ws / HASH_FILENAME, digest, encoding="ascii")
+
+
+def load_session_hash(ws: Path, source: Path) -> str:
+    """Return the stored content hash of the upload, hashing `source` if it is missing."""
+    path = ws / HASH_FILENAME
+    try:
+        digest = path.read_text(encoding="ascii").strip()
+        if len(digest) == 64:
+            return digest
+    except OSError:
+        pass
+    digest = file_sha256(source)
+    save_session_hash(ws, digest)
+    return digest
+
+
+class UploadTooLarge(ValueError):
+    """The upload exceeded the configured maximum size."""
+
+
+def store_upload(src: BinaryIO, suffix: str, blob_root: Path,
+                 max_bytes: int) -> tuple[str, Path, int]:
+    """Stream an upload into the blob store, hashing it as it is copied.
+
+    Returns (blob id, blob folder, newly stored bytes); the byte count is 0 when an
+    identical upload was already stored. Raises UploadTooLarge past max_bytes.
+    """
+    blob_root.mkdir(parents=True, exist_ok=True)
+    tmp = blob_root / f".incoming-{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as out:
+            for block in iter(lambda: src.read(UPLOAD_CHUNK_BYTES), b""):
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+                digest.update(block)
+                out.write(block)
+
+        blob_id = f"{digest.hexdigest()}{suffix}"
+        blob = blob_root / blob_id
+        data_file = blob / f"data{suffix}"
+        blob.mkdir(exist_ok=True)
+        if data_file.exists():
+            os.utime(blob)  # counts as activity for the janitor
+            return blob_id, blob, 0
+        os.replace(tmp, data_file)
+        return blob_id, blob, size
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def save_session_blob(ws: Path, blob_id: str) -> None:
+    _write_atomic(ws / BLOB_REF_FILENAME, blob_id, encoding="ascii")
+
+
+def load_session_blob(ws: Path) -> str | None:
+    try:
+        return (ws / BLOB_REF_FILENAME).read_text(encoding="ascii").strip() or None
+    except OSError:
+        return None
+
+
+def sheet_view_dir(data_dir: Path, key: str) -> Path:
+    """Data folder of one sheet / cell-range view of the upload in data_dir."""
+    view = data_dir / SHEETS_DIRNAME / key
+    view.mkdir(parents=True, exist_ok=True)
+    return view
+
+
+def save_session_sheet(ws: Path, selection: dict | None) -> None:
+    """Record the session's sheet view ({"index", "sheet", "range"}); None = the default."""
+    path = ws / SHEET_REF_FILENAME
+    if selection is None:
+        path.unlink(missing_ok=True)
+    else:
+        _write_atomic(path, json.dumps(selection, ensure_ascii=False))
+
+
+def load_session_sheet(ws: Path) -> dict | None:
+    try:
+        return json.loads((ws / SHEET_REF_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,293 @@
+"""
+Garbage collection for v2 session directories.
+
+Sessions are kept by a session store (session_store.py: a folder per session, or
+a SQLite row). Uploads live in a content-addressed blob store
+(BLOB_DIR/<sha256><suffix>, shared by every session that uploaded the same bytes)
+and a session only references one; sessions created before the blob store hold
+their upload in their folder. The store records each session's last activity:
+/upload creates it and every /generate touches it. A session's size counts its
+own folder (if any) plus the blob it references. The janitor runs in the
+background and
+
+  1. deletes sessions idle for longer than SESSION_MAX_AGE,
+  2. deletes single sessions larger than SESSION_MAX_BYTES once they are idle,
+  3. while the total (sessions + blobs) exceeds SESSION_QUOTA_BYTES, deletes the
+     least recently used sessions until it is under SESSION_QUOTA_LOW_WATER of
+     the quota,
+  4. deletes blobs no session references any more.
+
+Sessions and blobs active within SESSION_MIN_IDLE are never deleted, so a chart
+being generated (or an upload deduplicated onto an existing blob) does not lose
+its data. In-memory caches for deleted sessions and blobs are dropped too.
+
+Every worker process runs a janitor, but a sweep only proceeds while holding the
+lock file (lock_path); sweeps that find it taken are skipped, so one process at a
+time does the deleting. Its counters are therefore per process: the totals are
+those of the last sweep *this* process ran, the eviction counts its own.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from session_data import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SessionInfo:
+    path: Path
+    last_access: float
+    nbytes: int             # the folder itself (a session's blob is counted separately)
+    blob: str | None = None
+
+
+def touch_session(ws: Path) -> None:
+    """Record activity on a session (bumps the folder's mtime)."""
+    try:
+        os.utime(ws)
+    except OSError:
+        pass
+
+
+def dir_size(path: Path) -> int:
+    total = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    total += dir_size(Path(entry.path))
+                else:
+                    total += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+    return total
+
+
+class SessionJanitor:
+    def __init__(self, store, *, max_age: float, max_session_bytes: int,
+                 quota_bytes: int, low_water: float, min_idle: float, interval: float,
+                 blob_root: Path | None = None, lock_path: Path | None = None,
+                 on_evict: Callable[[Path], None] | None = None, results=None):
+        self.store = store  # session_store.FileSessionStore / SQLiteSessionStore
+        self.max_age = max_age
+        self.max_session_bytes = max_session_bytes
+        self.quota_bytes = quota_bytes
+        self.low_water = low_water
+        self.min_idle = min_idle
+        self.interval = interval
+        self.blob_root = blob_root
+        self.lock_path = lock_path
+        self.on_evict = on_evict
+        self.results = results  # session_store.ChartResultStore, pruned on every sweep
+        self._task: asyncio.Task | None = None
+        self._wake: asyncio.Event | None = None
+        # Metrics (as of the last sweep, plus uploads since)
+        self.sessions = 0
+        self.blobs = 0
+        self.bytes = 0
+        self.evicted_sessions = 0
+        self.evicted_blobs = 0
+        self.evicted_bytes = 0
+        self.evictions_by_reason = {"age": 0, "size": 0, "quota": 0, "orphan": 0}
+        self.pruned_results = 0
+        self.sweeps = 0
+        self.skipped_sweeps = 0  # another process was sweeping
+        self.last_sweep_at: float | None = None
+        self.last_sweep_seconds: float | None = None
+
+    # ── Sweeping ──────────────────────────────────────────────────────────────
+
+    def _scan_blobs(self) -> list[SessionInfo]:
+        found = []
+        if self.blob_root is None:
+            return found
+        try:
+            entries = list(os.scandir(self.blob_root))
+        except FileNotFoundError:
+            return found
+        for entry in entries:
+            try:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                path = Path(entry.path)
+                found.append(SessionInfo(path, entry.stat().st_mtime, dir_size(path)))
+            except OSError:
+                continue  # removed while scanning
+        return found
+
+    def scan(self) -> list[SessionInfo]:
+        return self.store.scan()
+
+    def _remove_blob(self, info: SessionInfo) -> bool:
+        """Delete an orphaned blob unless it was used since the scan: a deduplicated
+        upload bumps its mtime and then creates a session referencing it."""
+        try:
+            if info.path.stat().st_mtime > info.last_access:
+                return False
+        except FileNotFoundError:
+            return False
+        if self.store.blob_in_use(info.path.name):
+            return False
+        shutil.rmtree(info.path, ignore_errors=True)
+        return True
+
+    def _remove(self, info: SessionInfo, is_session: bool) -> bool:
+        if is_session:
+            if not self.store.remove(info):
+                return False  # used by another process since the scan
+        elif not self._remove_blob(info):
+            return False
+        if self.on_evict is not None:
+            self.on_evict(info.path)
+        self.evicted_bytes += info.nbytes
+        return True
+
+    def sweep(self) -> None:
+        """One GC pass (blocking; run it in a thread). Skipped while another process sweeps."""
+        if self.lock_path is None:
+            self._sweep()
+            return
+        with file_lock(self.lock_path, blocking=False) as held:
+            if not held:
+                self.skipped_sweeps += 1
+                return
+            self._sweep()
+
+    def _sweep(self) -> None:
+        started = time.monotonic()
+        now = time.time()
+        blobs = {info.path.name: info for info in self._scan_blobs()}
+        sessions = self.scan()
+        refs = Counter(info.blob for info in sessions if info.blob in blobs)
+
+        def blob_size(info: SessionInfo) -> int:
+            blob = blobs.get(info.blob)
+            return blob.nbytes if blob is not None else 0
+
+        def evict(info: SessionInfo, reason: str) -> bool:
+            if not self._remove(info, is_session=True):
+                return False
+            self.evicted_sessions += 1
+            self.evictions_by_reason[reason] += 1
+            if info.blob in refs:
+                refs[info.blob] -= 1
+            return True
+
+        kept = []
+        for info in sessions:
+            idle = now - info.last_access
+            if idle < self.min_idle:
+                kept.append(info)
+            elif idle > self.max_age:
+                if not evict(info, "age"):
+                    kept.append(info)
+            elif info.nbytes + blob_size(info) > self.max_session_bytes:
+                if not evict(info, "size"):
+                    kept.append(info)
+            else:
+                kept.append(info)
+
+        total = sum(info.nbytes for info in kept) + sum(b.nbytes for b in blobs.values())
+        if total > self.quota_bytes:
+            target = self.quota_bytes * self.low_water
+            for info in sorted(kept, key=lambda i: i.last_access):
+                if total <= target:
+                    break
+                if now - info.last_access < self.min_idle:
+                    continue
+                if not evict(info, "quota"):
+                    continue
+                kept.remove(info)
+                total -= info.nbytes
+                # Its blob goes too if nobody else uses it (counted below)
+                if info.blob in refs and refs[info.blob] == 0:
+                    total -= blob_size(info)
+
+        remaining = []
+        for name, blob in blobs.items():
+            if (refs[name] == 0 and now - blob.last_access >= self.min_idle
+                    and self._remove(blob, is_session=False)):
+                self.evicted_blobs += 1
+                self.evictions_by_reason["orphan"] += 1
+            else:
+                remaining.append(blob)
+
+        if self.results is not None:
+            self.pruned_results += self.results.prune()
+
+        self.sessions = len(kept)
+        self.blobs = len(remaining)
+        self.bytes = sum(info.nbytes for info in kept) + sum(b.nbytes for b in remaining)
+        self.sweeps += 1
+        self.last_sweep_at = now
+        self.last_sweep_seconds = time.monotonic() - started
+
+    # ── Background task ───────────────────────────────────────────────────────
+
+    def note_upload(self, nbytes: int) -> None:
+        """Account for a new session (nbytes: newly stored bytes, 0 for a deduplicated
+        upload, otherwise a new blob); sweep early if it pushes the total over quota."""
+        self.sessions += 1
+        if nbytes > 0:
+            self.blobs += 1
+        self.bytes += nbytes
+        if self.bytes > self.quota_bytes and self._wake is not None:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception:
+                logger.exception("Session GC sweep failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        """The shared stores' own stats, and this process's janitor counters under
+        "process" (blocking: reads the stores)."""
+        return {
+            "store": self.store.stats(),
+            **({"results": self.results.stats()} if self.results is not None else {}),
+            "quota_bytes": self.quota_bytes,
+            "process": {
+                "pid": os.getpid(),
+                "sessions": self.sessions,
+                "blobs": self.blobs,
+                "bytes": self.bytes,
+                "evicted_sessions": self.evicted_sessions,
+                "evicted_blobs": self.evicted_blobs,
+                "evicted_bytes": self.evicted_bytes,
+                "evictions_by_reason": dict(self.evictions_by_reason),
+                "pruned_results": self.pruned_results,
+                "sweeps": self.sweeps,
+                "skipped_sweeps": self.skipped_sweeps,
+                "last_sweep_at": self.last_sweep_at,
+                "last_sweep_seconds": self.last_sweep_seconds,
+            },
+        }
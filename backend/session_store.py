@@ -0,0 +1,316 @@
+"""
+Where v2 sessions are recorded (SESSION_BACKEND).
+
+A session is small: the id of the uploaded blob and the sheet view picked for it.
+The upload itself, its Feather files and profiles live in the blob store
+(session_data.store_upload), which is content-addressed and never changed in
+place, so any number of worker processes, or replicas mounting the same
+SESSION_STORE_ROOT, can share it. Only the session records need to agree
+between processes, and every request reads them from here rather than from a
+per-process cache:
+
+    files   one folder per session holding `blob` and `sheet.json` (the original
+            layout; files are replaced atomically), last access = folder mtime
+    sqlite  one row per session in a SQLite database next to the blob store;
+            SQLite's own file locking serializes writers across processes
+
+Both remove a session only if it has not been used since the janitor looked at
+it, so a sweep in one process cannot delete a session another process just touched;
+blob_in_use() lets the janitor re-check a blob's references the same way.
+
+Chart results of v2 generation (ChartResultStore) are shared the same way, as one
+JSON file per result id next to the sessions, so /api/downsample can find a chart
+whichever worker generated it.
+"""
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from session_data import load_session_blob, load_session_sheet, save_session_blob, save_session_sheet
+from session_gc import SessionInfo, dir_size, touch_session
+
+
+@dataclass
+class SessionMeta:
+    blob: str | None           # None: a session from before the blob store, upload in its folder
+    sheet: dict | None = None  # {"index", "sheet", "range"}; None = the default view
+
+
+class FileSessionStore:
+    """Sessions as folders under root."""
+
+    backend = "files"
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, session_id: str) -> Path:
+        return self.root / session_id
+
+    def create(self, session_id: str, blob: str, sheet: dict | None) -> None:
+        ws = self.path(session_id)
+        ws.mkdir(parents=True, exist_ok=True)
+        save_session_blob(ws, blob)
+        save_session_sheet(ws, sheet)
+
+    def get(self, session_id: str) -> SessionMeta | None:
+        ws = self.path(session_id)
+        if not ws.is_dir():
+            return None
+        return SessionMeta(load_session_blob(ws), load_session_sheet(ws))
+
+    def set_sheet(self, session_id: str, sheet: dict | None) -> None:
+        save_session_sheet(self.path(session_id), sheet)
+
+    def touch(self, session_id: str) -> None:
+        touch_session(self.path(session_id))
+
+    def scan(self) -> list[SessionInfo]:
+        found = []
+        try:
+            entries = list(self.root.iterdir())
+        except FileNotFoundError:
+            return found
+        for path in entries:
+            try:
+                if not path.is_dir() or path.is_symlink():
+                    continue
+                info = SessionInfo(path, path.stat().st_mtime, dir_size(path))
+            except OSError:
+                continue  # removed while scanning
+            info.blob = load_session_blob(path)
+            found.append(info)
+        return found
+
+    def remove(self, info: SessionInfo) -> bool:
+        try:
+            if info.path.stat().st_mtime > info.last_access:
+                return False  # used since the scan
+        except FileNotFoundError:
+            return False
+        shutil.rmtree(info.path, ignore_errors=True)
+        return True
+
+    def blob_in_use(self, blob: str) -> bool:
+        """Whether any session references blob right now (not as of the last scan)."""
+        try:
+            entries = list(self.root.iterdir())
+        except FileNotFoundError:
+            return False
+        return any(load_session_blob(path) == blob for path in entries)
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, "root": str(self.root)}
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteSessionStore:
+    """Sessions as rows of a SQLite database shared by every worker process.
+
+    `journal_mode` is WAL by default; use DELETE (a rollback journal, plain file
+    locks) when the database sits on a network filesystem shared by several hosts,
+    where WAL's shared-memory index does not work.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: Path, session_root: Path, journal_mode: str = "WAL"):
+        self.path = path
+        # Sessions have no folder of their own; SessionInfo.path is root/<id> by convention
+        self.session_root = session_root
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY,"
+            " blob TEXT,"
+            " sheet TEXT,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_blob ON sessions (blob)")
+        self._conn.commit()
+
+    def _write(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    def create(self, session_id: str, blob: str, sheet: dict | None) -> None:
+        now = time.time()
+        self._write(
+            "INSERT OR REPLACE INTO sessions (id, blob, sheet, created_at, last_access)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (session_id, blob, _dump_sheet(sheet), now, now),
+        )
+
+    def get(self, session_id: str) -> SessionMeta | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT blob, sheet FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return SessionMeta(row[0], _load_sheet(row[1]))
+
+    def set_sheet(self, session_id: str, sheet: dict | None) -> None:
+        self._write("UPDATE sessions SET sheet = ? WHERE id = ?", (_dump_sheet(sheet), session_id))
+
+    def touch(self, session_id: str) -> None:
+        self._write("UPDATE sessions SET last_access = ? WHERE id = ?", (time.time(), session_id))
+
+    def scan(self) -> list[SessionInfo]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, blob, last_access FROM sessions").fetchall()
+        return [SessionInfo(self.session_root / session_id, last_access, 0, blob)
+                for session_id, blob, last_access in rows]
+
+    def remove(self, info: SessionInfo) -> bool:
+        return self._write(
+            "DELETE FROM sessions WHERE id = ? AND last_access <= ?",
+            (info.path.name, info.last_access),
+        ) > 0
+
+    def blob_in_use(self, blob: str) -> bool:
+        """Whether any session references blob right now (not as of the last scan)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM sessions WHERE blob = ? LIMIT 1", (blob,)).fetchone()
+        return row is not None
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"backend": self.backend, "path": str(self.path), "entries": entries}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ChartResultStore:
+    """Full-resolution chart configs by result id (a hex digest), one JSON file each.
+
+    Entries expire `ttl` seconds after they are written; prune() (run by the
+    session janitor) deletes expired files, then the oldest ones while the total
+    is over max_bytes.
+    """
+
+    _ID = re.compile(r"^[0-9a-f]{64}$")
+
+    def __init__(self, root: Path, ttl: float, max_bytes: int):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, result_id: str) -> Path | None:
+        # Ids come from clients too: only ever a file name inside root
+        return self.root / f"{result_id}.json" if self._ID.match(result_id) else None
+
+    def put(self, result_id: str, config: dict) -> None:
+        path = self._path(result_id)
+        if path is None:
+            raise ValueError(f"Invalid result id {result_id!r}")
+        tmp = self.root / f".{result_id}.{uuid.uuid4().hex}.tmp"
+        try:
+            tmp.write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def get(self, result_id: str) -> dict | None:
+        """The stored config, or None if unknown or expired."""
+        path = self._path(result_id)
+        if path is None:
+            return None
+        try:
+            if time.time() - path.stat().st_mtime >= self.ttl:
+                return None
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def size(self, result_id: str) -> int:
+        """Bytes of a stored result (0 if unknown)."""
+        path = self._path(result_id)
+        try:
+            return path.stat().st_size if path is not None else 0
+        except OSError:
+            return 0
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        found = []
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return found
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            found.append((st.st_mtime, st.st_size, Path(entry.path)))
+        return found
+
+    def prune(self) -> int:
+        """Delete expired results, then the oldest while over max_bytes; returns how many."""
+        now = time.time()
+        removed = 0
+        kept = []
+        for mtime, size, path in sorted(self._entries()):
+            if now - mtime >= self.ttl:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                kept.append((size, path))
+        total = sum(size for size, _ in kept)
+        for size, path in kept:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {"root": str(self.root), "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes}
+
+
+def _dump_sheet(sheet: dict | None) -> str | None:
+    return json.dumps(sheet, ensure_ascii=False) if sheet is not None else None
+
+
+def _load_sheet(text: str | None) -> dict | None:
+    return json.loads(text) if text else None
+
+
+SessionStore = FileSessionStore | SQLiteSessionStore
+
+
+def create_session_store(backend: str, root: Path, journal_mode: str = "WAL") -> SessionStore:
+    """The session store for SESSION_BACKEND, keeping its data under root."""
+    if backend == "files":
+        return FileSessionStore(root / "v2-sessions")
+    if backend == "sqlite":
+        return SQLiteSessionStore(root / "v2-sessions.sqlite3", root / "v2-sessions", journal_mode)
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r} (expected 'files' or 'sqlite')")
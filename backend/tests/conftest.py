@@ -0,0 +1,26 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# The backend modules are flat and imported by name (as under `uvicorn main:app`)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture
+def pool():
+    """A one-worker sandbox pool whose worker is warm and idle."""
+    from sandbox import SandboxPool
+
+    pool = SandboxPool(1, 50)
+    if not pool.enabled:
+        pytest.skip("the worker pool needs fork()")
+    pool.start()
+    deadline = time.monotonic() + 60
+    while pool.stats()["idle"] < 1:
+        if time.monotonic() > deadline:
+            pytest.fail("sandbox worker did not start")
+        time.sleep(0.05)
+    yield pool
+    pool.close()
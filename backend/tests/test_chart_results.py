@@ -0,0 +1,46 @@
+"""
+Chart results shared between worker processes.
+"""
+import os
+import time
+
+from session_store import ChartResultStore
+
+ID_A = "a" * 64
+ID_B = "b" * 64
+
+
+def test_put_get(tmp_path):
+    store = ChartResultStore(tmp_path, ttl=60, max_bytes=1 << 20)
+    store.put(ID_A, {"series": [{"data": [1, None, 3]}]})
+    # Another process with its own instance sees it
+    assert ChartResultStore(tmp_path, ttl=60, max_bytes=1 << 20).get(ID_A) == {
+        "series": [{"data": [1, None, 3]}]}
+    assert store.get(ID_B) is None
+
+
+def test_ids_are_file_names_only(tmp_path):
+    store = ChartResultStore(tmp_path / "results", ttl=60, max_bytes=1 << 20)
+    (tmp_path / "secret.json").write_text("{}")
+    assert store.get("../secret") is None
+    assert store.get(ID_A.upper()) is None
+
+
+def test_expiry_and_prune(tmp_path):
+    store = ChartResultStore(tmp_path, ttl=60, max_bytes=1 << 20)
+    store.put(ID_A, {"x": 1})
+    store.put(ID_B, {"x": 2})
+    old = time.time() - 120
+    os.utime(tmp_path / f"{ID_A}.json", (old, old))
+    assert store.get(ID_A) is None
+    assert store.prune() == 1
+    assert store.stats()["entries"] == 1 and store.get(ID_B) == {"x": 2}
+
+
+def test_prune_to_byte_budget_drops_oldest(tmp_path):
+    store = ChartResultStore(tmp_path, ttl=60, max_bytes=30)
+    store.put(ID_A, {"data": "x" * 10})
+    os.utime(tmp_path / f"{ID_A}.json", (time.time() - 10,) * 2)
+    store.put(ID_B, {"data": "y" * 10})
+    assert store.prune() == 1
+    assert store.get(ID_A) is None and store.get(ID_B) is not None
@@ -0,0 +1,132 @@
+"""Downsampling chart series: endpoints, extremes and null gaps survive."""
+import numpy as np
+import pytest
+
+from downsample import (downsample_chart_config, downsample_dated, downsample_points,
+                        gap_indices, lttb_indices, minmax_indices, resolve_mode,
+                        select_indices)
+
+N = 10_000
+
+
+@pytest.fixture
+def noisy():
+    rng = np.random.default_rng(0)
+    x = np.arange(N, dtype=np.float64)
+    y = np.cumsum(rng.normal(size=N))
+    y[1234] = 1e6   # a spike
+    y[5678] = -1e6  # and a dip
+    return x, y
+
+
+@pytest.mark.parametrize("n_out", [3, 100, 999])
+def test_lttb_keeps_endpoints(noisy, n_out):
+    x, y = noisy
+    idx = lttb_indices(x, y, n_out)
+    assert len(idx) == n_out
+    assert idx[0] == 0 and idx[-1] == N - 1
+    assert np.all(np.diff(idx) > 0)
+
+
+@pytest.mark.parametrize("n_out", [4, 100, 1000])
+def test_minmax_keeps_endpoints_and_extremes(noisy, n_out):
+    x, y = noisy
+    idx = minmax_indices(y, n_out)
+    assert len(idx) <= n_out
+    assert idx[0] == 0 and idx[-1] == N - 1
+    assert {1234, 5678} <= set(idx.tolist())
+
+
+@pytest.mark.parametrize("n_out", [N, N + 1])
+def test_short_series_kept_whole(noisy, n_out):
+    x, y = noisy
+    assert np.array_equal(lttb_indices(x, y, n_out), np.arange(N))
+    assert np.array_equal(minmax_indices(y, n_out), np.arange(N))
+
+
+def test_gap_indices_marks_first_null_of_each_run():
+    y = np.array([1, np.nan, np.nan, 2, 3, np.nan, 4, np.nan])
+    x = np.arange(len(y), dtype=np.float64)
+    assert gap_indices(x, y).tolist() == [1, 5, 7]
+
+
+@pytest.mark.parametrize("mode", ["lttb", "minmax"])
+def test_select_keeps_one_null_per_gap(noisy, mode):
+    x, y = noisy
+    y = y.copy()
+    y[2000:2100] = np.nan
+    y[7000] = np.nan
+    idx = select_indices(x, y, 200, mode)
+    assert idx[0] == 0 and idx[-1] == N - 1
+    nulls = idx[~np.isfinite(y[idx])].tolist()
+    assert nulls == [2000, 7000]
+    assert np.all(np.diff(idx) > 0)
+
+
+@pytest.mark.parametrize("mode", ["lttb", "minmax"])
+def test_downsample_points_values(mode):
+    data = [float(i % 7) for i in range(N)]
+    data[500] = None
+    out = downsample_points(data, 100, mode, point_start=10, point_interval=2)
+    assert out[0] == [10.0, data[0]]
+    assert out[-1] == [10.0 + 2 * (N - 1), data[-1]]
+    assert [10.0 + 2 * 500, None] in out
+    assert len(out) <= 101
+
+
+@pytest.mark.parametrize("mode", ["lttb", "minmax"])
+def test_downsample_points_pairs_and_objects(mode):
+    pairs = [[i, (i * 37) % 101] for i in range(N)]
+    pairs[42] = [42, None]
+    out = downsample_points(pairs, 100, mode)
+    assert out[0] is pairs[0] and out[-1] is pairs[-1]
+    assert pairs[42] in out
+
+    objects = [{"x": i, "y": (i * 37) % 101, "name": str(i)} for i in range(N)]
+    out = downsample_points(objects, 100, mode)
+    assert out[0] is objects[0] and out[-1] is objects[-1]
+
+
+def test_downsample_points_leaves_short_and_unsorted_data():
+    data = [1, 2, 3]
+    assert downsample_points(data, 10) is data
+    assert downsample_points([[2, 1], [1, 2], [0, 3]], 2) is None
+    assert downsample_points(["a", "b", "c"], 2) is None
+
+
+def test_downsample_points_x_range():
+    data = [[i, i % 13] for i in range(N)]
+    out = downsample_points(data, 50, x_range=(1000, 2000))
+    assert out[0] == [1000, 1000 % 13] and out[-1] == [2000, 2000 % 13]
+    assert len(out) <= 50
+
+
+def test_downsample_dated_keeps_endpoints_and_gaps():
+    dates = np.arange("2000-01-01", "2027-01-01", dtype="datetime64[D]")
+    points = [{"date": str(d), "value": i % 17} for i, d in enumerate(dates)]
+    points[3000]["value"] = None
+    out = downsample_dated(points, 300, "minmax")
+    assert out[0] is points[0] and out[-1] is points[-1]
+    assert points[3000] in out
+    assert len(out) <= 301
+    assert downsample_dated(points[:10], 300) == points[:10]
+
+
+def test_downsample_chart_config_skips_categories():
+    data = list(range(N))
+    config = {"series": [{"type": "line", "data": data}]}
+    reduced = downsample_chart_config(config, 100)
+    assert reduced is not config and len(reduced["series"][0]["data"]) <= 100
+    assert config["series"][0]["data"] is data
+    categorical = {**config, "xAxis": {"categories": [str(i) for i in data]}}
+    assert downsample_chart_config(categorical, 100) is categorical
+
+
+@pytest.mark.parametrize("mode, width, expected", [
+    (None, None, "none"),
+    (None, 1200, "lttb"),
+    ("minmax", None, "minmax"),
+    ("none", 1200, "none"),
+])
+def test_resolve_mode(mode, width, expected):
+    assert resolve_mode(mode, width) == expected
@@ -0,0 +1,108 @@
+"""
+Upload ingestion: CSV encoding detection and Excel cell ranges.
+"""
+import codecs
+
+import pandas as pd
+import pytest
+
+import ingest
+from ingest import CellRange, EmptyCellRange, detect_encoding, parse_cell_range, read_excel
+
+TRADITIONAL = "日期,地區,銷售額\n2024-01-01,臺北市,1200\n2024-01-02,高雄市,980\n2024-01-03,臺中市,1100\n"
+SIMPLIFIED = "日期,地区,销售额\n2024-01-01,北京市,1200\n2024-01-02,上海市,980\n2024-01-03,广州市,1100\n"
+
+
+@pytest.mark.parametrize("text, encoding, expected", [
+    (TRADITIONAL, "cp950", "cp950"),
+    (TRADITIONAL, "big5", "cp950"),  # read as its Windows superset
+    (SIMPLIFIED, "gbk", "gbk"),
+    (SIMPLIFIED, "utf-8", "utf-8"),
+    ("a,b,c\n1,2,3\n", "ascii", "utf-8"),
+])
+def test_detect_encoding(tmp_path, text, encoding, expected):
+    path = tmp_path / "data.csv"
+    path.write_bytes(text.encode(encoding))
+    assert detect_encoding(path).encoding == expected
+    assert pd.read_csv(path, encoding=expected).shape == (text.count("\n") - 1, 3)
+
+
+def test_detect_encoding_bom(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(codecs.BOM_UTF8 + TRADITIONAL.encode("utf-8"))
+    guess = detect_encoding(path)
+    assert guess.encoding == "utf-8-sig" and guess.confidence == 1.0
+    assert list(pd.read_csv(path, encoding=guess.encoding).columns) == ["日期", "地區", "銷售額"]
+
+
+def test_detect_encoding_sees_past_an_ascii_head(tmp_path):
+    # Big exports often start with plain ASCII rows; the tail windows find the rest
+    path = tmp_path / "data.csv"
+    head = "id,name\n" + "".join(f"{i},row{i}\n" for i in range(20_000))
+    path.write_bytes(head.encode("ascii") + "20000,臺北市銷售額\n".encode("cp950") * 50)
+    assert detect_encoding(path, sample_size=16 * 1024).encoding == "cp950"
+
+
+def test_detect_encoding_rejects_binary(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(bytes(range(0x80, 0x100)) * 4)
+    with pytest.raises(ValueError):
+        detect_encoding(path)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("A1", CellRange(1, 1)),
+    ("b2", CellRange(2, 2)),
+    ("$C$3", CellRange(3, 3)),
+    ("B2:H500", CellRange(2, 2, 500, 8)),
+    ("H500:B2", CellRange(2, 2, 500, 8)),  # corners in any order
+    (" A1 : AB10 ", CellRange(1, 1, 10, 28)),
+    ("XFD1048576", CellRange(1_048_576, 16_384)),
+])
+def test_parse_cell_range(text, expected):
+    assert parse_cell_range(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "A", "1", "A0", "A1:B0", "A0:B2", "XFE1", "ZZZ1",
+                                  "A1048577", "A1:B2:C3", "1A"])
+def test_parse_cell_range_rejects(text):
+    with pytest.raises(ValueError):
+        parse_cell_range(text)
+
+
+def test_cell_range_round_trips():
+    for text in ("A1", "B2:H500", "AA10:AZ20"):
+        assert str(parse_cell_range(text)) == text
+
+
+@pytest.fixture(params=["calamine", "openpyxl"])
+def engine(request, monkeypatch):
+    if request.param == "calamine" and ingest.EXCEL_ENGINE != "calamine":
+        pytest.skip("python-calamine is not installed")
+    monkeypatch.setattr(ingest, "EXCEL_ENGINE", request.param)
+    return request.param
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "data.xlsx"
+    pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"], "c": [1.5, 2.5, 3.5]}).to_excel(path, index=False)
+    return path
+
+
+def test_read_excel_range(engine, workbook):
+    df = read_excel(workbook, cell_range=parse_cell_range("B1:C3"))
+    assert list(df.columns) == ["b", "c"]
+    assert df["c"].tolist() == [1.5, 2.5]
+
+
+def test_read_excel_range_past_the_used_columns(engine, workbook):
+    df = read_excel(workbook, cell_range=parse_cell_range("C1:Z100"))
+    assert list(df.columns) == ["c"]
+    assert len(df) == 3
+
+
+@pytest.mark.parametrize("text", ["A100", "F1", "E2:G9"])
+def test_read_excel_empty_range(engine, workbook, text):
+    with pytest.raises(EmptyCellRange):
+        read_excel(workbook, cell_range=parse_cell_range(text))
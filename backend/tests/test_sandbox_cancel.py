@@ -0,0 +1,43 @@
+"""
+Stopping a pooled sandbox job through its SandboxHandle.
+"""
+import threading
+import time
+
+import pytest
+
+import sandbox
+from sandbox import SandboxCancelled, SandboxHandle
+
+
+def test_cancel_while_running(pool):
+    handle = SandboxHandle()
+    start = time.monotonic()
+    with pytest.raises(SandboxCancelled):
+        threading.Timer(0.5, handle.cancel).start()
+        pool.run("while True:\n    pass", timeout=20, handle=handle)
+    assert time.monotonic() - start < 5
+    assert pool.recycled == 0  # the worker stays in the pool
+    assert pool.run("print(1)", timeout=20) == ("1\n", "")
+
+
+def test_cancel_right_after_started(pool, monkeypatch):
+    """A handle cancelled as soon as the job's child is forked still stops the job:
+    the kill is sent on "started", before the worker starts waiting for the child."""
+    handle = SandboxHandle()
+    read_reply = sandbox._Worker._read_reply
+
+    def cancel_on_started(self, timeout):
+        reply = read_reply(self, timeout)
+        if reply.get("started"):
+            handle.cancel()
+        return reply
+
+    monkeypatch.setattr(sandbox._Worker, "_read_reply", cancel_on_started)
+    start = time.monotonic()
+    for _ in range(5):
+        handle.cancelled = False
+        with pytest.raises(SandboxCancelled):
+            pool.run("while True:\n    pass", timeout=10, handle=handle)
+    assert time.monotonic() - start < 5
+    assert pool.recycled == 0
@@ -0,0 +1,69 @@
+"""
+Resource limits of the v2 sandbox, on both execution paths.
+
+Every limit is set far below the production defaults so a job crosses it in well
+under a second of work; see JOB_LIMITS in sandbox.py.
+"""
+import signal
+
+import pytest
+
+import sandbox
+from sandbox import SandboxLimitExceeded, run_cold
+
+LIMITS = {"memory": 256 * 1024 * 1024, "cpu": 1, "files": 16, "output": 1024 * 1024}
+
+# limit name -> (code that crosses it, the value SandboxLimitExceeded reports)
+CASES = {
+    "memory": ("x = bytearray(2 * 1024 ** 3)", LIMITS["memory"]),
+    "cpu": ("while True:\n    pass", LIMITS["cpu"]),
+    "open_files": ("fs = [open('/dev/null') for _ in range(100)]", LIMITS["files"]),
+    "output": ("print('x' * (5 * 1024 * 1024))", LIMITS["output"]),
+}
+
+
+@pytest.fixture(autouse=True)
+def small_limits(monkeypatch):
+    monkeypatch.setattr(sandbox, "JOB_LIMITS", dict(LIMITS))
+
+
+@pytest.mark.parametrize("limit", CASES)
+def test_pooled_limit(pool, limit):
+    code, value = CASES[limit]
+    timings = {}
+    with pytest.raises(SandboxLimitExceeded) as exc:
+        pool.run(code, timeout=20, timings=timings)
+    assert exc.value.limit == limit
+    assert exc.value.value == value
+    assert timings["path"] == "pooled"
+    assert pool.recycled == 1
+
+
+@pytest.mark.parametrize("limit", CASES)
+def test_cold_limit(limit):
+    code, value = CASES[limit]
+    with pytest.raises(SandboxLimitExceeded) as exc:
+        run_cold(code, timeout=20)
+    assert exc.value.limit == limit
+    assert exc.value.value == value
+
+
+def test_pooled_job_within_limits(pool):
+    assert pool.run("print(sum(range(10)))", timeout=20) == ("45\n", "")
+    assert pool.recycled == 0
+
+
+def test_sigkill_is_cpu_only_with_budget_used():
+    # An OOM kill or an operator's kill -9 is not a CPU-limit hit
+    assert sandbox._limit_hit(LIMITS, -signal.SIGKILL, "", 0, cpu_seconds=0.1) is None
+    assert sandbox._limit_hit(LIMITS, -signal.SIGKILL, "", 0) is None
+    hit = sandbox._limit_hit(LIMITS, -signal.SIGKILL, "", 0, cpu_seconds=LIMITS["cpu"] + 1.0)
+    assert hit.limit == "cpu"
+    assert sandbox._limit_hit(LIMITS, -signal.SIGXCPU, "", 0).limit == "cpu"
+
+
+def test_limits_come_from_the_job():
+    # The thresholds are the ones the job ran with, not the configured defaults
+    limits = {**LIMITS, "output": 10}
+    assert sandbox._limit_hit(limits, 0, "", 10).value == 10
+    assert sandbox._limit_hit(LIMITS, 0, "", 10) is None
@@ -0,0 +1,42 @@
+"""
+/api/search-database: the cache key is normalized, the Solr query is not.
+"""
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from http_clients import http_clients
+
+
+@pytest.fixture
+def solr(monkeypatch):
+    queries = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        queries.append(request.url.params["q"])
+        return httpx.Response(200, json={"response": {"docs": [
+            {"id": 1, "is_public": 1, "name_tc": "GDP", "score": 1.0}]}})
+
+    monkeypatch.setenv("SOLR_API_URL", "http://solr.test/select")
+    monkeypatch.setitem(http_clients._clients, "solr",
+                        httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    main.search_cache.clear()
+    return queries
+
+
+def test_query_is_sent_as_typed(solr):
+    client = TestClient(main.app)
+    r = client.post("/api/search-database", json={"query": "  GDP AND Taiwan "})
+    assert r.status_code == 200 and r.json()["items"][0]["name_tc"] == "GDP"
+    assert solr == ["GDP AND Taiwan"]
+
+
+def test_whitespace_variants_share_a_cache_entry(solr):
+    client = TestClient(main.app)
+    client.post("/api/search-database", json={"query": "GDP  Taiwan"})
+    client.post("/api/search-database", json={"query": " GDP Taiwan "})
+    assert solr == ["GDP  Taiwan"]
+    # Case changes what Lucene matches (AND/OR/NOT, string fields): not the same query
+    client.post("/api/search-database", json={"query": "gdp taiwan"})
+    assert solr == ["GDP  Taiwan", "gdp taiwan"]
@@ -0,0 +1,70 @@
+"""serialize.df_to_records against the row-by-row converter it replaced."""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from serialize import df_to_records
+
+
+def _legacy_df_to_records(df: pd.DataFrame) -> list[dict]:
+    # The former v2_routes._df_to_records, kept verbatim as the reference
+    records = []
+    for row in df.to_dict(orient="records"):
+        clean = {}
+        for k, v in row.items():
+            if isinstance(v, pd.Timestamp):
+                clean[k] = None if pd.isna(v) else v.isoformat()
+            elif isinstance(v, float) and pd.isna(v):
+                clean[k] = None
+            elif not isinstance(v, (list, dict)) and pd.isna(v):
+                clean[k] = None
+            elif hasattr(v, "item"):
+                clean[k] = v.item()
+            else:
+                clean[k] = v
+        records.append(clean)
+    return records
+
+
+COLUMNS = {
+    "datetime": pd.Series(pd.to_datetime(
+        ["2024-01-01", "2024-01-01 12:30:00.250", None, "1999-12-31 23:59:59"], format="ISO8601")),
+    "datetime_ns": pd.Series(pd.to_datetime(
+        ["2024-01-01 00:00:00.000000001", None, "2024-01-02", "2024-01-03"], format="ISO8601").astype("datetime64[ns]")),
+    "datetime_tz": pd.Series(pd.to_datetime(
+        ["2024-01-01", None, "2024-06-01 08:00", "2024-12-31"], format="ISO8601")).dt.tz_localize("Asia/Taipei"),
+    "float_nan": pd.Series([1.5, np.nan, -0.0, 1e300]),
+    "int64": pd.Series([1, 2, 3, 4], dtype="int64"),
+    "Int64": pd.Series([1, None, 3, -4], dtype="Int64"),
+    "Float64": pd.Series([0.5, None, 2.0, 3.25], dtype="Float64"),
+    "boolean": pd.Series([True, None, False, True], dtype="boolean"),
+    "bool": pd.Series([True, False, True, False]),
+    "category": pd.Series(["a", None, "b", "a"], dtype="category"),
+    "int_category": pd.Series([1, 2, None, 1], dtype="category"),
+    "object": pd.Series(["x", None, 3, pd.Timestamp("2024-01-01")], dtype=object),
+    "string": pd.Series(["台北", None, "", "b"], dtype="string"),
+}
+
+
+@pytest.mark.parametrize("name", COLUMNS)
+def test_matches_legacy(name):
+    df = pd.DataFrame({name: COLUMNS[name]})
+    expected = _legacy_df_to_records(df)
+    assert df_to_records(df) == expected
+    assert json.dumps(df_to_records(df)) == json.dumps(expected)
+
+
+def test_matches_legacy_on_a_mixed_frame():
+    df = pd.DataFrame(COLUMNS)
+    assert json.dumps(df_to_records(df)) == json.dumps(_legacy_df_to_records(df))
+
+
+def test_all_missing_datetime():
+    df = pd.DataFrame({"t": pd.Series([pd.NaT, pd.NaT], dtype="datetime64[ns]")})
+    assert df_to_records(df) == [{"t": None}, {"t": None}]
+
+
+def test_no_columns():
+    assert df_to_records(pd.DataFrame(index=range(3))) == []
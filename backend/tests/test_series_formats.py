@@ -0,0 +1,72 @@
+"""Accept negotiation and the columnar encodings of /api/load-database-data."""
+import json
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pytest
+
+import series_formats
+from series_formats import ARROW_STREAM, COLUMNAR_JSON, JSON, MSGPACK, encode, negotiate
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, JSON),
+    ("", JSON),
+    ("*/*", JSON),
+    ("text/html", JSON),
+    ("application/json", JSON),
+    (COLUMNAR_JSON, COLUMNAR_JSON),
+    (f"{ARROW_STREAM}, {JSON};q=0.5", ARROW_STREAM),
+    (f"{JSON};q=0.5, {ARROW_STREAM}", ARROW_STREAM),
+    (f"{ARROW_STREAM};q=0.4, {COLUMNAR_JSON};q=0.8", COLUMNAR_JSON),
+    (f"{COLUMNAR_JSON}, {ARROW_STREAM}", COLUMNAR_JSON),  # tie: first listed
+    (f"{ARROW_STREAM};q=0, {JSON}", JSON),
+    (f"{ARROW_STREAM};q=oops", JSON),
+    ("APPLICATION/VND.APACHE.ARROW.STREAM", ARROW_STREAM),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def test_msgpack_only_when_installed(monkeypatch):
+    monkeypatch.setattr(series_formats, "msgpack", None)
+    assert negotiate(MSGPACK) == JSON
+    assert negotiate(f"{MSGPACK}, {COLUMNAR_JSON};q=0.5") == COLUMNAR_JSON
+    monkeypatch.setattr(series_formats, "msgpack", object())
+    assert negotiate(MSGPACK) == MSGPACK
+    assert negotiate("application/x-msgpack") == MSGPACK
+
+
+SERIES = [
+    SimpleNamespace(id="A01", name_tc="甲", name_en="A", data=[
+        {"date": "2024-01-01", "value": 1.5},
+        {"date": "2024-02-01", "value": None},
+        {"date": "not a date", "value": 3},
+        {"date": "2024-03-01", "value": "4"},
+    ]),
+    SimpleNamespace(id="B02", name_tc="乙", name_en="B", data=[]),
+]
+STAMPS = [1704067200000, 1706745600000, 1709251200000]
+
+
+def test_columnar_json():
+    body = json.loads(encode(COLUMNAR_JSON, SERIES))
+    first, second = body["time_series"]
+    assert first == {"id": "A01", "name_tc": "甲", "name_en": "A",
+                     "timestamps": STAMPS, "values": [1.5, None, 4.0]}
+    assert second["timestamps"] == [] and second["values"] == []
+
+
+def test_arrow_stream():
+    table = pa.ipc.open_stream(encode(ARROW_STREAM, SERIES)).read_all()
+    assert table.column("id").to_pylist() == ["A01"] * 3
+    assert [t.value for t in table.column("timestamp")] == STAMPS
+    assert table.column("value").to_pylist() == [1.5, None, 4.0]
+    meta = json.loads(table.schema.metadata[b"series"])
+    assert [m["id"] for m in meta] == ["A01", "B02"] and meta[0]["name_tc"] == "甲"
+
+
+def test_msgpack():
+    msgpack = pytest.importorskip("msgpack")
+    body = msgpack.unpackb(encode(MSGPACK, SERIES))
+    assert body == json.loads(encode(COLUMNAR_JSON, SERIES))
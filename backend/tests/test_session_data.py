@@ -0,0 +1,53 @@
+"""
+Session data layer: the Feather conversion of uploads.
+"""
+import openpyxl
+import pandas as pd
+import pytest
+
+from ingest import read_excel
+from session_data import columnar_path, df_cache, load_session_df
+
+
+@pytest.fixture
+def mixed_sheet(tmp_path):
+    """An export whose columns mix numbers and text, as real Excel sheets often do."""
+    path = tmp_path / "data.xlsx"
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.append(["code", "value", 2024])
+    sheet.append([101, 1.5, "a"])
+    sheet.append(["N/A", "-", 7])
+    sheet.append([None, 3, None])
+    book.save(path)
+    return path
+
+
+def test_mixed_columns_are_converted_once(tmp_path, mixed_sheet):
+    ws = tmp_path / "view"
+    ws.mkdir()
+    calls = []
+
+    def parse(path):
+        calls.append(path)
+        return read_excel(path)
+
+    df = load_session_df(ws, mixed_sheet, parse)
+    assert columnar_path(ws).exists()
+    assert list(df.columns) == ["code", "value", "2024"]
+    assert df["code"].tolist()[:2] == ["101", "N/A"] and pd.isna(df["code"].iloc[2])
+
+    # A cache miss reads the Feather file (same frame), never the workbook again
+    df_cache.pop(str(ws))
+    again = load_session_df(ws, mixed_sheet, parse)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(again, df)
+
+
+def test_uniform_columns_keep_their_types(tmp_path):
+    ws = tmp_path / "view"
+    ws.mkdir()
+    source = pd.DataFrame({"n": [1, 2], "x": [0.5, None], "s": ["a", None]})
+    df = load_session_df(ws, tmp_path / "unused.csv", lambda _: source)
+    assert df["n"].dtype == "int64" and df["x"].dtype == "float64"
+    assert df["s"].tolist()[0] == "a" and pd.isna(df["s"].iloc[1])
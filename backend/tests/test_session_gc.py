@@ -0,0 +1,68 @@
+"""
+Session janitor: orphaned blobs are only deleted if still unused at delete time.
+"""
+import io
+import os
+import time
+
+import pytest
+
+from session_data import store_upload
+from session_gc import SessionJanitor
+from session_store import create_session_store
+
+
+@pytest.fixture(params=["files", "sqlite"])
+def store(request, tmp_path):
+    store = create_session_store(request.param, tmp_path)
+    yield store
+    store.close()
+
+
+def _janitor(store, blob_root):
+    return SessionJanitor(store, max_age=3600, max_session_bytes=1 << 30, quota_bytes=1 << 30,
+                          low_water=0.8, min_idle=0, interval=60, blob_root=blob_root)
+
+
+def _old_blob(blob_root, content=b"a,b\n1,2\n"):
+    blob_id, blob, _ = store_upload(io.BytesIO(content), ".csv", blob_root, 1 << 20)
+    old = time.time() - 600
+    os.utime(blob, (old, old))
+    return blob_id, blob
+
+
+def test_orphan_blob_is_deleted(store, tmp_path):
+    blob_id, blob = _old_blob(tmp_path / "blobs")
+    janitor = _janitor(store, tmp_path / "blobs")
+    janitor.sweep()
+    assert not blob.exists()
+    assert janitor.evicted_blobs == 1
+
+
+def test_blob_referenced_after_the_scan_is_kept(store, tmp_path, monkeypatch):
+    blob_id, blob = _old_blob(tmp_path / "blobs")
+    janitor = _janitor(store, tmp_path / "blobs")
+    # The sweep saw no sessions; one referencing the blob is created before the delete
+    monkeypatch.setattr(janitor, "scan", lambda: [])
+    store.create("s1", blob_id, None)
+    os.utime(blob, (time.time() - 600,) * 2)  # its mtime alone would allow deleting it
+    janitor.sweep()
+    assert blob.exists()
+    assert janitor.evicted_blobs == 0 and janitor.blobs == 1
+
+
+def test_blob_reused_after_the_scan_is_kept(store, tmp_path, monkeypatch):
+    blob_id, blob = _old_blob(tmp_path / "blobs")
+    janitor = _janitor(store, tmp_path / "blobs")
+    scan_blobs = janitor._scan_blobs
+
+    def scan_then_dedup():
+        found = scan_blobs()
+        # A deduplicated upload of the same bytes lands between the scan and the delete
+        assert store_upload(io.BytesIO(b"a,b\n1,2\n"), ".csv", tmp_path / "blobs", 1 << 20)[2] == 0
+        return found
+
+    monkeypatch.setattr(janitor, "_scan_blobs", scan_then_dedup)
+    janitor.sweep()
+    assert blob.exists()
+    assert janitor.evicted_blobs == 0
@@ -0,0 +1,78 @@
+"""
+In-process caching primitives.
+"""
+import asyncio
+
+import ttl_cache
+from ttl_cache import SingleFlight, TTLCache
+
+
+def test_byte_budget_evicts_least_recently_used():
+    cache = TTLCache(maxsize=100, ttl=60, max_bytes=100)
+    cache.set("a", 1, 40)
+    cache.set("b", 2, 40)
+    assert cache.get("a") == 1  # b is now the least recently used
+    cache.set("c", 3, 40)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["bytes"] == 80 and cache.stats()["evictions"] == 1
+
+
+def test_entry_over_the_byte_budget_is_not_stored():
+    cache = TTLCache(maxsize=100, ttl=60, max_bytes=100)
+    cache.set("a", 1, 40)
+    cache.set("big", 2, 101)
+    assert cache.get("big") is None
+    assert cache.get("a") == 1
+
+
+def test_replacing_an_entry_recounts_its_size():
+    cache = TTLCache(maxsize=100, ttl=60, max_bytes=100)
+    cache.set("a", 1, 60)
+    cache.set("a", 2, 30)
+    assert cache.stats()["bytes"] == 30
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=10, ttl=30)
+    cache.set("q", "result")
+    now[0] += 29
+    assert cache.get("q") == "result"
+    now[0] += 1
+    assert cache.get("q") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("q", fetch) for _ in range(5)),
+                                    flight.do("other", fetch))
+
+    assert asyncio.run(main()) == ["result"] * 6
+    assert len(calls) == 2 and flight.coalesced == 4
+    # Nothing is remembered once the call is done
+    assert asyncio.run(flight.do("q", fetch)) == "result" and len(calls) == 3
+
+
+def test_single_flight_failure_reaches_every_waiter():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("q", fail) for _ in range(3)),
+                                    return_exceptions=True)
+
+    assert [type(r) for r in asyncio.run(main())] == [RuntimeError] * 3
@@ -0,0 +1,94 @@
+"""
+Small in-process caching primitives shared by the API endpoints.
+
+TTLCache    thread-safe LRU with per-entry expiry and hit/miss counters, bounded by
+            entry count and optionally by the entries' (caller-reported) sizes
+SingleFlight coalesces concurrent async calls for the same key into one
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float, max_bytes: int | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[Hashable, tuple[float, Any, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the cached value, or None on a miss or an expired entry."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] <= time.monotonic():
+                if item is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, nbytes: int = 0) -> None:
+        """Store value; nbytes is its size as counted against max_bytes."""
+        with self._lock:
+            self._discard(key)
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                # A single entry over budget would just flush everything else
+                return
+            self._items[key] = (time.monotonic() + self.ttl, value, nbytes)
+            self._bytes += nbytes
+            while len(self._items) > self.maxsize or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._discard(next(iter(self._items)))
+                self.evictions += 1
+
+    def _discard(self, key: Hashable) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                **({"bytes": self._bytes, "max_bytes": self.max_bytes}
+                   if self.max_bytes is not None else {}),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class SingleFlight:
+    """While a call for `key` is in flight, later callers await its result instead
+    of starting their own. The call runs as its own task, so a caller that goes
+    away (client disconnect) does not cancel it for the others. Failures propagate
+    to every waiter and are not remembered."""
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
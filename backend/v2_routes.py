@@ -5,29 +5,90 @@ Phase 2 v2 endpoints:
 """
 import ast
 import asyncio
+import hashlib
 import json
+import logging
 import os
 import re
+import shutil
 import subprocess
-import sys
-import tempfile
+import time
 import uuid
+from functools import partial
 from pathlib import Path
-from typing import AsyncIterator
+from typing import AsyncIterator, Callable, Literal
 
 import httpx
 import pandas as pd
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from config import GEMINI_MODEL, MAX_RETRIES, SANDBOX_TIMEOUT
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from config import (DATA_CONTEXT_CACHE_SIZE, DATA_CONTEXT_TOKEN_BUDGET, GEMINI_MODEL,
+                    GENERATE_MAX_CANDIDATES, GENERATE_MAX_EXTRA_CANDIDATES, LLM_RATE_LIMIT_RETRIES,
+                    MAX_RETRIES, SANDBOX_PRELOAD_DF, SANDBOX_RESULT_CACHE_MAX_BYTES,
+                    SANDBOX_RESULT_CACHE_SIZE, SANDBOX_RESULT_CACHE_TTL, SANDBOX_RESULT_STORE_MAX_BYTES, SANDBOX_TIMEOUT, SESSION_BACKEND, SESSION_GC_INTERVAL,
+                    SESSION_MAX_AGE, SESSION_MAX_BYTES, SESSION_MIN_IDLE, SESSION_QUOTA_BYTES,
+                    SESSION_QUOTA_LOW_WATER, SESSION_SQLITE_JOURNAL_MODE, SESSION_STORE_ROOT,
+                    UPLOAD_MAX_BYTES)
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from data_context import build_data_context
+from http_clients import gemini_api_base, http_clients
+from downsample import downsample_chart_config, point_budget, resolve_mode
+from ingest import (CSV_ENCODINGS, CellRange, EmptyCellRange, detect_encoding,
+                    excel_sheet_names, parse_cell_range, read_excel)
+from llm_limiter import BACKGROUND, INTERACTIVE, RETRYABLE_STATUSES, llm_limiter
+from metrics import (StageTimer, candidate_outcomes, error_kind, generate_retries, upstream_errors,
+                     upstream_retries)
+from serialize import df_to_records
+from profiler import DataProfile
+from sandbox import SandboxCancelled, SandboxHandle, SandboxLimitExceeded, run_sandbox
+from session_data import (UploadTooLarge, columnar_path, forget_session, load_session_df,
+                          load_session_hash, load_session_profile, sheet_view_dir, store_upload)
+from session_gc import SessionJanitor, dir_size
+from session_store import ChartResultStore, SessionMeta, create_session_store
+from ttl_cache import TTLCache
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # ── Session storage ─────────────────────────────────────────────────────────
-# Under /tmp so Zeabur ephemeral FS is fine; original uploaded file is transient per session
-SESSION_DIR = Path(tempfile.gettempdir()) / "v2-sessions"
-SESSION_DIR.mkdir(exist_ok=True)
+# Under /tmp by default so Zeabur ephemeral FS is fine; SESSION_STORE_ROOT on a shared
+# volume lets several workers / replicas serve the same sessions
+SESSION_DIR = SESSION_STORE_ROOT / "v2-sessions"  # folder sessions (and legacy uploads)
+SESSION_DIR.mkdir(parents=True, exist_ok=True)
+# Content-addressed uploads shared between sessions (see session_data.store_upload)
+BLOB_DIR = SESSION_STORE_ROOT / "v2-blobs"
+BLOB_DIR.mkdir(parents=True, exist_ok=True)
+UPLOAD_SUFFIXES = (".csv", ".xlsx", ".xls")
+
+# Session records (blob + sheet view), read on every request so all processes agree
+session_store = create_session_store(SESSION_BACKEND, SESSION_STORE_ROOT, SESSION_SQLITE_JOURNAL_MODE)
+
+# Chart results by result_id, for /api/downsample on whichever worker gets the request
+chart_results = ChartResultStore(SESSION_STORE_ROOT / "v2-results", ttl=SANDBOX_RESULT_CACHE_TTL,
+                                 max_bytes=SANDBOX_RESULT_STORE_MAX_BYTES)
+
+# Background GC of sessions and blobs (started/stopped by main.py); one process sweeps at a time
+session_janitor = SessionJanitor(
+    session_store,
+    max_age=SESSION_MAX_AGE,
+    max_session_bytes=SESSION_MAX_BYTES,
+    quota_bytes=SESSION_QUOTA_BYTES,
+    low_water=SESSION_QUOTA_LOW_WATER,
+    min_idle=SESSION_MIN_IDLE,
+    interval=SESSION_GC_INTERVAL,
+    blob_root=BLOB_DIR,
+    lock_path=SESSION_STORE_ROOT / "v2-gc.lock",
+    on_evict=forget_session,
+    results=chart_results,
+)
+
+# Parsed chart configs of successful sandbox runs, keyed by (normalized code, data hash);
+# full-resolution, so bounded by size (that of the JSON the code printed) as well as count.
+# A front for chart_results, which every worker shares
+sandbox_results = TTLCache(maxsize=SANDBOX_RESULT_CACHE_SIZE, ttl=SANDBOX_RESULT_CACHE_TTL,
+                           max_bytes=SANDBOX_RESULT_CACHE_MAX_BYTES)
+# Prompt data contexts; the key includes the data hash, so new data never sees a stale one
+data_contexts = TTLCache(maxsize=DATA_CONTEXT_CACHE_SIZE, ttl=SESSION_MAX_AGE)
 
 
 def session_path(session_id: str) -> Path:
@@ -41,6 +102,11 @@ class ColumnInfo(BaseModel):
     null_count: int
     unique_count: int
     sample_values: list  # first few distinct values
+    min_value: float | None = None         # numeric columns only
+    max_value: float | None = None
+    datetime_parseable: bool = False       # datetime dtype, or text that parses as dates
+    datetime_min: str | None = None
+    datetime_max: str | None = None
 
 
 class UploadResponse(BaseModel):
@@ -49,6 +115,15 @@ class UploadResponse(BaseModel):
     row_count: int
     columns: list[ColumnInfo]
     preview_rows: list[dict]   # first 50 rows as plain dicts
+    sheets: list[str] = []         # Excel uploads: every sheet, in workbook order
+    sheet: str | None = None       # the sheet the data comes from
+    cell_range: str | None = None  # the cell range read, e.g. "B2:H500" (None = whole sheet)
+
+
+class SheetRequest(BaseModel):
+    session_id: str
+    sheet: str
+    cell_range: str | None = None  # A1 notation; its first row is the header
 
 
 class ConversationTurn(BaseModel):
@@ -63,84 +138,71 @@ class GenerateRequest(BaseModel):
     prompt: str
     chart_type: str
     history: list[ConversationTurn] = []
+    viewport_width: int | None = None  # chart width in CSS pixels, sets the point budget
+    # None: downsample ("lttb") only if viewport_width is sent, else full data
+    downsample: Literal["lttb", "minmax", "none"] | None = None
+    # Opt-in racing: this many Gemini streams per attempt, first valid chart wins
+    candidates: int = Field(1, ge=1, le=GENERATE_MAX_CANDIDATES)
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
-def _read_file(path: Path) -> pd.DataFrame:
+def _read_file(path: Path, sheet: str | None = None,
+               cell_range: CellRange | None = None) -> pd.DataFrame:
+    """Parse an upload; sheet and cell_range select what to read from an Excel file."""
     suffix = path.suffix.lower()
     if suffix == ".csv":
-        # Try common encodings
-        for enc in ("utf-8", "utf-8-sig", "big5", "gbk"):
+        # Detect from a byte sample, then parse once; only a decode error further
+        # into the file (sample not representative) falls back to the other codecs
+        guess = detect_encoding(path)
+        # pandas' C reader strips a UTF-8 BOM itself and its plain utf-8 path is faster
+        first = "utf-8" if guess.encoding == "utf-8-sig" else guess.encoding
+        fallbacks = [enc for enc in CSV_ENCODINGS if enc != first]
+        for enc in (first, *fallbacks):
             try:
                 return pd.read_csv(path, encoding=enc)
-            except (UnicodeDecodeError, Exception):
+            except UnicodeDecodeError:
                 continue
         raise ValueError("Cannot decode CSV file")
     elif suffix in (".xlsx", ".xls"):
-        return pd.read_excel(path)
+        return read_excel(path, sheet, cell_range)
     else:
         raise ValueError(f"Unsupported file type: {suffix}")
 
 
-def _build_column_info(df: pd.DataFrame) -> list[ColumnInfo]:
-    cols = []
-    for col in df.columns:
-        series = df[col]
-        sample = series.dropna().unique()[:5].tolist()
-        # Make JSON-serialisable
-        sample = [str(v) if not isinstance(v, (int, float, bool)) else v for v in sample]
-        cols.append(ColumnInfo(
-            name=col,
-            dtype=str(series.dtype),
-            null_count=int(series.isna().sum()),
-            unique_count=int(series.nunique()),
-            sample_values=sample,
-        ))
-    return cols
-
-
-def _df_to_records(df: pd.DataFrame) -> list[dict]:
-    """Convert DataFrame to JSON-serialisable list of dicts."""
-    records = []
-    for row in df.to_dict(orient="records"):
-        clean = {}
-        for k, v in row.items():
-            if isinstance(v, pd.Timestamp):
-                clean[k] = None if pd.isna(v) else v.isoformat()
-            elif isinstance(v, float) and pd.isna(v):
-                clean[k] = None
-            elif not isinstance(v, (list, dict)) and pd.isna(v):
-                clean[k] = None
-            elif hasattr(v, "item"):          # numpy scalar
-                clean[k] = v.item()
-            else:
-                clean[k] = v
-        records.append(clean)
-    return records
-
-
-def _build_data_context(session_id: str, df: pd.DataFrame, filename: str) -> str:
-    """Build the data context string sent to the AI."""
-    file_path = str(session_path(session_id) / filename)
-    col_lines = []
-    for col in df.columns:
-        s = df[col]
-        sample = s.dropna().unique()[:5].tolist()
-        sample_str = ", ".join(repr(v) for v in sample)
-        col_lines.append(
-            f"  - {col!r}: dtype={s.dtype}, nulls={s.isna().sum()}, "
-            f"unique={s.nunique()}, samples=[{sample_str}]"
-        )
-    preview_json = json.dumps(_df_to_records(df.head(50)), ensure_ascii=False, indent=2)
-    return (
-        f"檔案路徑: {file_path}\n"
-        f"總行數: {len(df)}\n"
-        f"欄位資訊:\n" + "\n".join(col_lines) + "\n\n"
-        f"前 {min(50, len(df))} 筆資料預覽:\n{preview_json}"
-    )
+def _build_column_info(profile: DataProfile) -> list[ColumnInfo]:
+    return [ColumnInfo(**col.model_dump(exclude={"sample_reprs", "is_numeric"}))
+            for col in profile.columns]
+
 
+def _build_data_context(data_file: Path, df: pd.DataFrame, profile: DataProfile,
+                        preloaded: bool = False, data_hash: str | None = None,
+                        budget_tokens: int = DATA_CONTEXT_TOKEN_BUDGET,
+                        selection: dict | None = None) -> str:
+    """Build the data context string sent to the AI (see data_context.py).
 
-def _build_system_prompt(data_context: str, chart_type: str, history: list[ConversationTurn]) -> str:
+    preloaded: the sandbox binds the session data as `df`, so no file path is given.
+    data_hash: content id of the data; when given, the context is memoized on it.
+    selection: the Excel sheet view the data comes from (see _select_sheet).
+    """
+    if preloaded:
+        source_line = "資料變數: df（已預先載入的 pandas DataFrame）\n"
+    else:
+        source_line = f"檔案路徑: {data_file}\n"
+        if selection:
+            source_line += f"工作表: {selection['sheet']!r}\n"
+            if selection["range"]:
+                source_line += f"儲存格範圍: {selection['range']}（第一列為標題）\n"
+    key = f"{data_hash}\0{source_line}\0{budget_tokens}" if data_hash else None
+    context = data_contexts.get(key) if key else None
+    if context is None:
+        context = build_data_context(source_line, df, profile, budget_tokens)
+        if key:
+            data_contexts.set(key, context)
+    return context
+
+
+def _build_system_prompt(data_context: str, chart_type: str, history: list[ConversationTurn],
+                         preloaded: bool = False) -> str:
     history_text = ""
     if history:
         parts = []
@@ -152,6 +214,11 @@ def _build_system_prompt(data_context: str, chart_type: str, history: list[Conve
                 parts.append(f"[AI]{code_block}")
         history_text = "\n\n前幾輪對話:\n" + "\n".join(parts) + "\n\n"
 
+    if preloaded:
+        data_rule = "直接使用已載入的變數 `df`（不要用 pd.read_csv / pd.read_excel 重新讀檔）"
+    else:
+        data_rule = "用 pandas 讀取上面的「檔案路徑」（不要 hard-code 其他路徑）"
+
     return f"""你是一位專業的數據視覺化工程師，專門使用 Highcharts 生成互動式圖表。
 
 你的任務：根據用戶需求，撰寫 Python 代碼讀取資料並輸出 Highcharts JSON 設定。
@@ -165,7 +232,7 @@ def _build_system_prompt(data_context: str, chart_type: str, history: list[Conve
 
 1. 輸出格式：先輸出一段 Python 代碼（用 ```python ... ``` 包住），再輸出一段說明文字。
 2. Python 代碼必須：
-   - 用 pandas 讀取上面的「檔案路徑」（不要 hard-code 其他路徑）
+   - {data_rule}
    - 將資料轉換為 Highcharts JSON 設定物件
    - 最後一行必須是 `print(json.dumps(result))` 且 result 是完整的 Highcharts options dict
    - import 只能用：pandas, json, datetime, re, math（不能用其他套件）
@@ -194,10 +261,15 @@ def _build_system_prompt(data_context: str, chart_type: str, history: list[Conve
 """
 
 
-async def _call_gemini_stream(prompt: str, system: str, api_key: str) -> AsyncIterator[str]:
-    """Call Gemini streaming API and yield text chunks."""
+async def _call_gemini_stream(prompt: str, system: str, api_key: str,
+                              priority: int = INTERACTIVE) -> AsyncIterator[str]:
+    """Call Gemini streaming API and yield text chunks.
+
+    The call holds an llm_limiter slot until the stream ends. A 429/503 before the
+    first chunk is retried after the limiter's backoff (Retry-After plus jitter).
+    """
     api_url = (
-        "https://generativelanguage.googleapis.com/v1beta/models/"
+        f"{gemini_api_base()}/v1beta/models/"
         f"{GEMINI_MODEL}:streamGenerateContent?alt=sse&key={api_key}"
     )
     payload = {
@@ -205,27 +277,50 @@ async def _call_gemini_stream(prompt: str, system: str, api_key: str) -> AsyncIt
         "contents": [{"role": "user", "parts": [{"text": prompt}]}],
         "generationConfig": {"responseMimeType": "text/plain"},
     }
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        async with client.stream("POST", api_url, json=payload) as response:
-            if not response.is_success:
-                body = await response.aread()
-                raise HTTPException(status_code=response.status_code,
-                                    detail=f"Gemini error: {body.decode()}")
-            async for line in response.aiter_lines():
-                if line.startswith("data: "):
-                    raw = line[6:].strip()
-                    if raw in ("", "[DONE]"):
-                        continue
-                    try:
-                        chunk = json.loads(raw)
-                        text = (chunk.get("candidates", [{}])[0]
-                                .get("content", {})
-                                .get("parts", [{}])[0]
-                                .get("text", ""))
-                        if text:
-                            yield text
-                    except (json.JSONDecodeError, IndexError, KeyError):
-                        continue
+    for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+        delay = None
+        try:
+            async with llm_limiter.slot(priority):
+                async with http_clients.gemini.stream("POST", api_url, json=payload) as response:
+                    if not response.is_success:
+                        upstream_errors.labels("gemini", error_kind(response.status_code)).inc()
+                        if (response.status_code in RETRYABLE_STATUSES
+                                and attempt < LLM_RATE_LIMIT_RETRIES):
+                            delay = llm_limiter.rate_limited(response.headers.get("Retry-After"),
+                                                             attempt)
+                        else:
+                            body = await response.aread()
+                            raise HTTPException(status_code=response.status_code,
+                                                detail=f"Gemini error: {body.decode()}")
+                    else:
+                        async for chunk in _iter_sse_text(response):
+                            yield chunk
+                        return
+        except httpx.HTTPError as e:
+            upstream_errors.labels("gemini", error_kind(e)).inc()
+            raise
+        # Slot released; wait out the backoff before queueing again
+        upstream_retries.labels("gemini").inc()
+        await asyncio.sleep(delay)
+
+
+async def _iter_sse_text(response: httpx.Response) -> AsyncIterator[str]:
+    """Text parts of a streamGenerateContent SSE response."""
+    async for line in response.aiter_lines():
+        if line.startswith("data: "):
+            raw = line[6:].strip()
+            if raw in ("", "[DONE]"):
+                continue
+            try:
+                chunk = json.loads(raw)
+                text = (chunk.get("candidates", [{}])[0]
+                        .get("content", {})
+                        .get("parts", [{}])[0]
+                        .get("text", ""))
+                if text:
+                    yield text
+            except (json.JSONDecodeError, IndexError, KeyError):
+                continue
 
 
 def _extract_code(text: str) -> str | None:
@@ -234,6 +329,65 @@ def _extract_code(text: str) -> str | None:
     return match.group(1).strip() if match else None
 
 
+class CodeBlockScanner:
+    """Incremental _extract_code over a token stream: reports the first ```python
+    block as soon as its closing fence arrives, while the rest keeps streaming."""
+
+    def __init__(self):
+        self.text = ""
+        self.code: str | None = None
+
+    def feed(self, chunk: str) -> str | None:
+        """Append a chunk; return the code block the first time it is complete."""
+        self.text += chunk
+        # A block can only complete on a chunk carrying (part of) its closing fence
+        if self.code is not None or "`" not in chunk:
+            return None
+        self.code = _extract_code(self.text)
+        return self.code
+
+
+class _Candidate:
+    """One Gemini stream of a generate attempt and the run of its code block."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.scanner = CodeBlockScanner()
+        self.pump: asyncio.Task | None = None
+        self.run: asyncio.Task | None = None
+        self.sandbox = SandboxHandle()  # kills the code's process when the candidate is dropped
+        self.stream_open = True
+        self.failure: tuple[str, str] | None = None  # (error, retry reason)
+
+    def stop(self) -> None:
+        """Stop the stream and the sandbox run; cancelling the run task alone would leave
+        its process running (and holding a pool worker) until SANDBOX_TIMEOUT."""
+        self.pump.cancel()
+        self.sandbox.cancel()
+        if self.run is not None and not self.run.done():
+            self.run.cancel()
+
+
+class FanOutLimiter:
+    """Caps the extra candidate streams (beyond each request's first) in flight across
+    all requests; under load, requests for more candidates degrade to fewer."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+
+    def acquire(self, wanted: int) -> int:
+        granted = max(min(wanted, self.limit - self.in_flight), 0)
+        self.in_flight += granted
+        return granted
+
+    def release(self, granted: int) -> None:
+        self.in_flight -= granted
+
+
+fan_out_limiter = FanOutLimiter(GENERATE_MAX_EXTRA_CANDIDATES)
+
+
 _ALLOWED_IMPORTS = {"pandas", "pd", "json", "datetime", "re", "math", "numpy", "np"}
 _FORBIDDEN_BUILTINS = {"eval", "exec", "compile", "__import__", "open",
                        "globals", "locals", "vars", "getattr", "setattr", "delattr"}
@@ -241,6 +395,27 @@ _FORBIDDEN_MODULES  = {"os", "sys", "subprocess", "socket", "urllib",
                        "requests", "http", "ftplib", "smtplib", "shutil"}
 
 
+# Self-correction hints for sandbox resource limits, by SandboxLimitExceeded.limit
+_LIMIT_HINTS = {
+    "memory": ("代碼超出記憶體上限（{value}）。請先彙總或篩選資料（groupby、resample、只取需要的欄位），"
+               "避免 cross join、explode 或把資料展開成大量列之後才畫圖"),
+    "cpu": "代碼超出 CPU 時間上限（{value}）。請改用 pandas 向量化運算，避免逐列迴圈（iterrows/apply）與重複計算",
+    "output": ("輸出超過上限（{value}）。只 print 最後的 json.dumps(result)，"
+               "並先彙總或抽樣，減少 series 的資料點數"),
+    "open_files": "代碼開啟過多檔案（上限 {value}）。不要重複讀取檔案，直接使用已載入的資料",
+}
+
+
+def _limit_error(e: SandboxLimitExceeded) -> str:
+    if e.limit in ("memory", "output"):
+        value = f"{e.value // (1024 * 1024)} MB"
+    elif e.limit == "cpu":
+        value = f"{e.value} 秒"
+    else:
+        value = f"{e.value} 個"
+    return _LIMIT_HINTS.get(e.limit, "代碼超出沙盒資源上限（{value}）").format(value=value)
+
+
 def _validate_code_ast(code: str) -> tuple[bool, str]:
     """Return (is_safe, reason). Empty reason means safe."""
     try:
@@ -272,54 +447,194 @@ def _validate_code_ast(code: str) -> tuple[bool, str]:
     return True, ""
 
 
-def _run_sandbox(code: str, timeout: int = 30) -> tuple[str, str]:
-    """Execute Python code in a subprocess. Returns (stdout, stderr)."""
-    result = subprocess.run(
-        [sys.executable, "-c", code],
-        capture_output=True,
-        text=True,
-        timeout=timeout,
-        env={
-            **os.environ,
-            "PYTHONPATH": "",
-        },
-    )
-    return result.stdout, result.stderr
-
-
 def _sse(event: str, data: dict) -> str:
     return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
+def _result_key(code: str, data_hash: str, preloaded: bool) -> str:
+    """Key for sandbox_results. The code is normalized through the AST, so comments and
+    formatting differences do not matter; the data is identified by its content hash."""
+    try:
+        normalized = ast.unparse(ast.parse(code))
+    except (SyntaxError, ValueError):
+        normalized = code
+    mode = "df" if preloaded else "file"
+    return hashlib.sha256(f"{mode}\0{data_hash}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+def load_chart_result(result_id: str) -> dict | None:
+    """A generated chart's full config: this process's memo, else the shared store
+    (blocking: may read a file)."""
+    config = sandbox_results.get(result_id)
+    if config is None:
+        config = chart_results.get(result_id)
+        if config is not None:
+            sandbox_results.set(result_id, config, chart_results.size(result_id))
+    return config
+
+
+def _parse_chart_config(stdout: str) -> dict | None:
+    """Parse the Highcharts JSON printed by the sandboxed code (or the first {...} in it)."""
+    try:
+        return json.loads(stdout.strip())
+    except json.JSONDecodeError:
+        match = re.search(r"\{.*\}", stdout, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except json.JSONDecodeError:
+                pass
+    return None
+
+
+def _get_session(session_id: str) -> SessionMeta:
+    """The session's record (404 if unknown), marked as used."""
+    meta = session_store.get(session_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Session not found. Please upload a file first.")
+    session_store.touch(session_id)
+    return meta
+
+
+def _session_upload(session_id: str, meta: SessionMeta) -> tuple[Path, Path, str]:
+    """(data folder, uploaded file, content id) of a session's upload. The data folder
+    is the shared blob, or the session folder itself for sessions older than the blob store."""
+    data_dir = BLOB_DIR / meta.blob if meta.blob else session_path(session_id)
+    data_files = [p for p in data_dir.glob("data.*") if p.suffix.lower() in UPLOAD_SUFFIXES]
+    if not data_files:
+        raise HTTPException(status_code=404, detail="No data file in session")
+    data_file = data_files[0]
+    return data_dir, data_file, meta.blob or load_session_hash(data_dir, data_file)
+
+
+def _select_sheet(data_file: Path, sheet: str | None,
+                  cell_range: str | None) -> tuple[list[str], dict | None]:
+    """Validate a sheet / cell-range choice for an Excel upload.
+
+    Returns (sheet names, selection); the selection is None for the default view
+    (first sheet, whole used range), which lives in the upload's own data folder.
+    """
+    if data_file.suffix.lower() not in (".xlsx", ".xls"):
+        if sheet or cell_range:
+            raise HTTPException(status_code=400, detail="Sheet selection needs an Excel file")
+        return [], None
+    try:
+        sheets = excel_sheet_names(data_file)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Cannot read workbook: {e}")
+    if sheet is not None and sheet not in sheets:
+        raise HTTPException(status_code=400, detail=f"No sheet named {sheet!r}")
+    try:
+        bounds = parse_cell_range(cell_range) if cell_range else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    index = sheets.index(sheet) if sheet is not None else 0
+    if index == 0 and bounds is None:
+        return sheets, None
+    return sheets, {"index": index, "sheet": sheets[index],
+                    "range": str(bounds) if bounds else None}
+
+
+def _sheet_view(data_dir: Path, data_hash: str,
+                selection: dict | None) -> tuple[Path, Callable[[Path], pd.DataFrame], str]:
+    """(data folder, parser, content id) of a sheet view of an upload; each view is
+    converted to Feather once in its own folder and shared by every session using it."""
+    if selection is None:
+        return data_dir, _read_file, data_hash
+    key = str(selection["index"])
+    if selection["range"]:
+        key += "_" + selection["range"].replace(":", "-")
+    bounds = parse_cell_range(selection["range"]) if selection["range"] else None
+    return (sheet_view_dir(data_dir, key), partial(_read_file, sheet=selection["sheet"], cell_range=bounds),
+            f"{data_hash}:{key}")
+
+
+def _session_data(session_id: str, meta: SessionMeta
+                  ) -> tuple[Path, Path, str, Callable[[Path], pd.DataFrame], dict | None]:
+    """(data folder, uploaded file, content id, parser, sheet selection) of a session's
+    current data: the upload itself, or the sheet view picked for it."""
+    data_dir, data_file, data_hash = _session_upload(session_id, meta)
+    view_dir, parse, view_hash = _sheet_view(data_dir, data_hash, meta.sheet)
+    return view_dir, data_file, view_hash, parse, meta.sheet
+
+
+def _upload_response(session_id: str, data_file: Path, df: pd.DataFrame, profile: DataProfile,
+                     sheets: list[str], selection: dict | None) -> UploadResponse:
+    return UploadResponse(
+        session_id=session_id,
+        filename=data_file.name,
+        row_count=len(df),
+        columns=_build_column_info(profile),
+        preview_rows=df_to_records(df.head(50)),
+        sheets=sheets,
+        sheet=selection["sheet"] if selection else (sheets[0] if sheets else None),
+        cell_range=selection["range"] if selection else None,
+    )
+
+
 # ── Endpoints ─────────────────────────────────────────────────────────────────
 @router.post("/upload", response_model=UploadResponse)
-async def v2_upload(file: UploadFile = File(...)):
-    """Upload a CSV/Excel file, persist it for the session, return data context."""
+async def v2_upload(file: UploadFile = File(...), sheet: str | None = Form(None),
+                    cell_range: str | None = Form(None)):
+    """Upload a CSV/Excel file, persist it for the session, return data context.
+
+    For Excel, `sheet` (default: the first) and `cell_range` (e.g. "B2:H500", first
+    row = header) choose what is read; /select-sheet changes it later without re-uploading.
+    """
     suffix = Path(file.filename or "data.csv").suffix.lower()
-    if suffix not in (".csv", ".xlsx", ".xls"):
+    if suffix not in UPLOAD_SUFFIXES:
         raise HTTPException(status_code=400, detail="Only CSV and Excel files are supported")
 
-    session_id = str(uuid.uuid4())
-    ws = session_path(session_id)
-    ws.mkdir(parents=True, exist_ok=True)
-
-    filename = f"data{suffix}"
-    dest = ws / filename
-    content = await file.read()
-    dest.write_bytes(content)
+    # Stream to the blob store in chunks (never the whole file in memory)
+    try:
+        blob_id, blob, stored_bytes = await asyncio.to_thread(
+            store_upload, file.file, suffix, BLOB_DIR, UPLOAD_MAX_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    data_file = blob / f"data{suffix}"
 
+    # An identical earlier upload already has its Feather file and profile (per sheet view)
     try:
-        df = _read_file(dest)
+        sheets, selection = await asyncio.to_thread(_select_sheet, data_file, sheet, cell_range)
+        view_dir, parse, _ = _sheet_view(blob, blob_id, selection)
+        df = await asyncio.to_thread(load_session_df, view_dir, data_file, parse)
     except Exception as e:
+        if stored_bytes:
+            shutil.rmtree(blob, ignore_errors=True)
+        if isinstance(e, HTTPException):
+            raise
+        if isinstance(e, EmptyCellRange):
+            raise HTTPException(status_code=400, detail=str(e))
         raise HTTPException(status_code=422, detail=f"Cannot parse file: {e}")
+    profile = await asyncio.to_thread(load_session_profile, view_dir, df)
+
+    session_id = str(uuid.uuid4())
+    await asyncio.to_thread(session_store.create, session_id, blob_id, selection)
+    session_janitor.note_upload(dir_size(blob) if stored_bytes else 0)
+
+    return _upload_response(session_id, data_file, df, profile, sheets, selection)
 
-    return UploadResponse(
-        session_id=session_id,
-        filename=filename,
-        row_count=len(df),
-        columns=_build_column_info(df),
-        preview_rows=_df_to_records(df.head(50)),
-    )
+
+@router.post("/select-sheet", response_model=UploadResponse)
+async def v2_select_sheet(req: SheetRequest):
+    """Switch a session to another sheet / cell range of its Excel upload.
+
+    Each view is converted once and kept next to the upload, so switching back and
+    forth (or another session picking the same view) does not parse the workbook again.
+    """
+    meta = await asyncio.to_thread(_get_session, req.session_id)
+    data_dir, data_file, data_hash = _session_upload(req.session_id, meta)
+    sheets, selection = await asyncio.to_thread(_select_sheet, data_file, req.sheet, req.cell_range)
+    view_dir, parse, _ = _sheet_view(data_dir, data_hash, selection)
+    try:
+        df = await asyncio.to_thread(load_session_df, view_dir, data_file, parse)
+    except EmptyCellRange as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Cannot parse sheet: {e}")
+    profile = await asyncio.to_thread(load_session_profile, view_dir, df)
+    await asyncio.to_thread(session_store.set_sheet, req.session_id, selection)
+    return _upload_response(req.session_id, data_file, df, profile, sheets, selection)
 
 
 @router.post("/generate")
@@ -329,27 +644,97 @@ async def v2_generate(req: GenerateRequest):
     if not api_key:
         raise HTTPException(status_code=500, detail="GEMINI_API_KEY not configured")
 
-    ws = session_path(req.session_id)
-    if not ws.exists():
-        raise HTTPException(status_code=404, detail="Session not found. Please upload a file first.")
+    meta = await asyncio.to_thread(_get_session, req.session_id)
 
-    # Find the uploaded file
-    data_files = list(ws.glob("data.*"))
-    if not data_files:
-        raise HTTPException(status_code=404, detail="No data file in session")
-    data_file = data_files[0]
+    # Find the uploaded file (the columnar cache sits next to it as data.feather)
+    data_dir, data_file, data_hash, parse, selection = _session_data(req.session_id, meta)
 
+    # A cache miss reads Feather or re-parses the upload: keep it off the event loop
     try:
-        df = _read_file(data_file)
+        df = await asyncio.to_thread(load_session_df, data_dir, data_file, parse)
     except Exception as e:
         raise HTTPException(status_code=422, detail=f"Cannot read session file: {e}")
 
-    data_context = _build_data_context(req.session_id, df, data_file.name)
-    system_prompt = _build_system_prompt(data_context, req.chart_type, req.history)
+    profile = await asyncio.to_thread(load_session_profile, data_dir, df)
+    # Preload mode: sandboxed code gets `df` from the session's memory-mapped Feather file
+    feather = columnar_path(data_dir)
+    data_path = str(feather) if SANDBOX_PRELOAD_DF and feather.exists() else None
+    # A memo miss groups and renders the frame: keep that off the event loop too
+    data_context = await asyncio.to_thread(
+        _build_data_context, data_file, df, profile, preloaded=data_path is not None,
+        data_hash=data_hash, selection=selection)
+    system_prompt = _build_system_prompt(data_context, req.chart_type, req.history,
+                                         preloaded=data_path is not None)
 
     async def event_stream() -> AsyncIterator[bytes]:
         last_code: str = ""
         last_error: str = ""
+        # Per-stage durations, summed over attempts; sent as the `timings` event
+        # before the final done/error and exported at /metrics
+        timer = StageTimer("v2_generate")
+
+        def timings_event() -> bytes:
+            timer.finish()
+            return _sse("timings", {"stages_ms": timer.as_ms(), "attempts": attempt + 1}).encode()
+
+        async def run_code(code: str, handle: SandboxHandle) -> tuple[dict | None, str, str, str]:
+            """Validate, execute (memoized per code + session data) and parse one code block.
+
+            Returns (chart config, result key, error, retry reason); on success the
+            config is already downsampled for this client. Reason "fatal" ends the stream.
+            """
+            # ── AST safety check ────────────────────────────────────────────
+            with timer.stage("validate"):
+                is_safe, reason = _validate_code_ast(code)
+            if not is_safe:
+                return None, "", f"代碼包含不允許的操作：{reason}", "unsafe_code"
+
+            # ── Sandbox execution ───────────────────────────────────────────
+            result_key = _result_key(code, data_hash, data_path is not None)
+            chart_config = await asyncio.to_thread(load_chart_result, result_key)
+            if chart_config is None:
+                sandbox_timings: dict = {}
+                sandbox_start = time.perf_counter()
+                try:
+                    stdout, stderr = await asyncio.to_thread(
+                        run_sandbox, code, SANDBOX_TIMEOUT, data_path, sandbox_timings, handle)
+                except subprocess.TimeoutExpired:
+                    timer.record("sandbox", time.perf_counter() - sandbox_start)
+                    return None, result_key, f"代碼執行逾時（{SANDBOX_TIMEOUT} 秒）", "timeout"
+                except SandboxLimitExceeded as e:
+                    timer.record("sandbox", time.perf_counter() - sandbox_start)
+                    return None, result_key, _limit_error(e), f"{e.limit}_limit"
+                except SandboxCancelled:
+                    return None, result_key, "cancelled", "cancelled"
+                except Exception as e:
+                    return None, result_key, f"沙盒錯誤: {e}", "fatal"
+                sandbox_seconds = time.perf_counter() - sandbox_start
+                timer.record("sandbox", sandbox_seconds)
+                # Pooled runs split into handing the job to a warm worker and running it;
+                # a cold run is mostly interpreter start-up and is not split
+                if "exec" in sandbox_timings:
+                    timer.record("sandbox_exec", sandbox_timings["exec"])
+                    timer.record("sandbox_spawn", max(sandbox_seconds - sandbox_timings["exec"], 0.0))
+
+                if stderr and not stdout:
+                    return None, result_key, stderr, "runtime_error"
+
+                # ── Parse Highcharts JSON ───────────────────────────────────
+                with timer.stage("parse"):
+                    chart_config = _parse_chart_config(stdout)
+                if chart_config is None:
+                    return None, result_key, f"代碼未輸出有效 JSON:\n{stdout[:300]}", "invalid_json"
+                sandbox_results.set(result_key, chart_config, len(stdout))
+                await asyncio.to_thread(chart_results.put, result_key, chart_config)
+
+            # The memoized config stays full-resolution; each client gets it downsampled
+            # to its own viewport, and can re-fetch zoomed ranges via /api/downsample
+            mode = resolve_mode(req.downsample, req.viewport_width)
+            if mode != "none":
+                with timer.stage("downsample"):
+                    chart_config = await asyncio.to_thread(
+                        downsample_chart_config, chart_config, point_budget(req.viewport_width), mode)
+            return chart_config, result_key, "", ""
 
         yield _sse("thinking", {"text": "AI 正在分析資料結構..."}).encode()
         await asyncio.sleep(0)
@@ -375,74 +760,118 @@ async def v2_generate(req: GenerateRequest):
                     f"請分析錯誤原因並修正代碼。"
                 )
 
-            # ── Stream LLM response ─────────────────────────────────────────
-            full_text = ""
-            try:
-                async for chunk in _call_gemini_stream(user_msg, system_prompt, api_key):
-                    full_text += chunk
-                    yield _sse("token", {"text": chunk}).encode()
-            except Exception as e:
-                yield _sse("error", {"message": str(e)}).encode()
-                return
-
-            # ── Extract code block ──────────────────────────────────────────
-            code = _extract_code(full_text)
-            if not code:
-                last_code = ""
-                last_error = "AI 未生成可執行的 Python 代碼"
-                continue
-
-            # ── AST safety check ────────────────────────────────────────────
-            is_safe, reason = _validate_code_ast(code)
-            if not is_safe:
-                last_code = code
-                last_error = f"代碼包含不允許的操作：{reason}"
-                continue
-
-            # ── Sandbox execution ───────────────────────────────────────────
-            yield _sse("executing", {"text": "執行代碼中...", "code": code}).encode()
-            await asyncio.sleep(0)
-
+            # ── Stream LLM response(s); run each code block as soon as it closes ──
+            # Every candidate's Gemini stream is pumped into `events`, tagged with its
+            # index; when a candidate's ```python block is complete, validation +
+            # sandbox + parsing start in its own task, whose completion is posted to
+            # the same queue. The first valid chart is sent at once (while its
+            # explanation is still streaming) and the other candidates are cancelled.
+            # Only the first candidate's tokens are forwarded to the client.
+            fan_out = 1 + fan_out_limiter.acquire(req.candidates - 1)
+            events: asyncio.Queue = asyncio.Queue()
+            llm_start = time.perf_counter()
+
+            async def pump(queue: asyncio.Queue, index: int, message: str) -> None:
+                # Extra candidates are speculative: they queue behind interactive calls
+                priority = INTERACTIVE if index == 0 else BACKGROUND
+                try:
+                    async for chunk in _call_gemini_stream(message, system_prompt, api_key,
+                                                           priority):
+                        queue.put_nowait((index, "token", chunk))
+                    queue.put_nowait((index, "end", None))
+                except Exception as e:
+                    queue.put_nowait((index, "stream_error", e))
+
+            candidates = [_Candidate(i) for i in range(fan_out)]
+            for cand in candidates:
+                cand.pump = asyncio.create_task(pump(events, cand.index, user_msg))
+            winner: _Candidate | None = None
             try:
-                stdout, stderr = await asyncio.to_thread(_run_sandbox, code, SANDBOX_TIMEOUT)
-            except subprocess.TimeoutExpired:
-                last_code = code
-                last_error = f"代碼執行逾時（{SANDBOX_TIMEOUT} 秒）"
-                continue
-            except Exception as e:
-                yield _sse("error", {"message": f"沙盒錯誤: {e}"}).encode()
-                return
-
-            if stderr and not stdout:
-                last_code = code
-                last_error = stderr
-                continue
-
-            # ── Parse Highcharts JSON ───────────────────────────────────────
-            chart_config = None
-            try:
-                chart_config = json.loads(stdout.strip())
-            except json.JSONDecodeError:
-                match = re.search(r"\{.*\}", stdout, re.DOTALL)
-                if match:
-                    try:
-                        chart_config = json.loads(match.group(0))
-                    except json.JSONDecodeError:
-                        pass
-            if chart_config is None:
-                last_code = code
-                last_error = f"代碼未輸出有效 JSON:\n{stdout[:300]}"
+                while True:
+                    if winner is None and all(c.failure for c in candidates):
+                        break
+                    if winner is not None and not winner.stream_open:
+                        break
+                    index, kind, value = await events.get()
+                    cand = candidates[index]
+                    if cand.failure or (winner is not None and cand is not winner):
+                        continue  # late event from a dropped candidate
+
+                    if kind == "token":
+                        if index == 0:
+                            if not cand.scanner.text:
+                                timer.record("llm_ttft", time.perf_counter() - llm_start)
+                            yield _sse("token", {"text": value}).encode()
+                        code = cand.scanner.feed(value)
+                        if code:
+                            if index == 0:
+                                timer.record("llm_code_ready", time.perf_counter() - llm_start)
+                            yield _sse("executing", {"text": "執行代碼中...", "code": code,
+                                                     "candidate": index}).encode()
+                            cand.run = asyncio.create_task(run_code(code, cand.sandbox))
+                            cand.run.add_done_callback(
+                                lambda _, q=events, i=index: q.put_nowait((i, "ran", None)))
+                    elif kind == "ran":
+                        try:
+                            chart_config, result_key, error, reason = cand.run.result()
+                        except Exception as e:
+                            logger.exception("Candidate %d failed outside the sandbox", index)
+                            chart_config, error, reason = None, f"處理圖表時發生錯誤: {e}", "fatal"
+                        if chart_config is None:
+                            cand.failure = (error, reason)
+                            cand.stop()
+                            candidate_outcomes.labels("failed").inc()
+                            continue
+                        winner = cand
+                        candidate_outcomes.labels("won").inc()
+                        yield _sse("chart", {"config": chart_config, "code": cand.scanner.code,
+                                             "result_id": result_key, "candidate": index}).encode()
+                        for other in candidates:
+                            if other is not winner and not other.failure:
+                                other.failure = ("cancelled", "cancelled")
+                                other.stop()
+                                candidate_outcomes.labels("cancelled").inc()
+                    else:
+                        cand.stream_open = False
+                        if index == 0 or cand is winner:
+                            timer.record("llm_generation", time.perf_counter() - llm_start)
+                        if kind == "stream_error" and cand is winner:
+                            logger.warning("Gemini stream failed after the chart was sent: %s", value)
+                        elif kind == "stream_error":
+                            cand.failure = (str(value), "stream_error")
+                            cand.stop()
+                            candidate_outcomes.labels("failed").inc()
+                        elif cand.run is None:
+                            cand.failure = ("AI 未生成可執行的 Python 代碼", "no_code")
+                            candidate_outcomes.labels("failed").inc()
+            finally:
+                fan_out_limiter.release(fan_out - 1)
+                for cand in candidates:
+                    cand.stop()
+
+            if winner is None:
+                # Retry on the first code-related failure; if every candidate hit an
+                # upstream or sandbox error instead, report it and stop
+                retryable = [c for c in candidates if c.failure[1] not in ("stream_error", "fatal")]
+                if not retryable:
+                    yield timings_event()
+                    yield _sse("error", {"message": candidates[0].failure[0]}).encode()
+                    return
+                last_code = retryable[0].scanner.code or ""
+                last_error, reason = retryable[0].failure
+                generate_retries.labels(reason).inc()
                 continue
 
             # ── Success ─────────────────────────────────────────────────────
-            yield _sse("chart", {"config": chart_config, "code": code}).encode()
-            explanation = re.sub(r"```python.*?```", "", full_text, flags=re.DOTALL).strip()
+            explanation = re.sub(r"```python.*?```", "", winner.scanner.text, flags=re.DOTALL).strip()
             if explanation:
                 yield _sse("message", {"text": explanation}).encode()
+            yield timings_event()
             yield _sse("done", {}).encode()
             return
 
         # All retries exhausted
+        yield timings_event()
         yield _sse("error", {
             "message": f"自動修正失敗（已重試 {MAX_RETRIES} 次）\n最後錯誤：{last_error}"
         }).encode()